@@ -24,16 +24,12 @@
     :license: BSD, see LICENSE for more details.
 """
 from flask import Flask, jsonify, render_template
-from werkzeug.contrib.cache import SimpleCache
 from redis import Redis
 from redis.exceptions import ConnectionError
 
 app = Flask(__name__)
 app.config.from_object("config")
 
-# The cache object
-cache = SimpleCache(__name__)
-
 #-- Redis
 redis = Redis(
     host=app.config["REDIS_HOST"],
@@ -48,6 +44,11 @@ try:
 except ConnectionError:
     raise ConnectionError(" The Redis server is inactive. Activate it with the command `redis-server`.")
 
+# The cache object. See CACHE_BACKEND.
+from app.cachestore import make_cache
+
+cache = make_cache(redis)
+
 @app.route('/', methods = ['GET'])
 def home():
     return render_template("home.html")
@@ -105,6 +106,7 @@ from app.views import schedule
 from app.views import scores
 from app.views import standings
 from app.views import stats
+from app.views import status
 from app.views import teams
 app.register_blueprint(injuries.mod)
 app.register_blueprint(posts.mod)
@@ -114,4 +116,29 @@ app.register_blueprint(schedule.mod)
 app.register_blueprint(scores.mod)
 app.register_blueprint(standings.mod)
 app.register_blueprint(stats.mod)
+app.register_blueprint(status.mod)
 app.register_blueprint(teams.mod)
+
+#-- Parse offloading
+from app.offload import start_pool
+
+@app.before_first_request
+def start_parse_pool():
+    """
+    Starts the parsing processes. This runs before pre-warming starts
+    its threads, so the processes aren't forked with them running.
+    """
+    if app.config["PARSE_OFFLOAD"]:
+        start_pool()
+
+#-- Cache pre-warming
+from app.prewarm import start_prewarming
+
+@app.before_first_request
+def prewarm():
+    """
+    Starts pre-warming once the app is actually serving requests, which
+    keeps the reloader's parent process from scraping too.
+    """
+    if app.config["PREWARM_ENABLED"]:
+        start_prewarming()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Archive
+    ~~~~~~~
+
+    An optional on-disk archive of every page fetched from upstream.
+
+    Each page body is gzipped and stored once under the SHA-1 of its
+    contents, so a roster which hasn't changed in a month takes up the
+    space of a single file no matter how many times it was fetched. A
+    small append-only index maps each URL and its query string to the
+    hashes fetched for it, along with the time of each fetch and the
+    encoding of the body. Bodies are stored exactly as they arrived.
+
+    Every worker appends to the same index, and prune_archive.py
+    rewrites it from another process altogether, so the index is only
+    ever touched while holding an fcntl lock on INDEX_LOCK_FILE_NAME.
+    Each worker reads the index again whenever it changed on disk.
+
+    Unlike the cache, the archive survives restarts. With ARCHIVE_REPLAY
+    turned on, pages are read from the archive instead of from STATS,
+    which is handy for re-parsing everything after fixing a parser.
+
+    The archive is pruned from the command line with prune_archive.py.
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import gzip
+import fcntl
+from time import time
+from hashlib import sha1
+from threading import Lock
+
+INDEX_FILE_NAME = "index.log"
+INDEX_LOCK_FILE_NAME = "index.lock"
+OBJECTS_DIR_NAME = "objects"
+
+# The encoding of bodies indexed before encodings were recorded
+DEFAULT_ENCODING = "utf-8"
+
+def archive_key(url, params=None):
+    """
+    Builds the index key for a URL and its query string arguments.
+
+    Arguments are sorted so the key doesn't depend on dict ordering.
+    Arguments with the value None are dropped, just like requests does.
+
+    :returns: The index key
+    :rtype: str
+    """
+    args = sorted((k, v) for k, v in (params or {}).items() if v is not None)
+
+    if not args:
+        return url
+
+    return url + '?' + '&'.join(["%s=%s" % (k, v) for (k, v) in args])
+
+class Archive(object):
+    """
+    A content-addressed store of page bodies.
+
+    :param path: The directory which holds the archive
+    :type path: str
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        self._index = None
+        self._index_stamp = None
+
+    def store(self, url, params, body, encoding=None):
+        """
+        Archives a page body.
+
+        :param body: The raw bytes of the page, or its decoded text
+        :type body: str
+
+        :param encoding: The encoding of body, if it is raw bytes
+        :type encoding: str
+
+        :returns: The hash of the body
+        :rtype: str
+        """
+        if isinstance(body, unicode):
+            body = body.encode(DEFAULT_ENCODING)
+            encoding = DEFAULT_ENCODING
+
+        encoding = encoding or DEFAULT_ENCODING
+        digest = sha1(body).hexdigest()
+        object_path = self._object_path(digest)
+        key = archive_key(url, params)
+        fetched_at = int(time())
+
+        # prune() deletes bodies which aren't in the index, so the body
+        # and its line are written together
+        with self._locked(fcntl.LOCK_EX):
+            # Identical pages are only written once
+            if not os.path.exists(object_path):
+                self._write_object(object_path, body)
+
+            # The index is only read by load(), which picks this up
+            with open(self._index_path(), "a") as f:
+                f.write(_index_line(fetched_at, digest, encoding, key))
+
+        return digest
+
+    def load(self, url, params=None):
+        """
+        Returns the most recently archived body of a page.
+
+        :returns: The raw bytes of the body and their encoding, or None
+                  if the page was never archived
+        :rtype: tuple
+        """
+        with self._locked(fcntl.LOCK_SH):
+            entries = self._load_index().get(archive_key(url, params))
+
+        if not entries:
+            return None
+
+        _, digest, encoding = entries[-1]
+
+        try:
+            with gzip.open(self._object_path(digest), "rb") as f:
+                return f.read(), encoding
+        except IOError:
+            return None
+
+    def prune(self, max_age=None, max_size=None):
+        """
+        Removes old fetches from the index and deletes the page bodies
+        which are no longer referenced.
+
+        Fetches older than max_age are removed first. If the archive is
+        still larger than max_size, the oldest fetches are removed until
+        it is not.
+
+        :param max_age: The age in seconds beyond which fetches are removed
+        :type max_age: int
+
+        :param max_size: The most bytes the page bodies may take up
+        :type max_size: int
+
+        :returns: The number of fetches removed, the number of files
+                  deleted and the number of bytes freed
+        :rtype: tuple
+        """
+        # Workers keep appending while we're at it, so hold the lock until
+        # the new index is in place
+        with self._locked(fcntl.LOCK_EX):
+            # Flatten into (fetched_at, digest, encoding, key), oldest
+            # first
+            entries = sorted(
+                (fetched_at, digest, encoding, key)
+                for key, fetches in self._load_index().items()
+                for fetched_at, digest, encoding in fetches
+            )
+            entry_count = len(entries)
+
+            if max_age is not None:
+                oldest = time() - max_age
+                entries = [e for e in entries if e[0] >= oldest]
+
+            sizes = self._object_sizes()
+
+            if max_size is not None:
+                total = sum(sizes[digest] for digest in set(e[1] for e in entries) if digest in sizes)
+
+                # Drop the oldest fetches until the remaining bodies fit.
+                # A body shared by newer fetches is kept.
+                while entries and total > max_size:
+                    digest = entries.pop(0)[1]
+
+                    if digest in sizes and not any(e[1] == digest for e in entries):
+                        total -= sizes[digest]
+
+            referenced = set(e[1] for e in entries)
+            files_deleted = 0
+            bytes_freed = 0
+
+            for digest, size in sizes.items():
+                if digest not in referenced:
+                    os.remove(self._object_path(digest))
+                    files_deleted += 1
+                    bytes_freed += size
+
+            self._rewrite_index(entries)
+
+        return entry_count - len(entries), files_deleted, bytes_freed
+
+    def _locked(self, operation):
+        return _IndexLock(self, operation)
+
+    def _index_path(self):
+        return os.path.join(self.path, INDEX_FILE_NAME)
+
+    def _object_path(self, digest):
+        return os.path.join(self.path, OBJECTS_DIR_NAME, digest[:2], digest[2:] + ".gz")
+
+    def _write_object(self, object_path, body):
+        directory = os.path.dirname(object_path)
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another thread beat us to it
+                pass
+
+        # Write to a temporary file first so a half-written body is
+        # never mistaken for a complete one.
+        tmp_path = "%s.%d.tmp" % (object_path, os.getpid())
+
+        with gzip.open(tmp_path, "wb") as f:
+            f.write(body)
+
+        os.rename(tmp_path, object_path)
+
+    def _object_sizes(self):
+        rv = {}
+        objects_dir = os.path.join(self.path, OBJECTS_DIR_NAME)
+
+        for directory, _, file_names in os.walk(objects_dir):
+            for file_name in file_names:
+                if not file_name.endswith(".gz"):
+                    continue
+
+                digest = os.path.basename(directory) + file_name[:-3]
+                rv[digest] = os.path.getsize(os.path.join(directory, file_name))
+
+        return rv
+
+    def _load_index(self):
+        # Must be called while holding the lock. The index is read again
+        # whenever it changed, by this process or another. Appends within
+        # the same clock tick leave the mtime as it was, but not the size.
+        index_path = self._index_path()
+        stamp = _file_stamp(index_path)
+
+        if self._index is not None and stamp == self._index_stamp:
+            return self._index
+
+        self._index = {}
+        self._index_stamp = stamp
+
+        if stamp is None:
+            return self._index
+
+        with open(index_path) as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t', 3)
+
+                # Lines written before encodings were recorded
+                if 3 == len(fields):
+                    fields.insert(2, DEFAULT_ENCODING)
+
+                try:
+                    fetched_at, digest, encoding, key = fields
+                    fetched_at = int(fetched_at)
+                except ValueError:
+                    # A partially written line
+                    continue
+
+                self._index.setdefault(key, []).append((fetched_at, digest, encoding))
+
+        return self._index
+
+    def _rewrite_index(self, entries):
+        # Must be called while holding the lock
+        index_path = self._index_path()
+        tmp_path = "%s.%d.tmp" % (index_path, os.getpid())
+
+        self._index = {}
+
+        with open(tmp_path, "w") as f:
+            for fetched_at, digest, encoding, key in entries:
+                self._index.setdefault(key, []).append((fetched_at, digest, encoding))
+                f.write(_index_line(fetched_at, digest, encoding, key))
+
+        os.rename(tmp_path, index_path)
+        self._index_stamp = _file_stamp(index_path)
+
+class _IndexLock(object):
+    # Holds the archive's thread lock along with an fcntl lock on its lock
+    # file, which keeps other processes out. The index itself can't be
+    # locked, since prune() replaces it with a new file.
+    def __init__(self, archive, operation):
+        self.archive = archive
+        self.operation = operation
+        self._file = None
+
+    def __enter__(self):
+        self.archive._lock.acquire()
+
+        try:
+            if not os.path.isdir(self.archive.path):
+                os.makedirs(self.archive.path)
+
+            self._file = open(os.path.join(self.archive.path, INDEX_LOCK_FILE_NAME), "a")
+            fcntl.flock(self._file, self.operation)
+        except:
+            if self._file is not None:
+                self._file.close()
+
+            self.archive._lock.release()
+            raise
+
+    def __exit__(self, *exc_info):
+        # Closing the file releases the fcntl lock
+        self._file.close()
+        self.archive._lock.release()
+
+def _index_line(fetched_at, digest, encoding, key):
+    return "%d\t%s\t%s\t%s\n" % (fetched_at, digest, encoding, key)
+
+def _file_stamp(path):
+    # The mtime and size of a file, or None if there is no such file
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return st.st_mtime, st.st_size
@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Cache Store
+    ~~~~~~~~~~~
+
+    The backends behind fetch_cached_data() and cache_data().
+
+    A SimpleCache lives inside a single worker process, so with eight
+    workers every response is scraped from STATS up to eight times per
+    expiry. With CACHE_BACKEND set to "redis", every worker shares one
+    cache in the Redis server the application already talks to:
+
+    cache = make_cache()
+
+    Entries are stored as marshal data, which is smaller and much quicker
+    to read and write than pickles, and compressed with zlib once they
+    are CACHE_COMPRESS_MIN_BYTES or larger. marshal's format may change
+    between versions of Python, which is fine for workers running the
+    same interpreter. Anything marshal can't handle is pickled.
+
+    Even a shared cache costs a round trip to Redis and decoding the
+    entry on every hit. With CACHE_BACKEND set to "tiered", each worker
+    keeps the entries it used most recently in a small LRU of its own
+    (L1) in front of Redis (L2). An entry stays in L1 for at most
+    CACHE_L1_TIMEOUT seconds, and never longer than it has left in L2.
+    Whenever a worker stores or deletes an entry, it tells every other
+    worker to drop its copy over Redis pub/sub.
+
+    Hits and misses are counted by every worker and added up in Redis,
+    whichever backend is in use. See cache_stats().
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import zlib
+import marshal
+from uuid import uuid4
+from time import time, sleep
+from collections import OrderedDict
+from threading import Lock, Thread
+from werkzeug.contrib.cache import BaseCache, SimpleCache, RedisCache
+from redis.exceptions import RedisError
+from app import app
+
+# app.utils can't be imported here, since it needs the cache this module
+# builds. Log with app.logger instead of logcat().
+
+#-- Backends
+BACKEND_SIMPLE = "simple"
+BACKEND_REDIS = "redis"
+BACKEND_TIERED = "tiered"
+
+# The first byte of every entry, which says how the rest was encoded
+MARSHALLED = b'm'
+COMPRESSED = b'z'
+
+#-- Redis Keys
+# Holds the counters of every worker, added up
+REDIS_KEY_STATS = "cache_stats"
+
+# Where workers announce the keys they stored or deleted
+REDIS_CHANNEL_INVALIDATE = "cache_invalidate"
+
+# Announced instead of a key when the whole cache is cleared
+INVALIDATE_ALL = '*'
+
+# Counts which haven't been added to REDIS_KEY_STATS yet, and what this
+# worker has counted since it started
+_pending = {}
+_counts = {}
+_counts_lock = Lock()
+_last_flush = [time()]
+
+def make_cache(redis=None):
+    """
+    Returns the cache CACHE_BACKEND asks for.
+
+    :param redis: The Redis client to share the cache through
+    :type redis: redis.Redis
+
+    :returns: The cache
+    :rtype: werkzeug.contrib.cache.BaseCache
+    """
+    backend = app.config["CACHE_BACKEND"]
+
+    if backend in (BACKEND_REDIS, BACKEND_TIERED):
+        l2 = CompactRedisCache(
+            redis,
+            default_timeout=app.config["CACHE_TIMEOUT"],
+            key_prefix=app.config["CACHE_KEY_PREFIX"]
+        )
+
+        if BACKEND_REDIS == backend:
+            return l2
+
+        return TieredCache(l2, redis, app.config["CACHE_L1_SIZE"], app.config["CACHE_L1_TIMEOUT"])
+
+    if BACKEND_SIMPLE != backend:
+        raise ValueError("Unknown CACHE_BACKEND %r" % backend)
+
+    return SimpleCache(__name__)
+
+class CompactRedisCache(RedisCache):
+    """
+    A RedisCache which stores marshal data, compressed once it is large
+    enough, rather than pickles.
+    """
+    def dump_object(self, value):
+        """
+        Encodes an entry for Redis.
+
+        :rtype: str
+        """
+        try:
+            data = marshal.dumps(value, 2)
+        except ValueError:
+            # Not something marshal knows about, so pickle it
+            return RedisCache.dump_object(self, value)
+
+        if len(data) >= app.config["CACHE_COMPRESS_MIN_BYTES"]:
+            return COMPRESSED + zlib.compress(data, app.config["CACHE_COMPRESS_LEVEL"])
+
+        return MARSHALLED + data
+
+    def load_object(self, value):
+        """
+        Decodes an entry read from Redis. This may be called with None.
+        """
+        if value is None:
+            return None
+
+        if value.startswith(COMPRESSED):
+            return marshal.loads(zlib.decompress(value[1:]))
+
+        if value.startswith(MARSHALLED):
+            return marshal.loads(value[1:])
+
+        return RedisCache.load_object(self, value)
+
+class TieredCache(BaseCache):
+    """
+    A bounded LRU in this process (L1) in front of a CompactRedisCache
+    (L2).
+
+    Entries in L1 are handed to every caller as they are, so they must
+    not be changed. What goes into L1 is decoded from what was sent to
+    L2, so a caller who goes on to change what it stored changes neither.
+
+    :param l2: The shared cache
+    :type l2: CompactRedisCache
+
+    :param redis: The Redis client, for invalidations and statistics
+    :type redis: redis.Redis
+
+    :param size: The most entries to keep in L1
+    :type size: int
+
+    :param l1_timeout: The most seconds an entry is kept in L1
+    :type l1_timeout: int
+    """
+    def __init__(self, l2, redis, size, l1_timeout):
+        BaseCache.__init__(self, l2.default_timeout)
+        self.l2 = l2
+        self.redis = redis
+        self.size = size
+        self.l1_timeout = l1_timeout
+
+        # (value, expires_at) keyed by cache key, least recently used
+        # first
+        self._l1 = OrderedDict()
+        self._lock = Lock()
+
+        # Identifies the invalidations this process sent, so it doesn't
+        # drop what it just stored
+        self._token = uuid4().hex
+
+        # The process the subscriber thread was started in. A forked
+        # worker starts one of its own.
+        self._subscriber_pid = None
+
+    def get(self, key):
+        """
+        Returns an entry from L1 or, failing that, from L2.
+        """
+        self._subscribe()
+
+        with self._lock:
+            item = self._l1.pop(key, None)
+
+            if item is not None and time() < item[1]:
+                self._l1[key] = item
+
+                rv = item[0]
+            else:
+                rv = None
+
+        if rv is not None:
+            count("l1_hits", self.redis)
+
+            return rv
+
+        count("l1_misses", self.redis)
+
+        # Read the entry and how long L2 keeps it in a single round trip
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.get(self.l2.key_prefix + key)
+            pipe.pttl(self.l2.key_prefix + key)
+            data, ttl = pipe.execute()
+        except RedisError as e:
+            app.logger.debug("Unable to read %s from the cache: %s" % (key, e))
+            return None
+
+        rv = self.l2.load_object(data)
+
+        if rv is None:
+            count("l2_misses", self.redis)
+
+            return None
+
+        count("l2_hits", self.redis)
+
+        # No TTL means L2 keeps it forever
+        self._remember(key, rv, None if ttl is None or ttl < 0 else ttl / 1000.0)
+
+        return rv
+
+    def set(self, key, value, timeout=None):
+        """
+        Stores an entry in both tiers, and tells the other workers to
+        drop their copy.
+        """
+        if timeout is None:
+            timeout = self.default_timeout
+
+        data = self.l2.dump_object(value)
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.setex(self.l2.key_prefix + key, data, timeout)
+            self._invalidate(pipe, key)
+            pipe.execute()
+
+        # This worker can still serve it from L1
+        except RedisError as e:
+            app.logger.warning("Unable to write %s to the cache: %s" % (key, e))
+
+        self._remember(key, self.l2.load_object(data), timeout)
+
+    def delete(self, key):
+        """
+        Deletes an entry from both tiers, and from the L1 of every other
+        worker.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(self.l2.key_prefix + key)
+        self._invalidate(pipe, key)
+        pipe.execute()
+
+        with self._lock:
+            self._l1.pop(key, None)
+
+    def clear(self):
+        """
+        Empties both tiers, and the L1 of every other worker.
+        """
+        self.l2.clear()
+
+        pipe = self.redis.pipeline(transaction=False)
+        self._invalidate(pipe, INVALIDATE_ALL)
+        pipe.execute()
+
+        with self._lock:
+            self._l1.clear()
+
+    def _remember(self, key, value, ttl):
+        # An entry never outlives its copy in L2
+        ttl = self.l1_timeout if ttl is None else min(ttl, self.l1_timeout)
+
+        with self._lock:
+            self._l1.pop(key, None)
+            self._l1[key] = (value, time() + ttl)
+
+            while len(self._l1) > self.size:
+                self._l1.popitem(last=False)
+
+    def _invalidate(self, pipe, key):
+        pipe.publish(REDIS_CHANNEL_INVALIDATE, "%s %s" % (self._token, key))
+
+    def _subscribe(self):
+        if os.getpid() == self._subscriber_pid:
+            return
+
+        with self._lock:
+            if os.getpid() == self._subscriber_pid:
+                return
+
+            self._subscriber_pid = os.getpid()
+
+            # Whatever a parent process had in L1 is no longer kept up to
+            # date
+            self._l1.clear()
+
+        thread = Thread(target=self._listen)
+        thread.daemon = True
+        thread.start()
+
+    def _listen(self):
+        # Runs for the lifetime of the process. If the connection to
+        # Redis drops, L1 is emptied, since invalidations may have been
+        # missed, and the subscription starts over.
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                pubsub.subscribe(REDIS_CHANNEL_INVALIDATE)
+
+                for message in pubsub.listen():
+                    if "message" == message["type"]:
+                        self._drop(message["data"])
+
+            except RedisError as e:
+                app.logger.debug("Lost the cache invalidation channel: %s" % e)
+
+            with self._lock:
+                self._l1.clear()
+
+            sleep(1)
+
+    def _drop(self, message):
+        token, key = message.split(' ', 1)
+
+        if token == self._token:
+            return
+
+        with self._lock:
+            if INVALIDATE_ALL == key:
+                self._l1.clear()
+            else:
+                self._l1.pop(key, None)
+
+#-- Statistics
+def count(stat, redis=None):
+    """
+    Counts a cache lookup. Every CACHE_STATS_FLUSH_INTERVAL seconds the
+    counts are added to those of the other workers in Redis, in a single
+    round trip.
+
+    :param stat: "hits", "stale_hits" or "misses" of fetch_cached_data(),
+                 or "l1_hits", "l1_misses", "l2_hits" or "l2_misses" of
+                 a TieredCache
+    :type stat: str
+
+    :param redis: Where the counts of every worker are added up
+    :type redis: redis.Redis
+    """
+    with _counts_lock:
+        _counts[stat] = _counts.get(stat, 0) + 1
+        _pending[stat] = _pending.get(stat, 0) + 1
+
+        if redis is None or time() - _last_flush[0] < app.config["CACHE_STATS_FLUSH_INTERVAL"]:
+            return
+
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush[0] = time()
+
+    try:
+        pipe = redis.pipeline(transaction=False)
+
+        for stat, n in pending.items():
+            pipe.hincrby(REDIS_KEY_STATS, stat, n)
+
+        pipe.execute()
+
+    # Counts are nice to have. Put them back for the next try.
+    except RedisError:
+        with _counts_lock:
+            for stat, n in pending.items():
+                _pending[stat] = _pending.get(stat, 0) + n
+
+def cache_stats(redis=None):
+    """
+    Reports how often the cache was hit, with fresh or stale data, and
+    missed, both by this worker and by every worker together. With a
+    TieredCache, the hit rates of L1 and L2 are reported as well.
+
+    The counts of the other workers are as of their last flush, see
+    count().
+
+    :param redis: Where the counts of every worker are added up
+    :type redis: redis.Redis
+
+    :returns: A dictionary of statistics
+    :rtype: dict
+    """
+    with _counts_lock:
+        this_worker = dict(_counts)
+
+    rv = {
+        "backend" : app.config["CACHE_BACKEND"],
+        "this_worker" : _with_hit_rate(this_worker, pid=os.getpid())
+    }
+
+    if redis is not None:
+        try:
+            every_worker = dict((stat, int(n)) for (stat, n) in redis.hgetall(REDIS_KEY_STATS).items())
+        except RedisError:
+            every_worker = None
+
+        rv["every_worker"] = None if every_worker is None else _with_hit_rate(every_worker)
+
+    return rv
+
+def _with_hit_rate(counts, **extra):
+    rv = dict(counts, **extra)
+    rv["hit_rate"] = _hit_rate(counts.get("hits", 0) + counts.get("stale_hits", 0), counts.get("misses", 0))
+
+    for tier in ("l1", "l2"):
+        if tier + "_hits" in counts or tier + "_misses" in counts:
+            rv[tier + "_hit_rate"] = _hit_rate(counts.get(tier + "_hits", 0), counts.get(tier + "_misses", 0))
+
+    return rv
+
+def _hit_rate(hits, misses):
+    return round(float(hits) / (hits + misses), 4) if hits + misses else None
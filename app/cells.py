@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Cells
+    ~~~~~
+
+    Read-only accessors for the cells of a table row.
+
+    The parsers used to read every cell with
+
+    cells[1].extract().text.strip().encode("utf-8")
+
+    extract() pulls the cell out of the soup, which means patching up
+    the pointers of every element around it. None of the parsers need
+    the cell gone, they only need its text. These functions read the
+    text and leave the tree alone:
+
+    cell_text(cells[1])               # "Dustin Pedroia"
+    cell_int(cells[0])                # 15
+    cell_float(cells[3])              # 0.599
+    link_text(cells[0])               # "Boston"
+    gmt_time(cells[2])                # "23:05 GMT"
+
+    They work the same on a bs4 Tag and on a rows.Node. Strings are
+    returned UTF-8 encoded, just like the parsers always did.
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import re
+
+#-- CSS classes
+GMT_ZONE_CLASS = "shsGMTZone"
+
+def cell_text(cell, strip=True):
+    """
+    Returns the text of a cell.
+
+    :param cell: A <td>, or any other element
+    :type cell: bs4.element.Tag or rows.Node
+
+    :param strip: Whether to strip leading and trailing whitespace
+    :type strip: bool
+
+    :returns: The UTF-8 encoded text
+    :rtype: str
+    """
+    text = cell.text
+
+    return (text.strip() if strip else text).encode("utf-8")
+
+def cell_int(cell):
+    """
+    Returns the text of a cell as an int.
+
+    :raises ValueError: If the cell isn't a number
+    :rtype: int
+    """
+    return int(cell_text(cell))
+
+def cell_float(cell):
+    """
+    Returns the text of a cell as a float.
+
+    :raises ValueError: If the cell isn't a number
+    :rtype: float
+    """
+    return float(cell_text(cell))
+
+def link_text(cell, strip=True):
+    """
+    Returns the text of the first link in a cell.
+
+    :returns: The UTF-8 encoded text, or None if there is no link
+    :rtype: str
+    """
+    link = cell.find("a")
+
+    return None if link is None else cell_text(link, strip)
+
+def gmt_time(cell):
+    """
+    Returns the GMT time of a cell. STATS lists the time of a game in
+    many timezones, each in its own <span>.
+
+    :returns: The UTF-8 encoded time, e.g. "23:05 GMT", or None if the
+              cell has no time
+    :rtype: str
+    """
+    span = cell.find(name="span", attrs={"class" : GMT_ZONE_CLASS})
+
+    return None if span is None else cell_text(span, strip=False)
+
+#-- Converters
+# Shorthand for schema columns. See app/schema.py.
+_non_digit_re = re.compile(r"\D")
+
+def cell_raw_text(cell):
+    """
+    Returns the text of a cell without stripping it.
+
+    :rtype: str
+    """
+    return cell.text.encode("utf-8")
+
+def cell_text_or_none(cell):
+    """
+    Returns the stripped text of a cell, or None if it is empty.
+
+    :rtype: str
+    """
+    return cell_text(cell) or None
+
+def cell_digits(cell):
+    """
+    Returns the digits of a cell as an int, ignoring everything else.
+    "$1,250,000" becomes 1250000. A cell without digits is 0.
+
+    :rtype: int
+    """
+    return int(_non_digit_re.sub('', cell_raw_text(cell)) or 0)
+
+def cell_float_or_zero(cell):
+    """
+    Returns the text of a cell as a float, or 0 if it isn't a number,
+    such as the "-" STATS shows for the leader's games behind.
+
+    :rtype: float
+    """
+    try:
+        return cell_float(cell)
+    except ValueError:
+        return 0
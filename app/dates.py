@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Dates
+    ~~~~~
+
+    Turns the dates found at STATS and WordPress into UNIX timestamps.
+
+    dateutil can read almost any date, but it has to work out the format
+    of every string it is given, which is slow. Only a handful of formats
+    ever reach timestamp_from_string():
+
+    "Wed. 6 Mar 2026 18:35 GMT"       # Schedule, built from two cells
+    "Sat. 5 Oct 2026"                 # Schedule, before a time is set
+    "Tue 14 Apr 2026 7:05 PM"         # Schedule, local times
+    "5/15/2013"                       # Injuries
+    "2013-09-17T14:29:02-04:00"       # WordPress posts
+
+    Those are matched by a regular expression each. Anything else is
+    handed to dateutil.
+
+    The timestamps are exactly what dateutil and strftime("%s") return.
+    That means the timezone is ignored and the date is read as local
+    time, which is what the API has always done.
+
+    A schedule repeats the same few dates over and over, so timestamps
+    are remembered. The memo is emptied once it holds MEMO_SIZE dates.
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import re
+from calendar import month_abbr, month_name
+from datetime import datetime
+from time import mktime
+from dateutil.parser import parse
+
+# The most timestamps to remember
+MEMO_SIZE = 4096
+
+# Month names and abbreviations, as dateutil reads them
+MONTHS = dict(
+    [(name.lower(), i) for (i, name) in enumerate(month_abbr) if name] +
+    [(name.lower(), i) for (i, name) in enumerate(month_name) if name] +
+    [("sept", 9)]
+)
+
+# [Wed.] 6 Mar 2026 [18:35[:00] [PM]] [GMT]
+_day_month_year_re = re.compile(
+    r"^\s*(?:[A-Za-z]{3,9}\.?,?\s+)?(\d{1,2})\s+([A-Za-z]{3,9})\.?,?\s+(\d{4})"
+    r"(?:\s+(\d{1,2}):(\d{2})(?::(\d{2}))?(?:\s*([AaPp])\.?[Mm]\.?)?)?"
+    r"(?:\s+(GMT|UTC|Z))?\s*$",
+    re.IGNORECASE
+)
+
+# 5/15/2013
+_month_day_year_re = re.compile(r"^\s*(\d{1,2})/(\d{1,2})/(\d{4})\s*$")
+
+# 2013-09-17[T14:29[:02[.000]]][Z|-04:00]
+_iso_re = re.compile(
+    r"^\s*(\d{4})-(\d{2})-(\d{2})"
+    r"(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.\d+)?)?)?"
+    r"(Z|[+-]\d{2}:?\d{2})?\s*$"
+)
+
+_memo = {}
+
+def timestamp_from_string(date_string):
+    """
+    Returns a UNIX timestamp for a provided date string.
+
+    :param date_string: A date in any format dateutil can read
+    :type date_string: str
+
+    :returns: The timestamp as a string
+    :rtype: str
+    """
+    timestamp = _memo.get(date_string)
+
+    if timestamp is None:
+        timestamp = parse_timestamp(date_string)
+
+        if len(_memo) >= MEMO_SIZE:
+            _memo.clear()
+
+        _memo[date_string] = timestamp
+
+    return timestamp
+
+def parse_timestamp(date_string):
+    """
+    Returns a UNIX timestamp for a provided date string, without the
+    memo. The known formats are read directly and everything else by
+    dateutil.
+
+    :rtype: str
+    """
+    try:
+        timestamp = _parse_known(date_string)
+    except ValueError:
+        # Out of range values, such as 31 Feb. Let dateutil report them.
+        timestamp = None
+
+    if timestamp is None:
+        return parse(date_string).strftime("%s")
+
+    return timestamp
+
+def _parse_known(date_string):
+    match = _day_month_year_re.match(date_string)
+
+    if match is not None:
+        day, month, year, hour, minute, second, meridiem, zone = match.groups()
+        month = MONTHS.get(month.lower())
+
+        if month is None:
+            return None
+
+        hour = 0 if hour is None else int(hour)
+
+        if meridiem is not None:
+            if hour > 12:
+                return None
+
+            hour = hour % 12 + (12 if meridiem in "Pp" else 0)
+
+        return _local_timestamp(
+            int(year), month, int(day), hour, int(minute or 0), int(second or 0),
+            aware=zone is not None
+        )
+
+    match = _month_day_year_re.match(date_string)
+
+    if match is not None:
+        month, day, year = match.groups()
+
+        return _local_timestamp(int(year), int(month), int(day), 0, 0, 0, aware=False)
+
+    match = _iso_re.match(date_string)
+
+    if match is not None:
+        year, month, day, hour, minute, second, zone = match.groups()
+
+        return _local_timestamp(
+            int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+            aware=zone is not None
+        )
+
+    return None
+
+def _local_timestamp(year, month, day, hour, minute, second, aware):
+    # strftime("%s") hands the fields to mktime() as local time. A date
+    # with a timezone is marked as not being daylight saving time, since
+    # that is what dateutil's timezones report, while a date without one
+    # leaves mktime() to work it out.
+    fields = datetime(year, month, day, hour, minute, second).timetuple()
+
+    if aware:
+        fields = fields[:8] + (0,)
+
+    return "%d" % mktime(fields)
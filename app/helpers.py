@@ -18,14 +18,24 @@
     :license: BSD, see LICENSE for more details.
 """
 from re import sub
-import requests
 from flask.json import dumps, loads
 from ast import literal_eval
 from random import randint
+from collections import OrderedDict
+from threading import Lock
+from timeit import default_timer
 from datetime import date, datetime, timedelta
-from bs4 import BeautifulSoup, SoupStrainer
+from urlparse import urlparse
+from posixpath import basename
+from bs4 import BeautifulSoup, SoupStrainer, FeatureNotFound
+from bs4.builder import builder_registry
 from app import app, redis
-from app.utils import logcat, slugify, query_string_arg_to_bool, fetch_cached_data, cache_data, prepare_json_output
+from app.upstream import fetch_page
+from app.rows import iter_rows, parse_tables
+from app.slicer import SliceScanner, slice_markup
+from app.offload import run_parser, record
+from app.cells import cell_text, cell_raw_text
+from app.utils import logcat, slugify, query_string_arg_to_bool, fetch_cached_data, cache_data, build_cache_key, prepare_json_output
 
 #-- Tokens
 URL_TOKEN = "{{team}}"
@@ -35,6 +45,20 @@ TEAMS_URL = "http://stats.nesn.com/" + URL_TOKEN + "/teams.asp"
 #-- Query String Parameters
 PARAM_FLAT_LIST = "flat_list"
 
+#-- Parsers
+# Always available, since it ships with Python
+FALLBACK_PARSER_BACKEND = "html.parser"
+
+# Backends which failed to load. See help_make_soup().
+_missing_parser_backends = set()
+
+#-- Parse memo
+# Parsed results keyed by the digest of the page they were parsed from
+# and how they were parsed, oldest first. See help_parse_page().
+_parse_memo = OrderedDict()
+_parse_memo_lock = Lock()
+_parse_stats = {"revalidated": 0, "unchanged": 0, "parsed": 0}
+
 def scoreboard_display_rules():
     """
     Defines display rules for NESN's main scoreboard.
@@ -85,15 +109,65 @@ def scoreboard_display_rules():
 
     return display_rules
 
-def teams_helper(sport=None):
+def scoreboard_ttl_rules():
+    """
+    Defines how many seconds each league's scoreboard is cached for,
+    depending on the day and the state of its games. See
+    scores.choose_scoreboard_ttl().
+
+    "live" is for a day with a game in progress and "upcoming" for
+    today, before the rest of the games have started. "final" is for
+    today once every game is over, which still allows for corrections.
+    "future" and "past" are for other days. A past day never changes.
+    "no_games" is for today, when nothing is scheduled. "unsettled" is
+    for a day we can't tell the state of, or a past day whose games
+    haven't all been played.
+    """
+    default = {
+        "live" : 30,
+        "upcoming" : 60 * 2,
+        "final" : 60 * 10,
+        "future" : 60 * 60,
+        "past" : 60 * 60 * 24 * 30,
+        "no_games" : 60 * 60 * 24,
+        "unsettled" : 60
+    }
+
+    ttl_rules = {
+        "mlb" : dict(default),
+        "nhl" : dict(default),
+
+        # Games are a week apart, and scheduled well ahead of time
+        "nfl" : dict(default, future=60 * 60 * 6),
+        "nba" : dict(default),
+
+        # Goals are few and far between
+        "mls" : dict(default, live=60),
+        "epl" : dict(default, live=60),
+    }
+
+    return ttl_rules
+
+def teams_helper(sport=None, from_cache=True):
     """
     Generic helper function to scrape scoring data from STATS's
     JavaScript file.
+
+    This is called by get_team_id() as well, from requests for other
+    resources, so the cache key names the resource itself.
+
+    :param sport: The sport, as STATS names it, e.g. "fb"
+    :type sport: str
+
+    :param from_cache: Whether a cached response will do. Only a scrape
+                       fills the look-up table in Redis.
+    :type from_cache: bool
     """
 
     flat_list = query_string_arg_to_bool(PARAM_FLAT_LIST)
 
-    rv = fetch_cached_data(args=PARAM_FLAT_LIST if flat_list else None)
+    cache_key = build_cache_key(sport=sport, params={PARAM_FLAT_LIST : flat_list}, resource="teams")
+    rv = fetch_cached_data(cache_key) if from_cache else None
 
     if rv is not None:
         return rv
@@ -136,8 +210,55 @@ def teams_helper(sport=None):
         "Houston Texans"
     ]
 
-    soup = help_fetch_soup(url=TEAMS_URL.replace(URL_TOKEN, sport))
+    stack, redis_stack = help_fetch_parsed(
+        TEAMS_URL.replace(URL_TOKEN, sport),
+        parser_func=parse_teams_soup,
+        parser_args=(flat_list,)
+    )
+
+    out = prepare_json_output(stack)
+    del stack
+
+    redis_key = app.config["REDIS_KEY_TEAMS"].replace(
+        app.config["REDIS_KEY_TOKEN_SPORT"],
+        "nfl" if "fb" == sport else sport
+    )
 
+    if not redis.exists(redis_key):
+        if "fb" == sport:
+            redis_stack = nfl_teams
+
+        # Convert the object to a JSON string
+        redis.set(
+            name=redis_key,
+            value=dumps(prepare_json_output(redis_stack))
+        )
+
+    del redis_key, redis_stack
+
+    cache_data(
+        data=out,
+        cache_key=cache_key,
+        timeout=60 * 60 * 24 * 300    # Cache for 300 days
+    )
+
+    return out
+
+def parse_teams_soup(soup, flat_list=False):
+    """
+    Walks the tables of a teams page and groups the teams by league and
+    division.
+
+    :param soup: The teams tables
+    :type soup: bs4.BeautifulSoup or rows.Node
+
+    :param flat_list: Whether to skip the grouping
+    :type flat_list: bool
+
+    :returns: The teams, grouped unless flat_list is set, and a flat
+              list of every team in the order STATS numbers them
+    :rtype: tuple
+    """
     stack = []
     redis_stack = []
     league_stack = []
@@ -185,7 +306,7 @@ def teams_helper(sport=None):
 
             # Team Row
             else:
-                team = cells[0].extract().text.strip().encode("utf-8")
+                team = cell_text(cells[0])
 
                 # Save the team as a flat list for persistent storage
                 redis_stack.append(team)
@@ -205,33 +326,9 @@ def teams_helper(sport=None):
 
                 league_stack = []
 
-    out = prepare_json_output(stack)
-    del soup, division_stack, league_stack, stack
-
-    redis_key = app.config["REDIS_KEY_TEAMS"].replace(
-        app.config["REDIS_KEY_TOKEN_SPORT"],
-        "nfl" if "fb" == sport else sport
-    )
+    del division_stack, league_stack
 
-    if not redis.exists(redis_key):
-        if "fb" == sport:
-            redis_stack = nfl_teams
-
-        # Convert the object to a JSON string
-        redis.set(
-            name=redis_key,
-            value=dumps(prepare_json_output(redis_stack))
-        )
-
-    del redis_key, redis_stack
-
-    cache_data(
-        data=out,
-        args=PARAM_FLAT_LIST if flat_list else None,
-        timeout=60 * 60 * 24 * 300    # Cache for 300 days
-    )
-
-    return out
+    return stack, redis_stack
 
 def get_team_id(sport, team):
     redis_key = app.config["REDIS_KEY_TEAMS"].replace(
@@ -242,7 +339,7 @@ def get_team_id(sport, team):
     # First, check if the redis key exists and if it doesn't, recreate
     #
     if not redis.exists(redis_key):
-        teams_helper(sport)
+        teams_helper(sport, from_cache=False)
 
     # If we can't find it now, then something is definitely wrong.
     teams = redis.get(redis_key)
@@ -286,8 +383,37 @@ def format_height(height):
 
     return None
 
+def cell_height(cell):
+    """
+    Returns the height in a cell, such as "6-3", in inches.
+
+    :rtype: int
+    """
+    return format_height(cell_raw_text(cell))
+
+def cell_experience(cell):
+    """
+    Returns the years of experience in a cell. Rookies are listed as "R".
+
+    :rtype: int
+    """
+    experience = cell_raw_text(cell)
+
+    return 0 if 'R' == experience else int(experience)
+
+def cell_bats_throws(cell):
+    """
+    Splits a cell such as "R/L" into the hand a player bats with and the
+    hand a player throws with.
+
+    :rtype: tuple
+    """
+    bats, throws = cell_text(cell).split('/')
+
+    return bats, throws
+
 def format_division(nav_str):
-    division = nav_str.extract().text.strip().lower().encode("utf-8")
+    division = nav_str.text.strip().lower().encode("utf-8")
     division = sub(r"(conference|divisi?on|league|football)\s?", '', division)
     division = slugify(text=unicode(division, "utf-8"), delimiter=u'_')
 
@@ -315,25 +441,57 @@ def format_month_number_for_stats(month, pad_with_zero=False):
     # Pad with a zero if we have a single digit
     return format_int_for_stats(new_month) if pad_with_zero else new_month
 
-def help_fetch_soup(url, source_file_type="html", request_params=None, element=None, class_attrs=None):
+def help_fetch_soup(url, source_file_type="html", request_params=None, element=None, class_attrs=None, attrs=None):
     """
     Fetches the common markup shared among several things.
 
     :returns: A soup
     :rtype: bs4.BeautifulSoup
     """
-    r = requests.get(url, params=request_params)
+    scanner = page_scanner_for(url, source_file_type, element, class_attrs, attrs)
+    page, modified = fetch_page(url, params=request_params, until=scanner)
+    markup, source_file_type = help_page_markup(page, source_file_type, element, class_attrs, attrs)
+
+    # logcat(url)
+
+    return help_make_soup(
+        markup,
+        source_file_type=source_file_type,
+        element=element,
+        class_attrs=class_attrs,
+        attrs=attrs,
+        backend=parser_backend_for(url)
+    )
+
+def help_make_soup(text, source_file_type="html", element=None, class_attrs=None, attrs=None, backend=None):
+    """
+    Builds a soup out of the markup of a page fetched from STATS.
+
+    If the requested parser backend isn't installed, the soup is built
+    with Python's own html.parser instead.
 
-    # logcat(r.url)
+    :param text: The body of the page
+    :type text: unicode
 
+    :param attrs: Attributes of the element to keep. Overrides class_attrs
+    :type attrs: dict
+
+    :param backend: The parser BeautifulSoup should use, e.g. "lxml".
+                    Defaults to PARSER_BACKEND
+    :type backend: str
+
+    :returns: A soup
+    :rtype: bs4.BeautifulSoup
+    """
     # Strip unnecessary whitespace from the string before passing it to
     # BeautifulSoup. I don't know if this makes things easier, but we're
     # doing it anyway.
-    raw_string = sub(r"\s+", ' ', r.text)
+    raw_string = sub(r"\s+", ' ', text)
 
     element = "table" if element is None else element
     class_attrs = "shsTable shsBorderTable" if class_attrs is None else class_attrs
     # class_attrs = "shsTable" if class_attrs is None else class_attrs
+    backend = app.config["PARSER_BACKEND"] if backend is None else backend
 
     # Some date from STATS are stored in a malformed JavaScript file and
     # which contain docWrites(). The best method is to call this file
@@ -345,15 +503,357 @@ def help_fetch_soup(url, source_file_type="html", request_params=None, element=N
 
     # logcat(raw_string)
 
-    soup = BeautifulSoup(
-        raw_string,
-        from_encoding="utf-8",
-        parse_only=SoupStrainer(name=element, attrs={"class" : class_attrs})
-    )
+    if backend in _missing_parser_backends:
+        backend = FALLBACK_PARSER_BACKEND
+
+    attrs = {"class" : class_attrs} if attrs is None else attrs
+    strainer = SoupStrainer(name=element, attrs=attrs)
+
+    try:
+        soup = BeautifulSoup(raw_string, backend, from_encoding="utf-8", parse_only=strainer)
+    except FeatureNotFound:
+        logcat("The parser \"%s\" is not installed. Using \"%s\" instead." % (backend, FALLBACK_PARSER_BACKEND))
+        _missing_parser_backends.add(backend)
+
+        soup = BeautifulSoup(raw_string, FALLBACK_PARSER_BACKEND, from_encoding="utf-8", parse_only=strainer)
 
-    del r, raw_string
+    del raw_string
     return soup
 
+def help_fetch_tables(url, source_file_type="html", request_params=None, element=None, class_attrs=None, attrs=None):
+    """
+    Fetches the tables of a page for parsers which walk whole tables
+    rather than one row at a time.
+
+    When rows are streamed (see streams_rows()), the tables are read by
+    rows.parse_tables(), which skips BeautifulSoup. Otherwise, this is
+    the same as help_fetch_soup().
+
+    :returns: A soup, or a tree which is searched the same way
+    :rtype: bs4.BeautifulSoup or rows.Node
+    """
+    scanner = page_scanner_for(url, source_file_type, element, class_attrs, attrs)
+    page, modified = fetch_page(url, params=request_params, until=scanner)
+
+    return help_make_tables(page, url, source_file_type, element, class_attrs, attrs)
+
+def help_make_tables(page, url, source_file_type="html", element=None, class_attrs=None, attrs=None):
+    """
+    Builds the tables of a page fetched by fetch_page(). See
+    help_fetch_tables().
+
+    :returns: A soup, or a tree which is searched the same way
+    :rtype: bs4.BeautifulSoup or rows.Node
+    """
+    markup, source_file_type = help_page_markup(page, source_file_type, element, class_attrs, attrs)
+
+    return make_tables_from_markup(
+        markup,
+        parser_backend_for(url),
+        source_file_type=source_file_type,
+        element=element,
+        class_attrs=class_attrs,
+        attrs=attrs
+    )
+
+def make_tables_from_markup(markup, backend, **kwargs):
+    """
+    Builds the tables of some markup, with BeautifulSoup or, when rows
+    are streamed, with rows.parse_tables(). See streams_rows().
+
+    :param markup: The markup to parse
+    :type markup: unicode
+
+    :param backend: The parser BeautifulSoup should use
+    :type backend: str
+
+    :returns: A soup, or a tree which is searched the same way
+    :rtype: bs4.BeautifulSoup or rows.Node
+    """
+    if not streams_rows(backend):
+        return help_make_soup(markup, backend=backend, **kwargs)
+
+    return parse_tables(markup, **kwargs)
+
+def streams_rows(backend):
+    """
+    Whether pages meant for backend are read with app/rows.py rather
+    than BeautifulSoup. See STREAM_ROWS.
+
+    :param backend: The parser BeautifulSoup would use, e.g. "lxml"
+    :type backend: str
+
+    :rtype: bool
+    """
+    if app.config["STREAM_ROWS"] is not None:
+        return app.config["STREAM_ROWS"]
+
+    return backend in _missing_parser_backends or builder_registry.lookup(backend) is None
+
+def parse_tables_markup(markup, parser_func, parser_args, backend, soup_kwargs):
+    """
+    Builds the tables of some markup and parses them with parser_func.
+    This is the part of help_fetch_parsed() which may run in a worker
+    process, see app/offload.py.
+
+    :returns: Whatever parser_func returns
+    """
+    return parser_func(make_tables_from_markup(markup, backend, **soup_kwargs), *parser_args)
+
+def parse_rows_markup(markup, parser_func, parser_args, backend, soup_kwargs):
+    """
+    Parses each row of some markup with parser_func. This is the part of
+    help_fetch_rows() which may run in a worker process, see
+    app/offload.py.
+
+    :returns: A list of parsed rows
+    :rtype: list
+    """
+    if streams_rows(backend):
+        return help_parse_soup(iter_rows(markup, **soup_kwargs), parser_func, *parser_args)
+
+    return help_parse_soup(help_make_soup(markup, backend=backend, **soup_kwargs), parser_func, *parser_args)
+
+def help_fetch_parsed(url, parser_func, parser_args=(), request_params=None, **kwargs):
+    """
+    Fetches the tables of a page and parses them with parser_func, for
+    parsers which walk whole tables. The result is remembered by
+    help_parse_page(), so treat it as read only.
+
+    :param url: The URL to fetch
+    :type url: str
+
+    :param parser_func: A callback function. Must accept the tables
+                        returned by help_fetch_tables()
+    :type parser_func: function
+
+    :param parser_args: Extra arguments passed along to parser_func
+    :type parser_args: tuple
+
+    :param request_params: Query string arguments
+    :type request_params: dict
+
+    :returns: Whatever parser_func returns
+    """
+    page, modified = help_timed_fetch(url, request_params, kwargs)
+
+    def parse_page():
+        markup, soup_kwargs = help_timed_markup(page, kwargs)
+
+        return run_parser(parse_tables_markup, markup, parser_func, tuple(parser_args), parser_backend_for(url), soup_kwargs)
+
+    return help_parse_page(page, modified, parse_page, (url, parser_func, parser_args, kwargs))
+
+def help_parse_page(page, modified, parse, parsed_by):
+    """
+    Parses a page, unless the very same body was parsed the very same way
+    before.
+
+    STATS often sends back a page which is byte for byte the page it
+    sent last time, even without a 304. Results are remembered by the
+    digest of the page they were parsed from, plus how they were parsed,
+    so an unchanged page is never parsed twice. Up to PARSE_MEMO_SIZE
+    results are remembered, and the oldest are forgotten first.
+
+    :param page: A page returned by fetch_page()
+    :type page: upstream.Page
+
+    :param modified: Whether the page changed since the last fetch
+    :type modified: bool
+
+    :param parse: Parses the page when it has to be parsed
+    :type parse: function
+
+    :param parsed_by: The URL, the parser, its arguments and the keyword
+                      arguments of the fetch. The parser backend for the
+                      URL is what counts, not the URL itself.
+    :type parsed_by: tuple
+
+    :returns: Whatever parse returns. It may be shared with other
+              requests, so treat it as read only.
+    """
+    url, parser_func, parser_args, kwargs = parsed_by
+    parsed_key = (
+        parser_func,
+        tuple(parser_args),
+        parser_backend_for(url),
+        tuple(sorted((k, _freeze(v)) for (k, v) in kwargs.items()))
+    )
+
+    # A 304 hands back the very same page
+    if not modified and parsed_key in page.parsed:
+        _count_parse("revalidated")
+        return page.parsed[parsed_key]
+
+    memo_key = (page.digest, parsed_key)
+
+    with _parse_memo_lock:
+        rv = _parse_memo.pop(memo_key, None)
+
+        if rv is not None:
+            _parse_memo[memo_key] = rv
+
+    if rv is None:
+        _count_parse("parsed")
+        rv = parse()
+
+        with _parse_memo_lock:
+            _parse_memo[memo_key] = rv
+
+            while len(_parse_memo) > app.config["PARSE_MEMO_SIZE"]:
+                _parse_memo.popitem(last=False)
+    else:
+        _count_parse("unchanged")
+
+    page.parsed[parsed_key] = rv
+
+    return rv
+
+def _freeze(value):
+    # Dictionaries, such as attrs, can't be part of a key
+    return tuple(sorted(value.items())) if isinstance(value, dict) else value
+
+def _count_parse(stat):
+    with _parse_memo_lock:
+        _parse_stats[stat] += 1
+
+def parse_stats():
+    """
+    Reports how often parsing a page was avoided. "revalidated" pages
+    came back as 304 Not Modified, "unchanged" pages came back whole but
+    byte for byte the same, and "parsed" pages had to be parsed.
+
+    :returns: A dictionary of statistics
+    :rtype: dict
+    """
+    with _parse_memo_lock:
+        rv = dict(_parse_stats)
+        rv["remembered"] = len(_parse_memo)
+
+    return rv
+
+def help_page_markup(page, source_file_type="html", element=None, class_attrs=None, attrs=None):
+    """
+    Returns the markup of a page which should be handed to the parser.
+
+    With SLICE_PAGES turned on, that is only the elements the parser
+    will search, cut out of the raw page by slicer.slice_markup().
+    Otherwise, it is the whole page.
+
+    :param page: A page returned by fetch_page()
+    :type page: upstream.Page
+
+    :returns: The markup, and the source file type to parse it as. Sliced
+              markup is always plain HTML.
+    :rtype: tuple
+    """
+    if not app.config["SLICE_PAGES"]:
+        return page.text, source_file_type
+
+    markup = slice_markup(page.body, page.encoding, source_file_type, element, class_attrs, attrs)
+
+    return markup, "html"
+
+def page_scanner_for(url, source_file_type="html", element=None, class_attrs=None, attrs=None):
+    """
+    Returns a scanner which tells fetch_page() when the tables of a page
+    have arrived, so it can stop reading. Only pages listed in
+    STREAM_FETCH_PAGES, by file name, are cut short.
+
+    :param url: The URL of the page
+    :type url: str
+
+    :returns: A scanner, or None if the whole page should be read
+    :rtype: slicer.SliceScanner
+    """
+    end_marker = app.config["STREAM_FETCH_PAGES"].get(basename(urlparse(url).path))
+
+    # document.write() calls are only removed once the page is whole
+    if end_marker is None or "javascript" == source_file_type.lower():
+        return None
+
+    return SliceScanner(element, class_attrs, attrs, end_marker=end_marker)
+
+def parser_backend_for(url):
+    """
+    Returns the parser backend for a page at STATS.
+
+    Pages listed in PARSER_BACKENDS, by path, get their own backend.
+    Every other page gets PARSER_BACKEND.
+
+    :param url: The URL of the page
+    :type url: str
+
+    :returns: The name of the parser backend
+    :rtype: str
+    """
+    return app.config["PARSER_BACKENDS"].get(urlparse(url).path, app.config["PARSER_BACKEND"])
+
+def help_fetch_rows(url, parser_func, parser_args=(), request_params=None, **kwargs):
+    """
+    Fetches a page and parses each row of its table with parser_func.
+
+    This is shorthand for help_fetch_soup() followed by
+    help_parse_soup(). The difference is that when STATS answers 304 Not
+    Modified, or sends back the same page as before, the rows parsed
+    from it the last time are returned as is and no soup is built at
+    all. See help_parse_page(). Treat the returned list as read only, it
+    may be shared with other requests.
+
+    When rows are streamed (see streams_rows()), they are read straight
+    out of the page by rows.iter_rows() instead of from a soup.
+
+    :param url: The URL to fetch
+    :type url: str
+
+    :param parser_func: A callback function. Must accept a list of cells
+    :type parser_func: function
+
+    :param parser_args: Extra arguments passed along to parser_func
+    :type parser_args: tuple
+
+    :param request_params: Query string arguments
+    :type request_params: dict
+
+    :returns: A list of parsed rows from a table
+    :rtype: list
+    """
+    page, modified = help_timed_fetch(url, request_params, kwargs)
+
+    def parse_page():
+        markup, soup_kwargs = help_timed_markup(page, kwargs)
+
+        return run_parser(parse_rows_markup, markup, parser_func, tuple(parser_args), parser_backend_for(url), soup_kwargs)
+
+    return help_parse_page(page, modified, parse_page, (url, parser_func, parser_args, kwargs))
+
+def help_timed_fetch(url, request_params, kwargs):
+    """
+    Fetches a page for help_fetch_rows() or help_fetch_parsed(), and
+    records how long that took. See offload.offload_stats().
+
+    :returns: The page and whether it changed since the last fetch
+    :rtype: tuple
+    """
+    started = default_timer()
+    rv = fetch_page(url, params=request_params, until=page_scanner_for(url, **kwargs))
+    record("fetch", default_timer() - started)
+
+    return rv
+
+def help_timed_markup(page, kwargs):
+    """
+    Returns the markup of a page to parse, along with the keyword
+    arguments to parse it with, and records how long that took.
+
+    :rtype: tuple
+    """
+    started = default_timer()
+    markup, source_file_type = help_page_markup(page, **kwargs)
+    record("slice", default_timer() - started)
+
+    return markup, dict(kwargs, source_file_type=source_file_type)
+
 # http://stackoverflow.com/questions/803616/passing-functions-with-arguments-to-another-function-in-python#803632
 def help_parse_soup(soup, parser_func, *args):
     """
@@ -363,8 +863,9 @@ def help_parse_soup(soup, parser_func, *args):
     This function must only be called once. The callback function passed via
     the parameter "func" will be called once for each row in the table.
 
-    :param url: URL of the ranking
-    :type url: str
+    :param soup: A soup, or any iterable of rows such as the one returned
+                 by rows.iter_rows()
+    :type soup: bs4.BeautifulSoup
     :param parser_func: A callback function. Must accept a list of cells
     :type parser_func: str
     :returns: A list of parsed rows from a table
@@ -372,7 +873,11 @@ def help_parse_soup(soup, parser_func, *args):
     """
     stack = []
 
-    for row in soup("tr"):
+    # Soups, and the trees built by rows.parse_tables(), are searched
+    # by calling them
+    rows = soup("tr") if callable(soup) else soup
+
+    for row in rows:
         # Prevent raising an exception for trying to iterate over None
         if  row.get("class") is None:
             pass
@@ -389,16 +894,17 @@ def help_get_list_from_dropdown(url, attr_name):
     """Helper function which fetches a list of golf tours or tennis
     series. Returns a list of strings.
     """
-    r = requests.get(url)
-    raw_string = sub(r"\s+", ' ', r.text)
-
-    soup = BeautifulSoup(
-        raw_string,
-        from_encoding="utf-8",
-        parse_only=SoupStrainer(name="select", attrs={"name" : attr_name})
+    page, modified = fetch_page(url)
+    markup = help_page_markup(page, element="select", attrs={"name" : attr_name})[0]
+
+    soup = help_make_soup(
+        markup,
+        element="select",
+        attrs={"name" : attr_name},
+        backend=parser_backend_for(url)
     )
 
-    del r, raw_string
+    del page, markup
     stack = []
     for option in soup("option"):
         if option["value"]:
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Offload
+    ~~~~~~~
+
+    Runs CPU heavy parsing in a pool of worker processes.
+
+    Parsing a large page is pure Python and holds the GIL the whole
+    time, so every other request served by the same process stalls
+    until it's done. With PARSE_OFFLOAD turned on, pages of at least
+    PARSE_OFFLOAD_MIN_BYTES are parsed in a separate process instead:
+
+    rows = run_parser(parse_rows_markup, markup, parse_mlb_soup, (), "lxml", {})
+
+    Only the markup and the arguments go to the worker, and only the
+    parsed rows come back. Functions can't be pickled when they were
+    built at runtime, like the decoders of app/schema.py, so functions
+    from this application cross over by the name they are found under
+    in their module and are looked up again on the other side.
+
+    If a job can't be sent, the page is parsed in this process as usual.
+    A worker stops parsing a page once it has taken PARSE_OFFLOAD_TIMEOUT
+    seconds, and the request gives up on it by raising ParseTimeout. It
+    is never parsed again in this process, which would cost twice the
+    time and hold the GIL besides.
+
+    Every stage of a fetch is timed, whether or not its parse was
+    offloaded. See offload_stats().
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import sys
+import signal
+import cPickle
+from cStringIO import StringIO
+from types import FunctionType
+from threading import Lock
+from timeit import default_timer
+from multiprocessing import Pool, TimeoutError
+from app import app
+from app.utils import logcat
+
+_pool = None
+_pool_lock = Lock()
+
+# Where each function was found, as (module name, attribute name)
+_references = {}
+
+# Seconds spent and number of times, keyed by stage
+_timings = {}
+_timings_lock = Lock()
+
+# Seconds to wait past PARSE_OFFLOAD_TIMEOUT for a worker to report that
+# it gave up. A worker stuck in C code, like lxml's, can't give up until
+# it's back in Python.
+TIMEOUT_GRACE = 1
+
+class ParseTimeout(Exception):
+    """
+    Raised when parsing a page in a worker takes longer than
+    PARSE_OFFLOAD_TIMEOUT.
+    """
+
+def start_pool():
+    """
+    Starts the worker processes, so the first page to be offloaded
+    doesn't wait for them. Calling this more than once does nothing.
+    """
+    get_pool()
+
+def get_pool():
+    """
+    Returns the pool of worker processes, starting it on first use.
+
+    :rtype: multiprocessing.Pool
+    """
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = Pool(app.config["PARSE_OFFLOAD_PROCESSES"])
+
+    return _pool
+
+def should_offload(markup):
+    """
+    Returns whether markup is large enough to be parsed in a worker.
+
+    :param markup: What the parser would be handed
+    :type markup: unicode
+
+    :rtype: bool
+    """
+    if not app.config["PARSE_OFFLOAD"]:
+        return False
+
+    min_bytes = app.config["PARSE_OFFLOAD_MIN_BYTES"]
+
+    # A character takes up one to four bytes in UTF-8, so most pages are
+    # decided without encoding them
+    if len(markup) >= min_bytes:
+        return True
+
+    if len(markup) * 4 < min_bytes:
+        return False
+
+    return len(markup.encode("utf-8")) >= min_bytes
+
+def run_parser(func, markup, *args):
+    """
+    Calls func(markup, *args), in a worker process if the markup is
+    large enough, and returns the result.
+
+    :param func: A function defined in this application
+    :type func: function
+
+    :param markup: What is to be parsed
+    :type markup: unicode
+
+    :returns: Whatever func returns
+    """
+    if should_offload(markup):
+        return run(func, markup, *args)
+
+    return _run_here(func, (markup,) + args)
+
+def run(func, *args):
+    """
+    Calls func(*args) in a worker process and returns the result.
+
+    :param func: A function defined in this application
+    :type func: function
+
+    :returns: Whatever func returns
+
+    :raises ParseTimeout: if the worker took too long
+    """
+    try:
+        payload = _dumps((func, args))
+    except cPickle.PicklingError as e:
+        logcat("Unable to offload %s: %s" % (func.__name__, e))
+        return _run_here(func, args)
+
+    started = default_timer()
+    timeout = app.config["PARSE_OFFLOAD_TIMEOUT"]
+
+    try:
+        result, elapsed = get_pool().apply_async(_work, (payload, timeout)).get(timeout + TIMEOUT_GRACE)
+    except (ParseTimeout, TimeoutError):
+        logcat("Offloading %s timed out" % func.__name__)
+        record("offload_timeout", default_timer() - started)
+
+        raise ParseTimeout("Parsing took longer than %s seconds" % timeout)
+
+    round_trip = default_timer() - started
+    record("offloaded_parse", elapsed)
+    record("offload_overhead", round_trip - elapsed)
+
+    return _loads(result)
+
+def _run_here(func, args):
+    started = default_timer()
+    rv = func(*args)
+    record("parse", default_timer() - started)
+
+    return rv
+
+def _work(payload, timeout):
+    # Runs in the worker process. The result is pickled here, rather
+    # than by the pool, so functions in it are sent by name as well.
+    started = default_timer()
+
+    # Nobody waits for the result past the timeout, so don't keep the
+    # worker busy with it
+    signal.signal(signal.SIGALRM, _time_out)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        func, args = _loads(payload)
+        result = _dumps(func(*args))
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+    return result, default_timer() - started
+
+def _time_out(signum, frame):
+    raise ParseTimeout()
+
+#-- Pickling
+def reference(func):
+    """
+    Returns the name a function can be found under, or None if it isn't
+    defined in a module of this application.
+
+    :rtype: tuple
+    """
+    ref = _references.get(func)
+
+    if ref is not None:
+        return ref
+
+    # Decoders built by exec have no module of their own, so look for
+    # them in every module of the application
+    candidates = [func.__module__] if func.__module__ else []
+    candidates += sorted(name for name in sys.modules.keys() if name == "app" or name.startswith("app."))
+
+    for module_name in candidates:
+        module = sys.modules.get(module_name)
+
+        if module is None:
+            continue
+
+        for attr_name, value in vars(module).items():
+            if value is func:
+                ref = _references[func] = (module_name, attr_name)
+                return ref
+
+    return None
+
+def _persistent_id(obj):
+    if not isinstance(obj, FunctionType):
+        return None
+
+    ref = reference(obj)
+
+    if ref is None:
+        raise cPickle.PicklingError("%s isn't defined in a module" % obj.__name__)
+
+    return "%s:%s" % ref
+
+def _persistent_load(pid):
+    module_name, attr_name = pid.split(':')
+    __import__(module_name)
+
+    return getattr(sys.modules[module_name], attr_name)
+
+def _dumps(obj):
+    f = StringIO()
+    pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = _persistent_id
+    pickler.dump(obj)
+
+    return f.getvalue()
+
+def _loads(data):
+    unpickler = cPickle.Unpickler(StringIO(data))
+    unpickler.persistent_load = _persistent_load
+
+    return unpickler.load()
+
+#-- Timings
+def record(stage, seconds):
+    """
+    Adds the time taken by a stage of a fetch to offload_stats().
+
+    :param stage: "fetch", "slice", "parse", "offloaded_parse",
+                  "offload_overhead" or "offload_timeout"
+    :type stage: str
+
+    :param seconds: How long it took
+    :type seconds: float
+    """
+    with _timings_lock:
+        total, count = _timings.get(stage, (0.0, 0))
+        _timings[stage] = (total + seconds, count + 1)
+
+def offload_stats():
+    """
+    Reports how long each stage of a fetch takes on average, in
+    milliseconds, and how often it ran.
+
+    "parse" is parsing done in the process serving the request, and
+    holding the GIL while it's at it. "offloaded_parse" is parsing done
+    by a worker and "offload_overhead" is what sending the markup over
+    and the rows back costs on top of that. "offload_timeout" counts the
+    pages which were given up on.
+
+    :returns: A dictionary of statistics keyed by stage
+    :rtype: dict
+    """
+    with _timings_lock:
+        timings = dict(_timings)
+
+    rv = {"enabled" : app.config["PARSE_OFFLOAD"]}
+
+    for stage, (total, count) in timings.items():
+        rv[stage] = {"count" : count, "average_ms" : round(total * 1000 / count, 2)}
+
+    return rv
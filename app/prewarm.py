@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Pre-warm
+    ~~~~~~~~
+
+    Keeps the cache warm for the busiest endpoints so that no client has
+    to wait on a scrape.
+
+    Most of our traffic goes to /standings/, /scores/ and /teams/. Each
+    route listed in PREWARM_ROUTES is replayed shortly before its cache
+    object goes stale. The replay runs the view, and so the view's
+    helper (standings_helper(), scores_helper() or teams_helper()), in
+    a test request context on a background thread, exactly as a real
+    request would. See utils.replay_request().
+
+    Refreshes are spread out with a bit of random jitter and no more
+    than PREWARM_MAX_WORKERS of them run at the same time. Data cached
+    for less than PREWARM_LEAD and PREWARM_JITTER allow for, like the
+    scoreboard of a game in progress, is refreshed with a lead and
+    jitter in proportion to how long it's cached for.
+
+    Every worker process pre-warms the same routes. Whichever worker
+    comes first refreshes the shared cache object, and the others find
+    it fresh and leave it alone, so a route is still scraped about once
+    per expiry however many workers there are.
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+from time import time, sleep
+from random import uniform
+from threading import Thread, Lock
+from multiprocessing.pool import ThreadPool
+from app import app
+from app.utils import replay_request, logcat
+
+_jobs = {}
+_jobs_lock = Lock()
+_scheduler = None
+
+class Job(object):
+    """
+    A route to keep warm, along with how its last refresh went.
+    """
+    def __init__(self, route, next_run):
+        self.route = route
+        self.next_run = next_run
+        self.running = False
+
+        # How many seconds the data was cached for when it was last
+        # refreshed
+        self.ttl = None
+        self.runs = 0
+        self.last_refresh = None
+        self.last_duration = None
+        self.last_error = None
+
+    def to_dict(self):
+        return {
+            "route" : self.route,
+            "running" : self.running,
+            "runs" : self.runs,
+            "next_run" : int(self.next_run),
+            "ttl" : self.ttl,
+            "last_refresh" : None if self.last_refresh is None else int(self.last_refresh),
+            "last_duration" : self.last_duration,
+            "last_error" : self.last_error
+        }
+
+def start_prewarming():
+    """
+    Starts the scheduler thread. Calling this more than once does
+    nothing.
+    """
+    global _scheduler
+
+    with _jobs_lock:
+        if _scheduler is not None:
+            return
+
+        now = time()
+
+        # Stagger the first round so every route isn't scraped at once
+        for route in app.config["PREWARM_ROUTES"]:
+            _jobs[route] = Job(route, now + uniform(0, app.config["PREWARM_JITTER"]))
+
+        _scheduler = Thread(target=_schedule, name="prewarm")
+        _scheduler.daemon = True
+        _scheduler.start()
+
+def _schedule():
+    pool = ThreadPool(app.config["PREWARM_MAX_WORKERS"])
+
+    while True:
+        now = time()
+
+        with _jobs_lock:
+            due = [job for job in _jobs.values() if not job.running and job.next_run <= now]
+
+            for job in due:
+                job.running = True
+
+        for job in due:
+            pool.apply_async(_run, (job,))
+
+        sleep(1)
+
+def _margins(ttl):
+    """
+    Returns how many seconds before data cached for ttl seconds goes
+    stale to refresh it, and up to how many seconds earlier still.
+
+    Another worker which refreshed the data up to the jitter earlier
+    must have left it fresh for longer than the lead and the jitter
+    again, or it would be scraped a second time. Data cached for less
+    than that gets a lead and jitter which add up to half of its TTL.
+
+    :param ttl: How many seconds the data is cached for, if known
+    :type ttl: float
+
+    :returns: The lead and the jitter
+    :rtype: tuple
+    """
+    lead = app.config["PREWARM_LEAD"]
+    jitter = app.config["PREWARM_JITTER"]
+
+    if ttl is not None and lead + 2 * jitter > ttl / 2.0:
+        scale = ttl / 2.0 / (lead + 2 * jitter)
+        lead, jitter = lead * scale, jitter * scale
+
+    return lead, jitter
+
+def _run(job):
+    started = time()
+    cached = None
+
+    try:
+        # Anything after the '?' is passed along as the query string
+        path, _, query_string = job.route.partition('?')
+
+        # Data which another worker refreshed isn't due yet
+        lead, jitter = _margins(job.ttl)
+        keep_until = started + lead + jitter
+
+        cached = replay_request(path, query_string, app.config["PREWARM_BASE_URL"], keep_until)
+        job.last_error = None
+
+    except Exception as e:
+        logcat("Unable to pre-warm %s: %s" % (job.route, e))
+        job.last_error = str(e)
+
+    finished = time()
+
+    # Come back shortly before the new cache object goes stale. If
+    # nothing was cached, try again later.
+    if cached is None:
+        next_run = finished + app.config["PREWARM_RETRY"]
+    else:
+        cached_until, job.ttl = cached
+        lead, jitter = _margins(job.ttl)
+        next_run = cached_until - lead - uniform(0, jitter)
+
+    with _jobs_lock:
+        job.runs += 1
+        job.last_refresh = finished
+        job.last_duration = round(finished - started, 3)
+        job.next_run = max(next_run, finished + app.config["PREWARM_MIN_INTERVAL"])
+        job.running = False
+
+def prewarm_status():
+    """
+    Reports the last refresh time and duration of each route.
+
+    :returns: A list of dictionaries, one per route
+    :rtype: list
+    """
+    with _jobs_lock:
+        return [_jobs[route].to_dict() for route in sorted(_jobs)]
@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Rows
+    ~~~~
+
+    A streaming table row extractor which skips BeautifulSoup entirely.
+
+    Every parser in app/views/ only ever looks at the rows and cells of
+    the tables with the class "shsTable shsBorderTable". Building a full
+    soup for that is wasteful: most of a STATS page is navigation and
+    ads, and every string in the soup becomes a NavigableString wired to
+    its parent and siblings.
+
+    iter_rows() feeds the page through Python's event based HTMLParser
+    and yields each <tr> as soon as its end tag is read. Only the markup
+    inside of the matching tables is kept, and only until the row is
+    handed over, so memory stays flat no matter how large the page is.
+
+    The rows are Node objects, which answer the handful of questions the
+    parsers ask of a bs4 Tag:
+
+    row.get("class")                  # ["shsRow0Row"]
+    row("td")                         # the cells
+    cells[0].extract().text           # u"Dustin Pedroia"
+    cells[2].find("a")                # the first link
+    cells[2].find("span", {"class" : "shsGMTZone"})
+
+    Because help_parse_soup() accepts any iterable of rows, the result
+    of iter_rows() may be passed to it in place of a soup. For parsers
+    which walk whole tables, parse_tables() builds a small tree of every
+    matching element which is used just like a soup.
+
+    Whitespace is collapsed exactly the way help_make_soup() collapses
+    it, so the text of every cell matches what BeautifulSoup returns.
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import re
+from HTMLParser import HTMLParser
+from htmlentitydefs import name2codepoint
+
+# How much of the page is fed to the parser at a time
+CHUNK_SIZE = 16 * 1024
+
+# Elements which never have an end tag
+VOID_ELEMENTS = frozenset([
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link",
+    "meta", "param", "source", "wbr"
+])
+
+# Starting one of these closes the one before it
+CELL_ELEMENTS = frozenset(["td", "th"])
+
+_whitespace_re = re.compile(r"\s+")
+
+class Node(object):
+    """
+    An element inside of a matching table.
+
+    :param name: The tag name
+    :type name: str
+
+    :param attrs: The attributes of the tag
+    :type attrs: dict
+    """
+    __slots__ = ("name", "attrs", "contents", "parent")
+
+    def __init__(self, name, attrs=None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.contents = []
+        self.parent = None
+
+    def get(self, key, default=None):
+        """
+        Returns the value of an attribute. Like BeautifulSoup, the
+        class is returned as a list of class names.
+        """
+        value = self.attrs.get(key)
+
+        if value is None:
+            return default
+
+        return value.split() if "class" == key else value
+
+    @property
+    def text(self):
+        return u''.join(self._strings())
+
+    def _strings(self):
+        for item in self.contents:
+            if isinstance(item, Node):
+                for string in item._strings():
+                    yield string
+            else:
+                yield item
+
+    def extract(self):
+        """
+        Removes the node from its parent and returns it.
+        """
+        if self.parent is not None:
+            self.parent.contents.remove(self)
+            self.parent = None
+
+        return self
+
+    def find(self, name=None, attrs=None):
+        """
+        Returns the first descendant matching name and attrs, or None.
+        """
+        for node in self._descendants():
+            if node._matches(name, attrs):
+                return node
+
+        return None
+
+    def find_all(self, name=None, attrs=None):
+        """
+        Returns every descendant matching name and attrs.
+        """
+        return [node for node in self._descendants() if node._matches(name, attrs)]
+
+    __call__ = find_all
+
+    def _descendants(self):
+        for item in self.contents:
+            if isinstance(item, Node):
+                yield item
+
+                for node in item._descendants():
+                    yield node
+
+    def _matches(self, name, attrs):
+        if name is not None:
+            if isinstance(name, basestring):
+                if name != self.name:
+                    return False
+            elif self.name not in name:
+                return False
+
+        for key, value in (attrs or {}).items():
+            actual = self.attrs.get(key)
+
+            if actual is None:
+                return False
+
+            # Like BeautifulSoup, a class matches either the whole
+            # attribute or any single class name in it
+            if "class" == key:
+                if value != actual and value not in actual.split():
+                    return False
+
+            elif value != actual:
+                return False
+
+        return True
+
+    def __repr__(self):
+        return "<Node %s %r>" % (self.name, self.attrs)
+
+class RowParser(HTMLParser):
+    """
+    Collects the elements matching name and attrs, and everything inside
+    of them. Every time a <tr> inside of a match ends, on_row is called
+    with it.
+
+    :param name: The tag name of the elements to keep, e.g. "table"
+    :type name: str
+
+    :param attrs: The attributes of the elements to keep
+    :type attrs: dict
+
+    :param on_row: Called with each completed row
+    :type on_row: function
+
+    :param keep_rows: Whether rows stay in the tree after on_row is
+                      called. Turn this off to keep memory flat.
+    :type keep_rows: bool
+    """
+    def __init__(self, name, attrs, on_row=None, keep_rows=True):
+        HTMLParser.__init__(self)
+        self.root = Node(None)
+        self.name = name
+        self.attrs = attrs
+        self.on_row = on_row
+        self.keep_rows = keep_rows
+
+        # The open elements, innermost last. Empty outside of a match.
+        self.stack = []
+
+        # Text waiting to have its whitespace collapsed
+        self.pending = []
+
+    def handle_starttag(self, tag, attrs):
+        if not self.stack:
+            if tag != self.name:
+                return
+
+            node = Node(tag, self._collapse_attrs(attrs))
+
+            if node._matches(self.name, self.attrs):
+                self._append(self.root, node)
+                self.stack.append(node)
+
+            return
+
+        self._flush()
+
+        if tag in CELL_ELEMENTS:
+            self._close_open(CELL_ELEMENTS, stop_at="tr")
+        elif "tr" == tag:
+            self._close_open(["tr"], stop_at="table")
+
+        node = Node(tag, self._collapse_attrs(attrs))
+        self._append(self.stack[-1], node)
+
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        if not self.stack:
+            self.handle_starttag(tag, attrs)
+
+            # A self-closing match has nothing inside of it
+            if self.stack:
+                self.stack.pop()
+
+            return
+
+        self._flush()
+        self._append(self.stack[-1], Node(tag, self._collapse_attrs(attrs)))
+
+    def handle_endtag(self, tag):
+        if not self.stack:
+            return
+
+        self._flush()
+
+        # Stray end tags are ignored
+        if not any(node.name == tag for node in self.stack):
+            return
+
+        while self.stack:
+            node = self.stack.pop()
+            self._closed(node)
+
+            if node.name == tag:
+                break
+
+    def handle_data(self, data):
+        if self.stack:
+            self.pending.append(data)
+
+    def handle_entityref(self, name):
+        if self.stack:
+            self._flush()
+            codepoint = name2codepoint.get(name)
+            self.stack[-1].contents.append(u"&%s;" % name if codepoint is None else unichr(codepoint))
+
+    def handle_charref(self, name):
+        if not self.stack:
+            return
+
+        self._flush()
+
+        try:
+            if name.lower().startswith('x'):
+                character = unichr(int(name.lstrip("xX"), 16))
+            else:
+                character = unichr(int(name))
+        except (ValueError, OverflowError):
+            character = u"\N{REPLACEMENT CHARACTER}"
+
+        self.stack[-1].contents.append(character)
+
+    def close(self):
+        HTMLParser.close(self)
+        self._flush()
+
+        while self.stack:
+            self._closed(self.stack.pop())
+
+    def _flush(self):
+        # Runs of whitespace are collapsed only once the whole run has
+        # been read, since HTMLParser may split text between two calls.
+        if self.pending:
+            self.stack[-1].contents.append(_whitespace_re.sub(' ', u''.join(self.pending)))
+            self.pending = []
+
+    def _close_open(self, names, stop_at):
+        # Closes an unclosed element of the same kind, such as a <td>
+        # which is followed by another <td>
+        for i in xrange(len(self.stack) - 1, -1, -1):
+            if self.stack[i].name in names:
+                while len(self.stack) > i:
+                    self._closed(self.stack.pop())
+                return
+
+            if self.stack[i].name == stop_at:
+                return
+
+    def _closed(self, node):
+        if "tr" == node.name and self.on_row is not None:
+            # A row nested in another row's table is handed over right
+            # after the outer one, in the order BeautifulSoup finds them
+            if any("tr" == open_node.name for open_node in self.stack):
+                return
+
+            nested_rows = node.find_all("tr")
+            self.on_row(node)
+
+            for nested_row in nested_rows:
+                self.on_row(nested_row)
+
+            if not self.keep_rows:
+                node.extract()
+
+        elif node.parent is self.root and not self.keep_rows:
+            node.extract()
+
+    def _append(self, parent, node):
+        node.parent = parent
+        parent.contents.append(node)
+
+    def _collapse_attrs(self, attrs):
+        return dict((k, _whitespace_re.sub(' ', v) if v else v) for (k, v) in attrs)
+
+def _strip_document_write(text):
+    # Some pages at STATS are JavaScript files which wrap their HTML in
+    # calls to document.write()
+    return text.replace("document.write('", '').replace("');", '')
+
+def match_attrs(class_attrs=None, attrs=None):
+    """
+    Returns the attributes an element must have, given the class_attrs
+    and attrs arguments taken by iter_rows() and help_make_soup().
+
+    :rtype: dict
+    """
+    class_attrs = "shsTable shsBorderTable" if class_attrs is None else class_attrs
+
+    return {"class" : class_attrs} if attrs is None else attrs
+
+def _chunks(source):
+    if isinstance(source, basestring):
+        return (source[i:i + CHUNK_SIZE] for i in xrange(0, len(source), CHUNK_SIZE))
+
+    return source
+
+def iter_rows(source, source_file_type="html", element=None, class_attrs=None, attrs=None):
+    """
+    Yields each row of the matching tables of a page, in order.
+
+    A row is yielded as soon as it ends, and is let go of by the parser
+    right after.
+
+    :param source: The body of the page, or an iterable of pieces of it
+    :type source: unicode
+
+    :param source_file_type: "html", or "JavaScript" for pages wrapped in
+                             document.write(). Only applies when source
+                             is a string.
+    :type source_file_type: str
+
+    :param element: The tag name of the elements to search. Defaults to
+                    "table"
+    :type element: str
+
+    :param class_attrs: The class of the elements to search
+    :type class_attrs: str
+
+    :param attrs: Attributes of the elements to search. Overrides
+                  class_attrs
+    :type attrs: dict
+
+    :returns: A generator of rows
+    :rtype: generator
+    """
+    if isinstance(source, basestring) and "javascript" == source_file_type.lower():
+        source = _strip_document_write(source)
+
+    rows = []
+    parser = RowParser(
+        "table" if element is None else element,
+        match_attrs(class_attrs, attrs),
+        on_row=rows.append,
+        keep_rows=False
+    )
+
+    for chunk in _chunks(source):
+        parser.feed(chunk)
+
+        for row in rows:
+            yield row
+
+        del rows[:]
+
+    parser.close()
+
+    for row in rows:
+        yield row
+
+def parse_tables(source, source_file_type="html", element=None, class_attrs=None, attrs=None):
+    """
+    Builds a tree of the matching elements of a page, which can be used
+    in place of the soup returned by help_make_soup(). See iter_rows()
+    for the parameters.
+
+    :returns: A node whose children are the matching elements
+    :rtype: Node
+    """
+    if isinstance(source, basestring) and "javascript" == source_file_type.lower():
+        source = _strip_document_write(source)
+
+    parser = RowParser("table" if element is None else element, match_attrs(class_attrs, attrs))
+
+    for chunk in _chunks(source):
+        parser.feed(chunk)
+
+    parser.close()
+
+    return parser.root
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Schema
+    ~~~~~~
+
+    Declarative column layouts for the tables at STATS.
+
+    Most parsers do nothing more than read a cell, convert it and store
+    it under a key. Instead of writing that out by hand, a table layout
+    is declared as a list of (name, index, converter) columns:
+
+    ROSTER_SCHEMA = compile_schema([
+        ("number", 0, cell_int),
+        ("name", 1, cell_raw_text),
+        (("bats", "throws"), 3, split_slash)
+    ])
+
+    ROSTER_SCHEMA(cells)
+    # {"number" : 15, "name" : "Dustin Pedroia", "bats" : "R", "throws" : "R"}
+
+    A converter is called with the cell and returns the value. When the
+    name is a tuple, the value is unpacked into each of the names.
+
+    compile_schema() turns the columns into the source of a function
+    which reads each cell in turn and returns a single dict literal, and
+    compiles it once. That is as fast as writing the function by hand,
+    and much faster than looping over the columns for every row.
+
+    Tables whose rows come in more than one layout, such as the MLB
+    schedule, are handled by compile_layouts(), which picks the schema
+    by the number of cells in the row.
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+
+def compile_schema(columns, finish=None):
+    """
+    Compiles a list of columns into a row decoder.
+
+    :param columns: A list of (name, index, converter) tuples. The name
+                    may be a tuple of names, and the index may be
+                    negative
+    :type columns: list
+
+    :param finish: Called with the decoded dict, the cells and any extra
+                   arguments passed to the decoder. For whatever can't be
+                   declared as a column. Its return value is returned.
+    :type finish: function
+
+    :returns: A function which accepts a list of cells, followed by any
+              extra arguments for finish, and returns a dict
+    :rtype: function
+    """
+    namespace = {"finish" : finish}
+    lines = ["def decode(cells, *args):"]
+    items = []
+
+    for i, (name, index, converter) in enumerate(columns):
+        namespace["convert_%d" % i] = converter
+        lines.append("    value_%d = convert_%d(cells[%d])" % (i, i, index))
+
+        if isinstance(name, tuple):
+            items += ["%r : value_%d[%d]" % (n, i, j) for (j, n) in enumerate(name)]
+        else:
+            items.append("%r : value_%d" % (name, i))
+
+    lines.append("    row = {%s}" % ", ".join(items))
+    lines.append("    return row if finish is None else finish(row, cells, *args)")
+
+    exec compile("\n".join(lines), "<schema>", "exec") in namespace
+
+    decode = namespace["decode"]
+    decode.columns = list(columns)
+
+    return decode
+
+def compile_layouts(layouts, default=None):
+    """
+    Builds a row decoder which picks a schema by the number of cells in
+    the row.
+
+    :param layouts: Row decoders keyed by cell count
+    :type layouts: dict
+
+    :param default: The decoder for any other cell count. If None, those
+                    rows are decoded as an empty dict
+    :type default: function
+
+    :returns: A row decoder
+    :rtype: function
+    """
+    table = dict(layouts)
+
+    def decode(cells, *args):
+        decoder = table.get(len(cells), default)
+
+        return {} if decoder is None else decoder(cells, *args)
+
+    decode.layouts = table
+
+    return decode
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Slicer
+    ~~~~~~
+
+    Cuts the tables a parser needs out of a page before it is parsed.
+
+    A page at STATS is mostly navigation, ads and scripts. Only a few
+    <table class="shsTable shsBorderTable"> or <div id="shsMLBrecentinj">
+    blocks are ever read. Handing the whole page to BeautifulSoup or
+    rows.iter_rows() means decoding all of it, collapsing the whitespace
+    of all of it, and tokenizing all of it, only for a SoupStrainer to
+    throw nearly everything away.
+
+    slice_markup() works on the raw bytes of the response. It finds the
+    start tag of each matching element, finds the end tag which closes
+    it, and decodes only those slices:
+
+    slice_markup(page.content, "utf-8")
+    # u'<table class="shsTable shsBorderTable">...</table>'
+
+    slice_markup(page.content, "utf-8", element="div", attrs={"id" : "shsMLBrecentinj"})
+
+    Elements are matched by the same rules rows.Node uses, so a class
+    matches either the whole attribute or any single class name in it.
+    Comments and scripts are skipped, since a parser wouldn't find any
+    elements inside of them either.
+
+    Pages which are JavaScript files have their document.write() calls
+    removed first, so the slices are always plain HTML.
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import re
+from app.rows import Node, match_attrs
+
+_whitespace_re = re.compile(r"\s+")
+_attr_re = re.compile(r"""([^\s"'>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?""")
+
+_script_open_re = re.compile(r"<script\b", re.IGNORECASE)
+_script_close_re = re.compile(r"</script\s*>", re.IGNORECASE)
+
+# Each element gets its own scanner, which finds its start and end tags
+# and steps over comments and scripts
+_tag_res = {}
+
+def _tag_re(element):
+    tag_re = _tag_res.get(element)
+
+    if tag_re is None:
+        tag_re = re.compile(
+            r"<!--.*?-->|<script\b.*?</script\s*>|<(/?)%s\b((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>" % re.escape(element),
+            re.IGNORECASE | re.DOTALL
+        )
+        _tag_res[element] = tag_re
+
+    return tag_re
+
+def parse_attrs(tag_body):
+    """
+    Reads the attributes of a start tag, the way HTMLParser does: names
+    are lowercased and whitespace in values is collapsed.
+
+    :param tag_body: Everything between the tag name and the closing >
+    :type tag_body: str
+
+    :returns: The attributes
+    :rtype: dict
+    """
+    attrs = {}
+
+    for match in _attr_re.finditer(tag_body):
+        name, double_quoted, single_quoted, bare = match.groups()
+        value = next((v for v in (double_quoted, single_quoted, bare) if v is not None), '')
+
+        attrs.setdefault(name.lower(), _whitespace_re.sub(' ', value))
+
+    return attrs
+
+class SliceScanner(object):
+    """
+    Finds the matching elements of a page while it is still arriving.
+
+    Feed the page to it a piece at a time. Tags, comments and scripts
+    which are cut in two by the end of a piece are held back until the
+    rest of them arrives. The offsets of every element found so far are
+    kept in "slices".
+
+    :param element: The tag name of the elements to find. Defaults to
+                    "table"
+    :type element: str
+
+    :param class_attrs: The class of the elements to find
+    :type class_attrs: str
+
+    :param attrs: Attributes of the elements to find. Overrides
+                  class_attrs
+    :type attrs: dict
+
+    :param end_marker: Markup which is known to follow the last matching
+                       element, such as the timestamp at the bottom of
+                       every page at STATS. Once it shows up after a
+                       closed element, the scanner is done.
+    :type end_marker: str
+    """
+    def __init__(self, element=None, class_attrs=None, attrs=None, end_marker=None):
+        self.element = "table" if element is None else element
+        self.attrs = match_attrs(class_attrs, attrs)
+        self.end_marker = end_marker
+        self.tag_re = _tag_re(self.element)
+
+        # Identifies what the scanner looks for. Pages cut short by a
+        # scanner are only good for scanners with the same key.
+        self.key = (self.element, tuple(sorted(self.attrs.items())), end_marker)
+
+        # (start, end) offsets of the elements found so far
+        self.slices = []
+
+        # Whether the end marker turned up after the last element
+        self.done = False
+
+        # The start of the element being read, and how deeply nested we
+        # are inside of it
+        self.start = None
+        self.depth = 0
+
+        # The part of the page which hasn't been scanned yet, and its
+        # offset in the page
+        self.tail = None
+        self.offset = 0
+
+    def feed(self, data):
+        """
+        Scans the next piece of the page.
+
+        :returns: Whether the scanner is done, in which case the rest of
+                  the page isn't needed
+        :rtype: bool
+        """
+        self._scan(data, final=False)
+
+        return self.done
+
+    def close(self):
+        """
+        Scans whatever was held back. An element which is still open
+        runs to the end of the page.
+
+        :returns: The (start, end) offsets of each element
+        :rtype: list
+        """
+        if self.tail:
+            self._scan(self.tail[:0], final=True)
+
+        if self.start is not None:
+            self.slices.append((self.start, self.offset + len(self.tail or '')))
+            self.start = None
+
+        return self.slices
+
+    def _scan(self, data, final):
+        if self.done:
+            return
+
+        text = data if not self.tail else self.tail + data
+        limit = len(text) if final else _safe_end(text)
+        scanned = 0
+
+        for match in self.tag_re.finditer(text, 0, limit):
+            scanned = match.end()
+            closing, tag_body = match.groups()
+
+            # A comment or a script
+            if tag_body is None:
+                continue
+
+            self_closing = tag_body.rstrip().endswith('/')
+
+            if self.start is not None:
+                if closing:
+                    self.depth -= 1
+                elif not self_closing:
+                    self.depth += 1
+
+            elif closing or not Node(self.element, parse_attrs(tag_body))._matches(self.element, self.attrs):
+                continue
+
+            # Nothing after the end marker is wanted
+            elif self._find_end_marker(text, match.start()):
+                break
+
+            else:
+                self.start = self.offset + match.start()
+                self.depth = 0 if self_closing else 1
+
+            if 0 == self.depth:
+                self.slices.append((self.start, self.offset + match.end()))
+                self.start = None
+
+        if self.start is None:
+            self._find_end_marker(text, len(text))
+
+        # Keep whatever wasn't scanned, plus enough to find an end marker
+        # which is cut in two
+        keep = limit
+
+        if self.end_marker is not None:
+            keep = min(keep, len(text) - len(self.end_marker) + 1)
+
+        keep = max(keep, scanned, 0)
+        self.tail = text[keep:]
+        self.offset += keep
+
+    def _find_end_marker(self, text, end):
+        # Looks for the end marker between the last element and end
+        if self.end_marker is not None and self.slices:
+            if -1 != text.find(self.end_marker, max(0, self.slices[-1][1] - self.offset), end):
+                self.done = True
+
+        return self.done
+
+def _safe_end(text):
+    # Where scanning must stop, so that nothing is read from a tag,
+    # comment or script whose end hasn't arrived yet
+    end = len(text)
+
+    last_open = text.rfind('<')
+
+    if -1 != last_open and -1 == text.find('>', last_open):
+        end = last_open
+
+    last_close = text.rfind("-->")
+    comment = text.find("<!--", 0 if -1 == last_close else last_close)
+
+    if -1 != comment:
+        end = min(end, comment)
+
+    script_end = 0
+
+    for match in _script_close_re.finditer(text):
+        script_end = match.end()
+
+    match = _script_open_re.search(text, script_end)
+
+    if match is not None:
+        end = min(end, match.start())
+
+    return end
+
+def find_slices(markup, element=None, class_attrs=None, attrs=None):
+    """
+    Finds the matching elements of a page. See SliceScanner for the
+    parameters.
+
+    :param markup: The page, either bytes or text
+    :type markup: str
+
+    :returns: A list of (start, end) offsets, one for each element. An
+              element which is never closed runs to the end of the page.
+    :rtype: list
+    """
+    scanner = SliceScanner(element, class_attrs, attrs)
+    scanner._scan(markup, final=True)
+
+    return scanner.close()
+
+def slice_markup(content, encoding=None, source_file_type="html", element=None, class_attrs=None, attrs=None):
+    """
+    Returns the matching elements of a page, and nothing else. See
+    find_slices() for the rest of the parameters.
+
+    :param content: The body of the page, either the raw bytes of the
+                    response or text which was already decoded
+    :type content: str
+
+    :param encoding: The encoding of content, when it is bytes
+    :type encoding: str
+
+    :param source_file_type: "html", or "JavaScript" for pages wrapped in
+                             document.write()
+    :type source_file_type: str
+
+    :returns: The markup of the matching elements
+    :rtype: unicode
+    """
+    if "javascript" == source_file_type.lower():
+        content = content.replace("document.write('", '').replace("');", '')
+
+    pieces = [content[start:end] for (start, end) in find_slices(content, element, class_attrs, attrs)]
+
+    if isinstance(content, unicode):
+        return u''.join(pieces)
+
+    return u''.join(piece.decode(encoding, "replace") for piece in pieces)
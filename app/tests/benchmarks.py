@@ -0,0 +1,651 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Benchmarks
+    ~~~~~~~~~~
+
+    Times the parsing of every page saved in app/tests/fixtures, once
+    for each parser backend BeautifulSoup can use and once with the
+    streaming row extractor in app/rows.py, and checks that the parsers
+    in app/views/ come up with the same result no matter what read the
+    page.
+
+    It also times reading every cell of every row, the old way with
+    extract() and the new way with the accessors in app/cells.py.
+
+    With SLICE_PAGES in mind, every fixture is also parsed from the
+    slices app/slicer.py cuts out of its raw bytes, which must not change
+    the result.
+
+    It times turning the dates of the schedules and injury reports into
+    timestamps, with dateutil and with app/dates.py.
+
+    It times the scoreboard parser on a synthetic scoreboard of several
+    hundred games, made of the games of the scoreboard fixtures, against
+    the multi-pass parser it replaced, and checks that both come up with
+    the same JSON.
+
+    Finally, it parses several large pages at once, in place and in the
+    worker processes of app/offload.py, while another thread stands in
+    for a quick request. It reports how long that thread was held up.
+
+    Run it from the root directory of the application:
+
+    $ (venv) python -m app.tests.benchmarks
+
+    Backends which aren't installed are skipped.
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import re
+import json
+import unittest
+from time import sleep
+from threading import Event, Thread
+from timeit import default_timer
+from bs4 import BeautifulSoup, FeatureNotFound
+from bs4.element import Tag
+from dateutil.parser import parse as dateutil_parse
+from app import dates, offload
+from app.helpers import help_make_soup, help_parse_soup, parse_teams_soup, parse_rows_markup
+from app.rows import iter_rows, parse_tables
+from app.slicer import slice_markup
+from app.cells import cell_text, link_text
+from app.utils import slugify
+from app.views import injuries, rankings, roster, schedule, scores, standings
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+PARSER_BACKENDS = ["lxml", "html5lib", "html.parser"]
+REPEAT = 5
+
+# Not a BeautifulSoup backend: reads the page with app/rows.py
+STREAM_BACKEND = "stream"
+
+def each_row(parser_func, *args):
+    """
+    Parses every row with parser_func, like help_fetch_rows() does.
+    """
+    def parse(soup):
+        return help_parse_soup(soup, parser_func, *args)
+
+    # When streaming, these get rows.iter_rows() rather than a tree
+    parse.streams_rows = True
+
+    return parse
+
+# How to build the soup for each fixture and which parser reads it
+FIXTURES = {
+    "golf_leaderboard_eu.html" : ({}, each_row(rankings.parse_golf_soup)),
+    "golf_leaderboard_us.html" : ({}, each_row(rankings.parse_golf_soup)),
+    "mlb_injuries.html" : ({"element" : "div", "attrs" : {"id" : "shsMLBrecentinj"}}, injuries.parse_injuries_soup),
+    "mlb_roster.html" : ({}, each_row(roster.parse_mlb_soup)),
+    "mlb_schedule.html" : ({}, each_row(schedule.parse_mlb_soup, 5)),
+    "mlb_schedule_spring_training.html" : ({}, each_row(schedule.parse_mlb_soup, 3)),
+    "mlb_scoreboard_widget.js" : ({"source_file_type" : "JavaScript", "class_attrs" : "shsTable"}, scores.parse_scores_soup),
+    "mlb_scoreboard_widget_no_games.js" : ({"source_file_type" : "JavaScript", "class_attrs" : "shsTable"}, scores.parse_scores_soup),
+    "mlb_standings.html" : ({}, lambda soup: standings.parse_standings_soup(soup, "mlb")),
+    "mlb_teams.html" : ({}, parse_teams_soup),
+    "nfl_injuries.html" : ({"element" : "div", "attrs" : {"id" : "shsNFLInjuries"}}, injuries.parse_injuries_soup),
+    "nfl_scoreboard_widget.js" : ({"source_file_type" : "JavaScript", "class_attrs" : "shsTable"}, scores.parse_scores_soup),
+    "nfl_standings.html" : ({}, lambda soup: standings.parse_standings_soup(soup, "nfl")),
+    "nfl_teams.html" : ({}, parse_teams_soup),
+    "nhl_roster.html" : ({}, each_row(roster.parse_nhl_soup)),
+    "nhl_schedule_preseason.html" : ({}, each_row(schedule.parse_nhl_soup, 9)),
+    "nhl_schedule_regular_season.html" : ({}, each_row(schedule.parse_nhl_soup, 10)),
+    "nhl_teams.html" : ({}, parse_teams_soup),
+    "tennis_rankings_atp.html" : ({}, each_row(rankings.parse_tennis_soup)),
+    "tennis_rankings_wta.html" : ({}, each_row(rankings.parse_tennis_soup)),
+}
+
+def read_fixture(file_name):
+    return read_fixture_bytes(file_name).decode("utf-8")
+
+def read_fixture_bytes(file_name):
+    with open(os.path.join(FIXTURES_DIR, file_name), "rb") as f:
+        return f.read()
+
+def installed_backends():
+    rv = []
+
+    for backend in PARSER_BACKENDS:
+        try:
+            BeautifulSoup("<p></p>", backend)
+            rv.append(backend)
+        except FeatureNotFound:
+            pass
+
+    return rv
+
+def can_stream(file_name):
+    # The scoreboard walks the siblings of a <br>, which needs a soup
+    return "javascript" != FIXTURES[file_name][0].get("source_file_type", "html").lower()
+
+def parse_fixture(file_name, backend, sliced=False):
+    soup_kwargs, parser_func = FIXTURES[file_name]
+
+    if sliced:
+        markup = slice_markup(read_fixture_bytes(file_name), "utf-8", **soup_kwargs)
+        soup_kwargs = dict(soup_kwargs, source_file_type="html")
+    else:
+        markup = read_fixture(file_name)
+
+    if STREAM_BACKEND == backend:
+        if getattr(parser_func, "streams_rows", False):
+            soup = iter_rows(markup, **soup_kwargs)
+        else:
+            soup = parse_tables(markup, **soup_kwargs)
+    else:
+        soup = help_make_soup(markup, backend=backend, **soup_kwargs)
+
+    return parser_func(soup)
+
+def time_fixture(file_name, backend):
+    """
+    Returns the best time, in seconds, of building the soup for a
+    fixture and parsing it.
+    """
+    best = None
+
+    for i in xrange(REPEAT):
+        started = default_timer()
+        parse_fixture(file_name, backend)
+        elapsed = default_timer() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def run_benchmark():
+    backends = installed_backends() + [STREAM_BACKEND]
+    print "%-36s" % "fixture" + ''.join("%14s" % backend for backend in backends)
+
+    totals = dict((backend, 0.0) for backend in backends)
+
+    for file_name in sorted(FIXTURES):
+        row = "%-36s" % file_name
+
+        for backend in backends:
+            if STREAM_BACKEND == backend and not can_stream(file_name):
+                row += "%14s" % '-'
+                continue
+
+            elapsed = time_fixture(file_name, backend)
+            totals[backend] += elapsed
+            row += "%12.1fms" % (elapsed * 1000)
+
+        print row
+
+    print "%-36s" % "total" + ''.join("%12.1fms" % (totals[backend] * 1000) for backend in backends)
+
+def read_cells_with_extract(rows):
+    for row in rows:
+        for cell in row("td"):
+            cell.extract().text.strip().encode("utf-8")
+
+def read_cells_with_accessors(rows):
+    for row in rows:
+        for cell in row("td"):
+            cell_text(cell)
+
+def time_cell_reads(file_name, backend, read_cells):
+    """
+    Returns the best time, in seconds, of reading every cell of a
+    fixture, along with the number of rows read. Building the soup
+    isn't timed.
+    """
+    soup_kwargs = FIXTURES[file_name][0]
+    best = None
+
+    for i in xrange(REPEAT):
+        if STREAM_BACKEND == backend:
+            rows = parse_tables(read_fixture(file_name), **soup_kwargs)("tr")
+        else:
+            rows = help_make_soup(read_fixture(file_name), backend=backend, **soup_kwargs)("tr")
+
+        started = default_timer()
+        read_cells(rows)
+        elapsed = default_timer() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, len(rows)
+
+def run_cell_benchmark():
+    backends = installed_backends() + [STREAM_BACKEND]
+    print "%-14s%16s%16s" % ("per row", "extract()", "cell_text()")
+
+    for backend in backends:
+        totals = [0.0, 0.0]
+        row_count = 0
+
+        for file_name in sorted(FIXTURES):
+            if STREAM_BACKEND == backend and not can_stream(file_name):
+                continue
+
+            for i, read_cells in enumerate([read_cells_with_extract, read_cells_with_accessors]):
+                elapsed, rows = time_cell_reads(file_name, backend, read_cells)
+                totals[i] += elapsed
+
+            row_count += rows
+
+        print "%-14s%14.1fus%14.1fus" % (backend, totals[0] * 1e6 / row_count, totals[1] * 1e6 / row_count)
+
+#-- Dates
+# Other shapes which may reach timestamp_from_string()
+DATE_STRINGS = [
+    "Tue 14 Apr 2026 7:05 PM",
+    "Tue 14 Apr 2026 12:05 AM",
+    "Sun. 8 Mar 2026 2:30",
+    "Sun. 1 Nov 2026 1:30 GMT",
+    "Sunday 1 November 2026 13:30:15 UTC",
+    "1 Sept 2026",
+    "2013-09-17T14:29:02-04:00",
+    "2013-09-17T14:29:02Z",
+    "2013-09-17T14:29:02",
+    "2013-09-17",
+]
+
+def collect_date_strings():
+    """
+    Returns every date string the schedule and injury parsers turn into
+    a timestamp, in the order they do so.
+    """
+    rv = []
+
+    def record(date_string):
+        rv.append(date_string)
+        return dates.timestamp_from_string(date_string)
+
+    for module in [schedule, injuries]:
+        module.timestamp_from_string = record
+
+    try:
+        for file_name in sorted(FIXTURES):
+            if "schedule" in file_name or "injuries" in file_name:
+                parse_fixture(file_name, STREAM_BACKEND)
+    finally:
+        for module in [schedule, injuries]:
+            module.timestamp_from_string = dates.timestamp_from_string
+
+    return rv
+
+def time_dates(date_strings, to_timestamp):
+    """
+    Returns the best time, in seconds, of turning every date string into
+    a timestamp. The memo starts out empty every time.
+    """
+    best = None
+
+    for i in xrange(REPEAT):
+        dates._memo.clear()
+        started = default_timer()
+
+        for date_string in date_strings:
+            to_timestamp(date_string)
+
+        elapsed = default_timer() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def run_date_benchmark():
+    date_strings = collect_date_strings()
+    print "%-24s%12s" % ("%d dates" % len(date_strings), "per date")
+
+    for name, to_timestamp in [
+        ("dateutil", lambda date_string: dateutil_parse(date_string).strftime("%s")),
+        ("parse_timestamp()", dates.parse_timestamp),
+        ("timestamp_from_string()", dates.timestamp_from_string)]:
+        elapsed = time_dates(date_strings, to_timestamp)
+        print "%-24s%10.1fus" % (name, elapsed * 1e6 / len(date_strings))
+
+#-- Scoreboards
+# How many times the games of the scoreboard fixtures are repeated
+SCOREBOARD_COPIES = 20
+
+_table_re = re.compile(r"<table[^>]*>(.*)</table>", re.DOTALL)
+_section_title_re = re.compile(r'(shsSubSectionRow"><td[^>]*>)([^<]*)')
+
+def synthetic_scoreboard(copies=SCOREBOARD_COPIES):
+    """
+    Returns the markup of a scoreboard holding every game of every
+    scoreboard fixture, each copy in sections of its own.
+    """
+    tables = []
+
+    for file_name in sorted(FIXTURES):
+        soup_kwargs, parser_func = FIXTURES[file_name]
+
+        if parser_func is scores.parse_scores_soup:
+            markup = slice_markup(read_fixture_bytes(file_name), "utf-8", **soup_kwargs)
+            tables.append(_table_re.search(markup).group(1))
+
+    body = []
+
+    for i in xrange(copies):
+        for table in tables:
+            body.append(_section_title_re.sub(lambda match: u"%s%s %d" % (match.group(1), match.group(2), i), table))
+
+    return u'<table class="shsTable">%s</table>' % u''.join(body)
+
+def multi_pass_parse_scores_soup(soup):
+    """
+    The scoreboard parser scores_helper() used before
+    parse_scores_rows(), kept as it was, quirks and all, to measure the
+    new one against. It counts the rows first, like scores_helper() did,
+    and looks them up again to parse them.
+    """
+    len(soup("tr"))
+
+    stack = {}
+    vals = []
+    section = ''
+    team = None
+    has_the_status_cell = False
+
+    for row in soup("tr"):
+
+        # Rows which have team names do not have .
+        # This test must be first.
+        if row.get("class") is None:
+            cells = row("td")
+            has_the_status_cell = False
+
+            # Does this row have a status row?
+            if any(css_class in "shsMiniStatus" for cell in cells for css_class in cell.get("class") ):
+                has_the_status_cell = True
+
+            if len(cells) >= 2:
+
+                team = "home" if team is "away" or None else "away"
+
+                # If the list of values is empty, then initialize it
+                if not vals:
+                    vals.append({"away": None, "home":None})
+
+                # If the list is complete, then append a new item
+                # indicating a new game.
+                elif vals[-1]["away"] and vals[-1]["home"]:
+                    vals.append({"away": None, "home":None})
+
+                # Add scoring information for the game.
+                vals[-1][team] = {
+                    "team": link_text(cells[0]),
+                    "score": cell_text(cells[1])
+                }
+
+                try:
+                    # Try to convert the string to an int.
+                    vals[-1][team]["score"] = int(vals[-1][team]["score"])
+                except (ValueError, TypeError):
+                    # If it fails, assign null
+                    vals[-1][team]["score"] = None
+
+                if has_the_status_cell:
+                    status = cells[2].find('a')
+
+                    # Arbitrary game information, such as "OT" for
+                    # overtime
+                    extra = cells[2].find('br')
+
+                    time = cells[2].find(name="span", attrs={"class" : "shsTimezone shsGMTZone"})
+
+                    # Set the status only if not null
+                    if status:
+                        vals[-1]["status"] = status.extract().text.strip().encode("utf-8")
+                        if 2 == len(vals[-1]["status"].split('-')):
+                            # Save the string to the right of '-' in
+                            # extra
+                            if not extra:
+                                extra = vals[-1]["status"].split('-')[1].strip()
+                            vals[-1]["status"] = vals[-1]["status"].split('-')[0].strip()
+
+                        vals[-1]["status"] = vals[-1]["status"].lower()
+
+                    if time:
+                        vals[-1]["time"] = time.extract().text.strip().encode("utf-8")
+
+                    if extra:
+                        # Sometimes, extra is a <br>
+                        if isinstance(extra, Tag):
+                            vals[-1]["extra"] = scores.text_after_break(extra).strip().encode("utf-8")
+
+                        # While other times, it's just a str
+                        else:
+                            vals[-1]["extra"] = extra
+
+                        vals[-1]["extra"] = vals[-1]["extra"].lower()
+
+        # Skip over the first line, it's the title
+        elif "shsTableTtlRow" in row.get("class"):
+            continue
+
+        elif any(css_class in "shsTableSubttlRow shsSubSectionRow shsMiniRowSpacer" for css_class in row.get("class")):
+            cell = row("td")
+            section = cell_text(cell[0])
+
+            # Are the scores separated into sections? If so, find the
+            # separator
+            if section:
+                section = slugify(text=unicode(section, "utf-8"), delimiter=u'_')
+                if vals:
+                    stack[section] = vals
+                    vals = []
+                stack[section] = None
+
+    # Save the last value
+    else:
+        if section:
+            stack[section] = vals
+        else:
+            stack = vals
+
+    del vals
+
+    return stack
+
+def single_pass_parse_scores_soup(soup):
+    """
+    What scores_helper() does now: looks up the rows once, counts them
+    and parses them.
+    """
+    rows = soup("tr")
+    len(rows)
+
+    return scores.parse_scores_rows(rows)
+
+# The scoreboard parsers, old and new
+SCOREBOARD_PARSERS = [
+    ("multi-pass", multi_pass_parse_scores_soup),
+    ("single pass", single_pass_parse_scores_soup)
+]
+
+def parse_scoreboard_json(markup, backend, parse):
+    """
+    Returns the JSON a scoreboard parser comes up with.
+    """
+    soup = help_make_soup(markup, backend=backend, class_attrs="shsTable")
+
+    return json.dumps(parse(soup), sort_keys=True)
+
+def time_scoreboard(markup, backend, parse):
+    """
+    Returns the best time, in seconds, of parsing a scoreboard. Building
+    the soup isn't timed. Both parsers take parts out of the soup, so
+    each time gets a soup of its own.
+    """
+    best = None
+
+    for i in xrange(REPEAT):
+        soup = help_make_soup(markup, backend=backend, class_attrs="shsTable")
+
+        started = default_timer()
+        parse(soup)
+        elapsed = default_timer() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def run_scoreboard_benchmark():
+    markup = synthetic_scoreboard()
+    games = markup.count("shsMiniStatus")
+    print "%-26s%12s%12s" % ("%d games" % games, "total", "per game")
+
+    for backend in installed_backends():
+        for name, parse in SCOREBOARD_PARSERS:
+            elapsed = time_scoreboard(markup, backend, parse)
+            print "%-26s%10.1fms%10.1fus" % ("%s, %s" % (backend, name), elapsed * 1000, elapsed * 1e6 / games)
+
+#-- Parse offloading
+# The page parsed, and how many of it are parsed at once, as though for
+# as many requests
+OFFLOAD_FIXTURE = "tennis_rankings_wta.html"
+OFFLOAD_PARSES = 4
+
+# How often the stand-in for a quick request wakes up, in seconds
+TICK = 0.001
+
+def time_concurrent_parses(parse):
+    """
+    Runs OFFLOAD_PARSES parses on as many threads while another thread
+    wakes up every TICK seconds. Returns how long the parses took and
+    how long the other thread overslept altogether, both in seconds.
+    """
+    markup = read_fixture(OFFLOAD_FIXTURE)
+    args = (parse_rows_markup, markup, rankings.parse_tennis_soup, (), "lxml", {})
+    done = Event()
+    stalls = []
+
+    def tick():
+        while not done.is_set():
+            started = default_timer()
+            sleep(TICK)
+            stalls.append(default_timer() - started - TICK)
+
+    ticker = Thread(target=tick)
+    ticker.start()
+
+    started = default_timer()
+    threads = [Thread(target=parse, args=args) for i in xrange(OFFLOAD_PARSES)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    elapsed = default_timer() - started
+    done.set()
+    ticker.join()
+
+    return elapsed, sum(stalls)
+
+def run_offload_benchmark():
+    offload.start_pool()
+
+    print "%-14s%12s%12s" % ("%d parses" % OFFLOAD_PARSES, "total", "held up")
+
+    for name, parse in (("in place", lambda func, *args: func(*args)), ("offloaded", offload.run)):
+        elapsed, stall = time_concurrent_parses(parse)
+        print "%-14s%10.1fms%10.1fms" % (name, elapsed * 1000, stall * 1000)
+
+class ParserBackendTestCase(unittest.TestCase):
+    def test_every_fixture_is_covered(self):
+        """Every fixture has a parser"""
+        self.assertEqual(sorted(os.listdir(FIXTURES_DIR)), sorted(FIXTURES))
+
+    def test_identical_output(self):
+        """Every backend yields the same parsed output"""
+        backends = installed_backends()
+
+        for file_name in sorted(FIXTURES):
+            expected = parse_fixture(file_name, backends[0])
+
+            for backend in backends[1:]:
+                self.assertEqual(
+                    expected,
+                    parse_fixture(file_name, backend),
+                    "%s differs between %s and %s" % (file_name, backends[0], backend)
+                )
+
+    def test_identical_streamed_output(self):
+        """Streaming the rows yields the same parsed output as a soup"""
+        backend = installed_backends()[0]
+
+        for file_name in sorted(FIXTURES):
+            if not can_stream(file_name):
+                continue
+
+            self.assertEqual(
+                parse_fixture(file_name, backend),
+                parse_fixture(file_name, STREAM_BACKEND),
+                "%s differs between %s and %s" % (file_name, backend, STREAM_BACKEND)
+            )
+
+    def test_identical_sliced_output(self):
+        """Slicing the page first yields the same parsed output"""
+        for backend in installed_backends() + [STREAM_BACKEND]:
+            for file_name in sorted(FIXTURES):
+                if STREAM_BACKEND == backend and not can_stream(file_name):
+                    continue
+
+                self.assertEqual(
+                    parse_fixture(file_name, backend),
+                    parse_fixture(file_name, backend, sliced=True),
+                    "%s differs when sliced with %s" % (file_name, backend)
+                )
+
+    def test_identical_scoreboard_output(self):
+        """Every backend yields the same synthetic scoreboard"""
+        markup = synthetic_scoreboard(2)
+        backends = installed_backends()
+        expected = scores.parse_scores_soup(help_make_soup(markup, backend=backends[0], class_attrs="shsTable"))
+
+        for backend in backends[1:]:
+            self.assertEqual(
+                expected,
+                scores.parse_scores_soup(help_make_soup(markup, backend=backend, class_attrs="shsTable")),
+                "The synthetic scoreboard differs between %s and %s" % (backends[0], backend)
+            )
+
+    def test_scoreboard_same_as_multi_pass(self):
+        """The single pass scoreboard parser yields the same JSON as the multi-pass one"""
+        markups = [synthetic_scoreboard(2)]
+
+        for file_name in sorted(FIXTURES):
+            soup_kwargs, parser_func = FIXTURES[file_name]
+
+            if parser_func is scores.parse_scores_soup:
+                markups.append(slice_markup(read_fixture_bytes(file_name), "utf-8", **soup_kwargs))
+
+        for backend in installed_backends():
+            for markup in markups:
+                self.assertEqual(
+                    parse_scoreboard_json(markup, backend, multi_pass_parse_scores_soup),
+                    parse_scoreboard_json(markup, backend, single_pass_parse_scores_soup),
+                    "The scoreboard parsers differ with %s" % backend
+                )
+
+class DateTestCase(unittest.TestCase):
+    def test_same_timestamps_as_dateutil(self):
+        """The known date formats yield the same timestamps as dateutil"""
+        for date_string in collect_date_strings() + DATE_STRINGS:
+            self.assertEqual(
+                dateutil_parse(date_string).strftime("%s"),
+                dates.parse_timestamp(date_string),
+                date_string
+            )
+
+if __name__ == '__main__':
+    run_benchmark()
+    print
+    run_cell_benchmark()
+    print
+    run_date_benchmark()
+    print
+    run_scoreboard_benchmark()
+    print
+    run_offload_benchmark()
+    unittest.main()
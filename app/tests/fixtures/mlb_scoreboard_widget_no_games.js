@@ -0,0 +1 @@
+document.write('<div id="shsMiniBody"><div id="shsMultisportScoreboard"><table class="shsTable"><tr class="shsTableTtlRow"><td colspan="3"><a href="http://stats.nesn.com/mlb/scoreboard.asp">MLB Scoreboard</a></td></tr></table></div></div>');
\ No newline at end of file
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Test Support
+    ~~~~~~~~~~~~
+
+    Lets tests send requests through the views without going to STATS.
+    While a FixtureUpstream is installed, every page the views fetch
+    comes out of app/tests/fixtures:
+
+    upstream = FixtureUpstream()
+    upstream.install()
+    ...
+    upstream.uninstall()
+
+    Only the MLB pages are served.
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+from threading import Lock
+from app import helpers
+from app.upstream import Page, fetch_page
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# The fixture for each page at STATS, by the end of its path and the
+# "type" query string argument
+FIXTURE_PAGES = {
+    ("mlb/standings.asp", None) : "mlb_standings.html",
+    ("mlb/teams.asp", None) : "mlb_teams.html",
+    ("mlb/teamstats.asp", "roster") : "mlb_roster.html",
+    ("multisport/today.js.asp", None) : "mlb_scoreboard_widget.js"
+}
+
+class FixtureUpstream(object):
+    """
+    Stands in for fetch_page(), answering with fixtures. Remembers every
+    URL it was asked for, and raises an IOError while "failing" is set,
+    as though STATS were down.
+
+    :param pages: Fixtures to answer with instead of FIXTURE_PAGES
+    :type pages: dict
+    """
+    def __init__(self, pages=None):
+        self.pages = FIXTURE_PAGES if pages is None else pages
+        self.fetched = []
+        self.failing = False
+        self._lock = Lock()
+
+    def __call__(self, url, params=None, until=None):
+        with self._lock:
+            self.fetched.append(url)
+
+        if self.failing:
+            raise IOError("STATS is down")
+
+        for (path, page_type), file_name in self.pages.items():
+            if url.endswith(path) and page_type == (params or {}).get("type"):
+                with open(os.path.join(FIXTURES_DIR, file_name), "rb") as f:
+                    return Page(content=f.read(), encoding="utf-8"), True
+
+        raise IOError("No fixture for %s" % url)
+
+    def install(self):
+        helpers.fetch_page = self
+
+    def uninstall(self):
+        helpers.fetch_page = fetch_page
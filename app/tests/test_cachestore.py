@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Cache Store Tests
+    ~~~~~~~~~~~~~~~~~
+
+    Checks the per-worker LRU of a TieredCache: how long it keeps an
+    entry, which entries it evicts first and that it drops entries other
+    workers stored. Two TieredCaches in the same process stand in for
+    two workers. See app/cachestore.py.
+
+    These run against the Redis server the application uses, under keys
+    of their own.
+
+    $ (venv) python -m unittest app.tests.test_cachestore
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import unittest
+from time import time, sleep
+from uuid import uuid4
+from redis.exceptions import ConnectionError
+from app import redis
+from app.cachestore import CompactRedisCache, TieredCache, REDIS_CHANNEL_INVALIDATE
+
+L1_SIZE = 2
+L1_TIMEOUT = 10
+
+# The most seconds to wait for an invalidation to arrive
+INVALIDATE_TIMEOUT = 5
+
+class UnreachableRedis(object):
+    """
+    Stands in for a Redis server which can't be reached.
+    """
+    def pipeline(self, transaction=True):
+        return self
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            raise ConnectionError("Unreachable")
+
+        return command
+
+class TieredCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.l2 = CompactRedisCache(redis, key_prefix="test:%s:" % uuid4().hex)
+
+    def tearDown(self):
+        self.l2.clear()
+
+    def worker(self):
+        return TieredCache(self.l2, redis, L1_SIZE, L1_TIMEOUT)
+
+    def in_l1(self, cache, key):
+        with cache._lock:
+            return key in cache._l1
+
+    def subscribers(self):
+        # PUBSUB NUMSUB answers with the channel, then its subscribers
+        return int(redis.execute_command("PUBSUB", "NUMSUB", REDIS_CHANNEL_INVALIDATE)[1])
+
+    def test_l1_never_outlives_l2(self):
+        """An entry leaves L1 no later than it expires in L2"""
+        cache = self.worker()
+        self.l2.set("a", {"value" : 1}, timeout=2)
+
+        self.assertEqual({"value" : 1}, cache.get("a"))
+        self.assertLessEqual(cache._l1["a"][1], time() + 2)
+
+        cache.set("b", {"value" : 2}, timeout=L1_TIMEOUT * 10)
+
+        self.assertLessEqual(cache._l1["b"][1], time() + L1_TIMEOUT)
+
+    def test_least_recently_used_evicted(self):
+        """L1 evicts whatever was used least recently"""
+        cache = self.worker()
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertTrue(self.in_l1(cache, "a"))
+        self.assertFalse(self.in_l1(cache, "b"))
+        self.assertTrue(self.in_l1(cache, "c"))
+
+        # Still in L2
+        self.assertEqual(2, cache.get("b"))
+
+    def test_stored_values_are_copied(self):
+        """Changing a value after storing it doesn't change L1"""
+        cache = self.worker()
+        value = {"data" : [1]}
+        cache.set("a", value)
+        value["data"].append(2)
+
+        self.assertEqual({"data" : [1]}, cache.get("a"))
+
+    def test_set_without_redis(self):
+        """An entry which can't be written to L2 is still kept in L1"""
+        cache = self.worker()
+        cache.redis = UnreachableRedis()
+        cache.set("a", {"value" : 1})
+
+        self.assertEqual({"value" : 1}, cache._l1["a"][0])
+
+    def test_invalidated_by_other_workers(self):
+        """An entry another worker stores is dropped from L1"""
+        subscribers = self.subscribers()
+        first = self.worker()
+        second = self.worker()
+
+        first.set("a", "old")
+        self.assertEqual("old", first.get("a"))
+        self.assertEqual("old", second.get("a"))
+
+        # Each worker's first get() subscribes in the background
+        deadline = time() + INVALIDATE_TIMEOUT
+
+        while self.subscribers() < subscribers + 2 and time() < deadline:
+            sleep(0.01)
+
+        first.set("a", "new")
+
+        while self.in_l1(second, "a") and time() < deadline:
+            sleep(0.01)
+
+        self.assertEqual("new", second.get("a"))
+
+        # Nobody drops what they stored themselves
+        self.assertTrue(self.in_l1(first, "a"))
+
+if __name__ == '__main__':
+    unittest.main()
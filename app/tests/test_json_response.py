@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    JSON Response Tests
+    ~~~~~~~~~~~~~~~~~~~
+
+    Checks that a cache hit is answered with the JSON it was stored with,
+    its age and whether it's stale filled in, and gzipped the same. See
+    json_response().
+
+    Like the application itself, these need a running Redis server.
+
+    $ (venv) python -m unittest app.tests.test_json_response
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import json
+import zlib
+import unittest
+from time import time
+from uuid import uuid4
+from flask import jsonify
+from app import app, cache
+from app.utils import (prepare_json_output, cache_data, fetch_cached_data, json_response,
+    rebuild_cached_payload)
+
+class JSONResponseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache_key = uuid4().hex
+
+        with app.test_request_context("/"):
+            cache_data(data=prepare_json_output([{"name" : u"Été"}]), cache_key=self.cache_key)
+
+    def tearDown(self):
+        cache.delete(self.cache_key)
+
+    def respond(self, headers=None, rebuild=None):
+        with app.test_request_context("/", headers=headers):
+            rv = fetch_cached_data(self.cache_key)
+
+            if rebuild is not None:
+                rv = rebuild_cached_payload(rv, rebuild)
+
+            return json_response(rv)
+
+    def test_hit(self):
+        """A hit says it came from the cache, how old it is and that it's fresh"""
+        rv = self.respond()
+        meta = json.loads(rv.data)["meta"]
+
+        self.assertEqual("HIT", rv.headers["X-Cache"])
+        self.assertTrue(meta["loaded_from_cache"])
+        self.assertFalse(meta["stale"])
+        self.assertEqual(int(rv.headers["Age"]), meta["age"])
+
+    def test_same_as_jsonify(self):
+        """A hit is the same JSON jsonify() would have sent"""
+        rv = self.respond()
+
+        with app.test_request_context("/"):
+            self.assertEqual(jsonify(json.loads(rv.data)).data, rv.data)
+
+    def test_stale(self):
+        """A stale hit says so"""
+        entry = cache.get(self.cache_key)
+        cache.set(self.cache_key, dict(entry, stored_at=time() - 60, expires_at=time() - 1))
+
+        rv = self.respond()
+        meta = json.loads(rv.data)["meta"]
+
+        self.assertEqual("STALE", rv.headers["X-Cache"])
+        self.assertTrue(meta["stale"])
+        self.assertGreaterEqual(meta["age"], 60)
+
+    def test_gzipped(self):
+        """A gzipped hit holds the same JSON"""
+        rv = self.respond({"Accept-Encoding" : "gzip"})
+
+        self.assertEqual("gzip", rv.headers["Content-Encoding"])
+        self.assertEqual(self.respond().data, zlib.decompress(rv.data, 16 + zlib.MAX_WBITS))
+
+    def test_rebuilt(self):
+        """A payload rebuilt from a hit is still a hit"""
+        rv = self.respond(rebuild={"message" : "No games"})
+
+        self.assertEqual("HIT", rv.headers["X-Cache"])
+        self.assertEqual({"message" : "No games"}, json.loads(rv.data))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Offload Tests
+    ~~~~~~~~~~~~~
+
+    Checks that a page parsed in a worker process comes out the same as
+    one parsed in place, that pages are sized in bytes, and that a worker
+    gives up on a page which takes too long. See app/offload.py. How much
+    the offload helps is measured by the benchmarks.
+
+    Like the application itself, these need a running Redis server.
+
+    $ (venv) python -m unittest app.tests.test_offload
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import unittest
+from app import app, offload
+from app.helpers import parse_rows_markup
+from app.views import rankings
+from app.tests.benchmarks import read_fixture
+
+FIXTURE = "tennis_rankings_wta.html"
+
+class OffloadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.config = dict(app.config)
+        self.markup = read_fixture(FIXTURE)
+        self.args = (parse_rows_markup, self.markup, rankings.parse_tennis_soup, (), "lxml", {})
+
+    def tearDown(self):
+        app.config.update(self.config)
+
+    def test_identical_output(self):
+        """A page parsed in a worker comes out the same as in place"""
+        self.assertEqual(self.args[0](*self.args[1:]), offload.run(*self.args))
+
+    def test_sized_in_bytes(self):
+        """Pages are offloaded by their size in UTF-8, not in characters"""
+        app.config["PARSE_OFFLOAD"] = True
+        app.config["PARSE_OFFLOAD_MIN_BYTES"] = 4
+
+        self.assertFalse(offload.should_offload(u"abc"))
+        self.assertTrue(offload.should_offload(u"abcd"))
+        self.assertTrue(offload.should_offload(u"été"))
+
+    def test_worker_gives_up(self):
+        """A page which takes too long raises ParseTimeout"""
+        app.config["PARSE_OFFLOAD_TIMEOUT"] = 0.001
+
+        self.assertRaises(offload.ParseTimeout, offload.run, *self.args)
+
+        # The worker is free for the next page
+        app.config["PARSE_OFFLOAD_TIMEOUT"] = self.config["PARSE_OFFLOAD_TIMEOUT"]
+
+        self.assertEqual(self.args[0](*self.args[1:]), offload.run(*self.args))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Pre-warm Tests
+    ~~~~~~~~~~~~~~
+
+    Checks when a pre-warmed route is refreshed: shortly before its cache
+    object goes stale, not at all when another worker already refreshed
+    it, and again PREWARM_RETRY seconds after a failure. See
+    app/prewarm.py.
+
+    Like the application itself, these need a running Redis server.
+
+    $ (venv) python -m unittest app.tests.test_prewarm
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import unittest
+from time import time
+from app import app, cache
+from app.prewarm import Job, _run
+from app.utils import build_cache_key
+from app.tests.support import FixtureUpstream
+
+ROUTE = "/standings/mlb/"
+
+class PrewarmTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache_key = build_cache_key(sport="mlb", resource="standings")
+        self.upstream = FixtureUpstream()
+        self.upstream.install()
+
+        cache.delete(self.cache_key)
+
+    def tearDown(self):
+        self.upstream.uninstall()
+
+        cache.delete(self.cache_key)
+
+    def run_job(self):
+        job = Job(ROUTE, time())
+        _run(job)
+
+        return job
+
+    def test_refreshed_before_expiry(self):
+        """A route is due again shortly before its data goes stale"""
+        job = self.run_job()
+        expires_at = cache.get(self.cache_key)["expires_at"]
+
+        self.assertIsNone(job.last_error)
+        self.assertEqual(1, len(self.upstream.fetched))
+        self.assertLess(job.next_run, expires_at - app.config["PREWARM_LEAD"])
+        self.assertGreaterEqual(
+            job.next_run,
+            expires_at - app.config["PREWARM_LEAD"] - app.config["PREWARM_JITTER"]
+        )
+
+    def test_fresh_data_is_left_alone(self):
+        """A route another worker just refreshed isn't scraped again"""
+        first = self.run_job()
+        second = self.run_job()
+
+        self.assertIsNone(second.last_error)
+        self.assertEqual(1, len(self.upstream.fetched))
+        self.assertLess(second.next_run, cache.get(self.cache_key)["expires_at"])
+        self.assertGreater(second.next_run, first.last_refresh + app.config["PREWARM_RETRY"])
+
+    def test_short_lived_data(self):
+        """Data cached for less than the lead and jitter isn't scraped by every worker"""
+        self.run_job()
+
+        # As a live scoreboard another worker just refreshed
+        entry = cache.get(self.cache_key)
+        cache.set(self.cache_key, dict(entry, stored_at=time(), expires_at=time() + 30))
+
+        job = Job(ROUTE, time())
+        job.ttl = 30
+        _run(job)
+
+        self.assertIsNone(job.last_error)
+        self.assertEqual(1, len(self.upstream.fetched))
+        self.assertGreater(job.next_run, job.last_refresh + app.config["PREWARM_MIN_INTERVAL"])
+        self.assertLess(job.next_run, cache.get(self.cache_key)["expires_at"])
+
+    def test_retried_after_failure(self):
+        """A route which failed to refresh is tried again after PREWARM_RETRY"""
+        self.upstream.failing = True
+        job = self.run_job()
+
+        self.assertIsNotNone(job.last_error)
+        self.assertIsNone(cache.get(self.cache_key))
+        self.assertGreaterEqual(job.next_run, job.last_refresh + app.config["PREWARM_RETRY"])
+
+        self.upstream.failing = False
+        _run(job)
+
+        self.assertIsNone(job.last_error)
+        self.assertEqual(2, job.runs)
+        self.assertIsNotNone(cache.get(self.cache_key))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Scores Tests
+    ~~~~~~~~~~~~
+
+    Checks how long a scoreboard is cached for, given its day and the
+    state of its games, and each league's exceptions to the defaults,
+    and that every scoreboard reports it. See choose_scoreboard_ttl()
+    and scoreboard_ttl_rules().
+
+    Importing the views imports the application, so these need a
+    running Redis server too.
+
+    $ (venv) python -m unittest app.tests.test_scores
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import json
+import unittest
+from datetime import date, timedelta
+from app import app, cache
+from app.helpers import scoreboard_ttl_rules, stats_date_string
+from app.utils import build_cache_key
+from app.tests.support import FixtureUpstream, FIXTURE_PAGES
+from app.views.scores import (choose_scoreboard_ttl, game_state, DEFAULT_TTL,
+    STATE_UPCOMING, STATE_LIVE, STATE_FINAL, STATE_UNKNOWN)
+
+UPCOMING = {"status" : "7:05 pm et"}
+LIVE = {"status" : "top 5th"}
+FINAL = {"status" : "final"}
+UNKNOWN = {"status" : "suspended"}
+
+SCORES_PATH = "/scores/mlb/"
+
+class GameStateTestCase(unittest.TestCase):
+    def assertState(self, state, status):
+        self.assertEqual(state, game_state({"status" : status}))
+
+    def test_upcoming(self):
+        """Games with a start time, or none at all, have yet to start"""
+        self.assertState(STATE_UPCOMING, None)
+        self.assertState(STATE_UPCOMING, "7:05 pm et")
+        self.assertState(STATE_UPCOMING, "1:00 et")
+        self.assertState(STATE_UPCOMING, "preview")
+
+    def test_live(self):
+        """Games in an inning or a period are in progress"""
+        self.assertState(STATE_LIVE, "top 5th")
+        self.assertState(STATE_LIVE, "end 9th")
+        self.assertState(STATE_LIVE, "12:34 2nd")
+        self.assertState(STATE_LIVE, "3rd")
+        self.assertState(STATE_LIVE, "halftime")
+        self.assertState(STATE_LIVE, "ot")
+        self.assertState(STATE_LIVE, "67'")
+        self.assertState(STATE_LIVE, "90+3'")
+
+    def test_final(self):
+        """Games which are over, or won't be played, are final"""
+        self.assertState(STATE_FINAL, "final")
+        self.assertState(STATE_FINAL, "final/ot")
+        self.assertState(STATE_FINAL, "postponed")
+
+    def test_unknown(self):
+        """Statuses which aren't recognised aren't taken to be live"""
+        self.assertState(STATE_UNKNOWN, "suspended")
+        self.assertState(STATE_UNKNOWN, "")
+
+class ScoreboardTTLTestCase(unittest.TestCase):
+    def setUp(self):
+        self.today = date.today()
+        self.rules = scoreboard_ttl_rules()
+
+    def assertRule(self, rule, the_date, games, league="mlb"):
+        self.assertEqual((self.rules[league][rule], rule), choose_scoreboard_ttl(league, the_date, games))
+
+    def test_live(self):
+        """A game in progress makes the day live"""
+        self.assertRule("live", self.today, [FINAL, LIVE, UPCOMING])
+
+    def test_upcoming(self):
+        """Today is upcoming while any game has yet to start"""
+        self.assertRule("upcoming", self.today, [FINAL, UPCOMING])
+
+    def test_final(self):
+        """Today is final once every game is over"""
+        self.assertRule("final", self.today, [FINAL, FINAL])
+
+    def test_no_games(self):
+        """Today with nothing scheduled has no games"""
+        self.assertRule("no_games", self.today, [])
+
+    def test_future(self):
+        """A day after today is in the future"""
+        self.assertRule("future", self.today + timedelta(days=1), [UPCOMING])
+
+    def test_past(self):
+        """A day before today, with every game over, is in the past"""
+        self.assertRule("past", self.today - timedelta(days=1), [FINAL, FINAL])
+        self.assertRule("past", self.today - timedelta(days=1), [])
+
+    def test_past_with_start_times(self):
+        """A day before today, with a game still showing its start time, is unsettled"""
+        self.assertRule("unsettled", self.today - timedelta(days=1), [FINAL, UPCOMING])
+
+    def test_unknown_status(self):
+        """A game whose status isn't recognised makes the day unsettled"""
+        self.assertRule("unsettled", self.today - timedelta(days=1), [FINAL, UNKNOWN])
+        self.assertRule("unsettled", self.today, [FINAL, UNKNOWN])
+        self.assertLess(self.rules["mlb"]["unsettled"], self.rules["mlb"]["past"])
+
+    def test_unknown_league(self):
+        """A league without rules gets the default TTL"""
+        self.assertEqual((DEFAULT_TTL, "default"), choose_scoreboard_ttl("xfl", self.today, [LIVE]))
+
+    def test_nfl_future(self):
+        """NFL games are scheduled well ahead, so future days are cached longer"""
+        self.assertRule("future", self.today + timedelta(days=7), [UPCOMING], league="nfl")
+        self.assertGreater(self.rules["nfl"]["future"], self.rules["mlb"]["future"])
+
+    def test_soccer_live(self):
+        """MLS and EPL games in progress are cached longer"""
+        for league in ("mls", "epl"):
+            self.assertRule("live", self.today, [LIVE], league=league)
+            self.assertGreater(self.rules[league]["live"], self.rules["mlb"]["live"])
+
+class ScoreboardMetaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        self.cache_key = build_cache_key(sport="mlb", date=stats_date_string(), params={}, resource="scores")
+        self.rules = scoreboard_ttl_rules()["mlb"]
+
+        cache.delete(self.cache_key)
+
+    def tearDown(self):
+        self.upstream.uninstall()
+
+        cache.delete(self.cache_key)
+
+    def get_twice(self, pages=None):
+        self.upstream = FixtureUpstream(pages)
+        self.upstream.install()
+
+        first = self.client.get(SCORES_PATH)
+        second = self.client.get(SCORES_PATH)
+
+        self.assertEqual("MISS", first.headers["X-Cache"])
+        self.assertEqual("HIT", second.headers["X-Cache"])
+
+        return json.loads(first.data), json.loads(second.data)
+
+    def test_ttl_reported(self):
+        """A scoreboard reports its TTL, whether it was scraped or cached"""
+        for rv in self.get_twice():
+            self.assertIn(rv["meta"]["ttl_rule"], self.rules)
+            self.assertEqual(self.rules[rv["meta"]["ttl_rule"]], rv["meta"]["ttl"])
+
+    def test_no_games_ttl_reported(self):
+        """A day without games reports its TTL too"""
+        pages = dict(FIXTURE_PAGES)
+        pages[("multisport/today.js.asp", None)] = "mlb_scoreboard_widget_no_games.js"
+
+        for rv in self.get_twice(pages):
+            self.assertIn("message", rv)
+            self.assertEqual("no_games", rv["meta"]["ttl_rule"])
+            self.assertEqual(self.rules["no_games"], rv["meta"]["ttl"])
+
+if __name__ == '__main__':
+    unittest.main()
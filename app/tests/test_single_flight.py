@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Single Flight Tests
+    ~~~~~~~~~~~~~~~~~~~
+
+    Checks that requests which miss the cache on the same key while it
+    is being scraped wait for that scrape rather than scraping too, and
+    that they stop waiting after SINGLE_FLIGHT_TIMEOUT seconds. See
+    fetch_cached_data().
+
+    Like the application itself, these need a running Redis server.
+
+    $ (venv) python -m unittest app.tests.test_single_flight
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import unittest
+from time import time, sleep
+from uuid import uuid4
+from threading import Event, Lock, Thread
+from flask import g
+from app import app, cache
+from app.utils import prepare_json_output, cache_data, fetch_cached_data, flight_stats
+
+# Long enough for a waiting thread to reach the wait
+SETTLE_TIME = 0.2
+
+class SingleFlightTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache_key = uuid4().hex
+        self.single_flight_timeout = app.config["SINGLE_FLIGHT_TIMEOUT"]
+        self.scrapes = 0
+        self.lock = Lock()
+        self.cached_until = None
+
+    def tearDown(self):
+        app.config["SINGLE_FLIGHT_TIMEOUT"] = self.single_flight_timeout
+        cache.delete(self.cache_key)
+
+    def request(self, results, missed=None, release=None, refresh=False):
+        """
+        Looks up the cache like a view does, scraping on a miss. A
+        scrape waits for release before caching anything. A refresh
+        looks it up like replay_request() does.
+        """
+        with app.test_request_context("/"):
+            if refresh:
+                g.refreshing = True
+                g.keep_until = time()
+
+            rv = fetch_cached_data(self.cache_key)
+
+            if rv is None:
+                with self.lock:
+                    self.scrapes += 1
+
+                if missed is not None:
+                    missed.set()
+
+                if release is not None:
+                    release.wait()
+
+                rv = prepare_json_output(["scraped"])
+                cache_data(data=rv, cache_key=self.cache_key)
+
+            results.append(rv["data"])
+
+            if refresh:
+                self.cached_until = getattr(g, "cached_until", None)
+
+    def start(self, *args):
+        thread = Thread(target=self.request, args=args)
+        thread.daemon = True
+        thread.start()
+
+        return thread
+
+    def test_concurrent_misses_scrape_once(self):
+        """Two concurrent misses on the same key scrape STATS once"""
+        coalesced = flight_stats()["coalesced"]
+        results = []
+        missed = Event()
+        release = Event()
+
+        leader = self.start(results, missed, release)
+        self.assertTrue(missed.wait(5))
+
+        waiter = self.start(results)
+        sleep(SETTLE_TIME)
+
+        # The waiter is still waiting on the leader's scrape
+        self.assertEqual([], results)
+
+        release.set()
+        leader.join(5)
+        waiter.join(5)
+
+        self.assertEqual(1, self.scrapes)
+        self.assertEqual([["scraped"], ["scraped"]], results)
+        self.assertEqual(coalesced + 1, flight_stats()["coalesced"])
+
+    def test_refresh_joins_flight(self):
+        """A refresh which waits on another scrape knows when its data goes stale"""
+        results = []
+        missed = Event()
+        release = Event()
+
+        leader = self.start(results, missed, release)
+        self.assertTrue(missed.wait(5))
+
+        waiter = self.start(results, None, None, True)
+        sleep(SETTLE_TIME)
+
+        release.set()
+        leader.join(5)
+        waiter.join(5)
+
+        self.assertEqual(1, self.scrapes)
+        self.assertEqual(cache.get(self.cache_key)["expires_at"], self.cached_until)
+
+    def test_waiter_gives_up(self):
+        """A miss waits at most SINGLE_FLIGHT_TIMEOUT, then scrapes too"""
+        app.config["SINGLE_FLIGHT_TIMEOUT"] = SETTLE_TIME
+        timed_out = flight_stats()["timed_out"]
+        results = []
+        missed = Event()
+        release = Event()
+
+        leader = self.start(results, missed, release)
+        self.assertTrue(missed.wait(5))
+
+        started = time()
+        self.request(results)
+        waited = time() - started
+
+        release.set()
+        leader.join(5)
+
+        self.assertGreaterEqual(waited, SETTLE_TIME)
+        self.assertLess(waited, 5)
+        self.assertEqual(2, self.scrapes)
+        self.assertEqual(timed_out + 1, flight_stats()["timed_out"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Stale Data Tests
+    ~~~~~~~~~~~~~~~~
+
+    Checks what /standings/mlb/ answers once its cache object is past its
+    expiry: the stale object while it's refreshed in the background with
+    CACHE_STALE_WHILE_REVALIDATE on, and the stale object when the scrape
+    fails with it off. See fetch_cached_data().
+
+    Like the application itself, these need a running Redis server.
+
+    $ (venv) python -m unittest app.tests.test_stale
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import unittest
+from time import time, sleep
+from app import app, cache
+from app.utils import build_cache_key
+from app.tests.support import FixtureUpstream
+
+PATH = "/standings/mlb/"
+
+# The most seconds to wait for a background refresh
+REFRESH_TIMEOUT = 5
+
+class StaleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.stale_while_revalidate = app.config["CACHE_STALE_WHILE_REVALIDATE"]
+        self.cache_key = build_cache_key(sport="mlb", resource="standings")
+        self.client = app.test_client()
+        self.upstream = FixtureUpstream()
+        self.upstream.install()
+
+        cache.delete(self.cache_key)
+
+    def tearDown(self):
+        app.config["CACHE_STALE_WHILE_REVALIDATE"] = self.stale_while_revalidate
+        self.upstream.uninstall()
+
+        cache.delete(self.cache_key)
+
+    def go_stale(self):
+        """
+        Moves the expiry of the cached standings into the past.
+        """
+        entry = cache.get(self.cache_key)
+        cache.set(self.cache_key, dict(entry, expires_at=time() - 1))
+
+    def wait_for_refresh(self):
+        deadline = time() + REFRESH_TIMEOUT
+
+        while time() < deadline:
+            if time() < cache.get(self.cache_key)["expires_at"]:
+                return True
+
+            sleep(0.05)
+
+        return False
+
+    def test_stale_on_error(self):
+        """A failed scrape is answered with the stale object"""
+        app.config["CACHE_STALE_WHILE_REVALIDATE"] = False
+
+        self.assertEqual("MISS", self.client.get(PATH).headers["X-Cache"])
+        self.go_stale()
+
+        self.upstream.failing = True
+        fetched = len(self.upstream.fetched)
+        rv = self.client.get(PATH)
+
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual("STALE", rv.headers["X-Cache"])
+        self.assertGreater(len(self.upstream.fetched), fetched)
+
+    def test_stale_while_revalidate(self):
+        """The stale object is served while it's refreshed in the background"""
+        app.config["CACHE_STALE_WHILE_REVALIDATE"] = True
+
+        self.client.get(PATH)
+        self.go_stale()
+
+        fetched = len(self.upstream.fetched)
+        rv = self.client.get(PATH)
+
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual("STALE", rv.headers["X-Cache"])
+        self.assertTrue(self.wait_for_refresh())
+        self.assertGreater(len(self.upstream.fetched), fetched)
+        self.assertEqual("HIT", self.client.get(PATH).headers["X-Cache"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Teams Tests
+    ~~~~~~~~~~~
+
+    Teams are scraped for /teams/ and, to look up team IDs, for every
+    other resource which names a team, like /roster/. Checks that both
+    share one cache object, and that a team ID can be looked up whatever
+    is cached. See teams_helper() and get_team_id().
+
+    Like the application itself, these need a running Redis server. The
+    MLB teams look-up table in it is deleted, and rebuilt.
+
+    $ (venv) python -m unittest app.tests.test_teams
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import unittest
+from app import app, cache, redis
+from app.helpers import PARAM_FLAT_LIST
+from app.utils import build_cache_key
+from app.tests.support import FixtureUpstream
+
+ROSTER_PATH = "/roster/mlb/boston"
+TEAMS_PATH = "/teams/mlb/"
+
+class TeamsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        self.upstream = FixtureUpstream()
+        self.upstream.install()
+        self.redis_key = app.config["REDIS_KEY_TEAMS"].replace(app.config["REDIS_KEY_TOKEN_SPORT"], "mlb")
+        self.cache_key = build_cache_key(sport="mlb", params={PARAM_FLAT_LIST : False}, resource="teams")
+
+        self.go_cold()
+
+    def tearDown(self):
+        self.upstream.uninstall()
+
+        self.go_cold()
+
+    def go_cold(self):
+        cache.delete(self.cache_key)
+        redis.delete(self.redis_key)
+
+    def teams_fetched(self):
+        return len([url for url in self.upstream.fetched if url.endswith("/teams.asp")])
+
+    def test_roster_then_teams(self):
+        """Teams scraped for a roster are served from the cache at /teams/"""
+        self.assertEqual(200, self.client.get(ROSTER_PATH).status_code)
+        self.assertEqual(1, self.teams_fetched())
+
+        rv = self.client.get(TEAMS_PATH)
+
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual("HIT", rv.headers["X-Cache"])
+        self.assertEqual(1, self.teams_fetched())
+
+    def test_roster_with_teams_cached(self):
+        """A roster is found while /teams/ is cached but the look-up table is gone"""
+        self.assertEqual(200, self.client.get(TEAMS_PATH).status_code)
+        redis.delete(self.redis_key)
+
+        self.assertEqual(200, self.client.get(ROSTER_PATH).status_code)
+        self.assertTrue(redis.exists(self.redis_key))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Throttle Tests
+    ~~~~~~~~~~~~~~
+
+    Checks that requests waiting for a token go out interactive first,
+    then pre-warm, then bulk, whatever order they arrived in. See
+    app/throttle.py.
+
+    Importing the throttle imports the application, so these need a
+    running Redis server too.
+
+    $ (venv) python -m unittest app.tests.test_throttle
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import unittest
+from time import time, sleep
+from threading import Thread
+from app.throttle import Throttle, LANE_INTERACTIVE, LANE_PREWARM, LANE_BULK
+
+HOST = "stats.nesn.com"
+
+# Slow enough for every request to be queued before the first token
+RATE_LIMIT = (4, 1)
+
+class ThrottleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.throttle = Throttle(RATE_LIMIT, (100, 100))
+        self.sent = []
+
+    def send(self, lane_name):
+        self.throttle.acquire(HOST, lane_name)
+        self.sent.append(lane_name)
+
+    def queue(self, lane_names):
+        """
+        Queues a request in each lane, in order, with no tokens to spare.
+        """
+        self.throttle.bucket.tokens = 0
+        self.throttle.bucket.updated_at = time()
+
+        threads = []
+
+        for lane_name in lane_names:
+            thread = Thread(target=self.send, args=(lane_name,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+            # Wait for it to join the queue, so arrival order is known
+            while len(self.throttle.waiting) < len(threads):
+                sleep(0.001)
+
+        for thread in threads:
+            thread.join(5)
+
+    def test_lane_priority(self):
+        """Interactive requests go first, then pre-warm, then bulk"""
+        self.queue([LANE_BULK, LANE_PREWARM, LANE_INTERACTIVE])
+
+        self.assertEqual([LANE_INTERACTIVE, LANE_PREWARM, LANE_BULK], self.sent)
+
+    def test_bulk_waits_for_interactive(self):
+        """Bulk requests which queued first still wait for interactive ones"""
+        self.queue([LANE_BULK, LANE_INTERACTIVE, LANE_BULK, LANE_INTERACTIVE])
+
+        self.assertEqual([LANE_INTERACTIVE, LANE_INTERACTIVE, LANE_BULK, LANE_BULK], self.sent)
+
+        stats = self.throttle.lane_stats()
+
+        self.assertEqual(2, stats[LANE_BULK]["sent"])
+        self.assertEqual(0, stats[LANE_BULK]["queued"])
+        self.assertGreater(stats[LANE_BULK]["max_wait"], stats[LANE_INTERACTIVE]["max_wait"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Throttle
+    ~~~~~~~~
+
+    Rate limits every request sent upstream and decides who goes first
+    when there are more requests than the limits allow.
+
+    There is a token bucket for all upstream traffic and another one for
+    each host. A request may only go out once it has a token from both.
+
+    Waiting requests are queued in lanes. Interactive requests, made on
+    behalf of a client who is waiting for a response, always go before
+    pre-warm requests, which always go before bulk crawls such as the
+    tour-by-tour rankings scrape. This keeps a cold /rankings/tennis/
+    from starving /scores/.
+
+    The lane belongs to the current thread. Use the lane() context
+    manager to change it:
+
+    with lane(LANE_BULK):
+        help_fetch_soup(url)
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+from time import time
+from itertools import count
+from threading import Condition, local
+from contextlib import contextmanager
+from app import app
+
+#-- Lanes, in order of priority
+LANE_INTERACTIVE = "interactive"
+LANE_PREWARM = "prewarm"
+LANE_BULK = "bulk"
+
+LANE_PRIORITY = {
+    LANE_INTERACTIVE : 0,
+    LANE_PREWARM : 1,
+    LANE_BULK : 2
+}
+
+# Never sleep longer than this without checking the queue again
+MAX_WAIT_INTERVAL = 0.25
+
+_thread = local()
+
+class TokenBucket(object):
+    """
+    Hands out up to rate tokens per second, saving up no more than
+    capacity of them.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated_at = time()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def time_until_token(self):
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+class Throttle(object):
+    """
+    The queue of requests waiting for tokens.
+
+    :param rate_limit: A tuple of requests per second and burst size for
+                       all hosts combined
+    :type rate_limit: tuple
+
+    :param host_rate_limit: The same, for any single host
+    :type host_rate_limit: tuple
+
+    :param host_rate_limits: Overrides host_rate_limit for particular hosts
+    :type host_rate_limits: dict
+    """
+    def __init__(self, rate_limit, host_rate_limit, host_rate_limits=None):
+        self.bucket = TokenBucket(*rate_limit)
+        self.host_rate_limit = host_rate_limit
+        self.host_rate_limits = host_rate_limits or {}
+        self.host_buckets = {}
+        self.condition = Condition()
+        self.waiting = []
+        self.sequence = count()
+        self.stats = dict((name, {
+            "queued" : 0,
+            "max_queued" : 0,
+            "sent" : 0,
+            "total_wait" : 0.0,
+            "max_wait" : 0.0
+        }) for name in LANE_PRIORITY)
+
+    def acquire(self, host, lane_name=LANE_INTERACTIVE):
+        """
+        Blocks until a request to host may go out.
+
+        :param host: The host the request is for
+        :type host: str
+
+        :param lane_name: The lane to wait in
+        :type lane_name: str
+        """
+        started = time()
+        ticket = (LANE_PRIORITY[lane_name], next(self.sequence), host)
+        stats = self.stats[lane_name]
+
+        with self.condition:
+            self.waiting.append(ticket)
+            stats["queued"] += 1
+            stats["max_queued"] = max(stats["max_queued"], stats["queued"])
+
+            while True:
+                now = time()
+                self.bucket.refill(now)
+                host_bucket = self._host_bucket(host)
+                host_bucket.refill(now)
+
+                if self._next_ticket() == ticket:
+                    break
+
+                wait = max(self.bucket.time_until_token(), host_bucket.time_until_token())
+                self.condition.wait(min(max(wait, 0.001), MAX_WAIT_INTERVAL))
+
+            self.waiting.remove(ticket)
+            self.bucket.tokens -= 1
+            host_bucket.tokens -= 1
+
+            waited = time() - started
+            stats["queued"] -= 1
+            stats["sent"] += 1
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+
+            # Somebody else may be able to go now
+            self.condition.notify_all()
+
+    def _next_ticket(self):
+        # The highest priority ticket whose host has a token to spare.
+        # Looking past tickets for hosts that are out of tokens keeps one
+        # busy host from holding up all the others.
+        if self.bucket.tokens < 1:
+            return None
+
+        for ticket in sorted(self.waiting):
+            host_bucket = self._host_bucket(ticket[2])
+            host_bucket.refill(time())
+
+            if host_bucket.tokens >= 1:
+                return ticket
+
+        return None
+
+    def _host_bucket(self, host):
+        bucket = self.host_buckets.get(host)
+
+        if bucket is None:
+            rate, capacity = self.host_rate_limits.get(host, self.host_rate_limit)
+            bucket = self.host_buckets[host] = TokenBucket(rate, capacity)
+
+        return bucket
+
+    def lane_stats(self):
+        """
+        Reports the queue depth and wait times of each lane.
+
+        :returns: A dictionary of statistics keyed by lane
+        :rtype: dict
+        """
+        with self.condition:
+            rv = {}
+
+            for name, stats in self.stats.items():
+                rv[name] = dict(stats)
+                rv[name]["total_wait"] = round(stats["total_wait"], 3)
+                rv[name]["max_wait"] = round(stats["max_wait"], 3)
+                rv[name]["average_wait"] = round(stats["total_wait"] / stats["sent"], 3) if stats["sent"] else 0
+
+        return rv
+
+_throttle = Throttle(
+    app.config["UPSTREAM_RATE_LIMIT"],
+    app.config["UPSTREAM_HOST_RATE_LIMIT"],
+    app.config["UPSTREAM_HOST_RATE_LIMITS"]
+)
+
+def acquire(host):
+    """
+    Blocks until a request to host may go out, waiting in the current
+    thread's lane.
+
+    :param host: The host the request is for
+    :type host: str
+    """
+    if app.config["UPSTREAM_RATE_LIMIT_ENABLED"]:
+        _throttle.acquire(host, current_lane())
+
+def current_lane():
+    """
+    Returns the lane of the current thread.
+
+    :returns: The name of the lane
+    :rtype: str
+    """
+    return getattr(_thread, "lane", LANE_INTERACTIVE)
+
+@contextmanager
+def lane(lane_name):
+    """
+    Sends upstream requests made by the current thread through another
+    lane until the block exits.
+
+    :param lane_name: The name of the lane
+    :type lane_name: str
+    """
+    previous = current_lane()
+    _thread.lane = lane_name
+
+    try:
+        yield
+    finally:
+        _thread.lane = previous
+
+def lane_stats():
+    """
+    Reports the queue depth and wait times of each lane.
+
+    :returns: A dictionary of statistics keyed by lane
+    :rtype: dict
+    """
+    return _throttle.lane_stats()
@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Upstream
+    ~~~~~~~~
+
+    A single, shared HTTP session for every request this application
+    makes to STATS, WordPress.com, Facebook and Twitter.
+
+    Calling requests.get() directly opens a brand new TCP connection
+    for each call. Some endpoints, such as /schedule/ and /rankings/,
+    make 10 or more calls to STATS for a single request, so most of the
+    time was spent shaking hands. The session below keeps connections
+    alive and hands them out from a pool, one pool per host.
+
+    Pool sizes and timeouts are defined in config.py.
+
+    Pages fetched with fetch_page() are remembered along with their
+    ETag and Last-Modified headers, so the next fetch of the same page
+    is a conditional request. When STATS answers 304 Not Modified, the
+    page we already have is handed back, along with anything that was
+    parsed out of it. Up to UPSTREAM_PAGES_SIZE pages are remembered, and
+    the least recently fetched are forgotten first.
+
+    fetch_page() can also stream a page and hang up as soon as the parts
+    we need have arrived. See fetch_page() and app/slicer.py.
+
+    Pages can also be written to an on-disk archive. See app/archive.py.
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+from hashlib import sha1
+from threading import Lock
+from collections import OrderedDict
+from urlparse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from app import app
+from app.archive import Archive
+from app.throttle import acquire
+from app.utils import logcat
+
+_session = None
+_session_lock = Lock()
+_archive = None
+
+# Number of requests sent to each host. urllib3 keeps its own counts,
+# but those are lost once a pool is evicted from the pool manager.
+_stats = {}
+_stats_lock = Lock()
+
+# Pages with validators, keyed by URL and query string arguments, least
+# recently fetched first
+_pages = OrderedDict()
+_pages_lock = Lock()
+_revalidation_stats = {"revalidated": 0, "refetched": 0}
+
+# Pages streamed with fetch_page(until=...)
+_stream_stats = {"streamed": 0, "cut_short": 0, "bytes_read": 0, "bytes_skipped": 0}
+
+# How much of a streamed page is read at a time
+STREAM_CHUNK_SIZE = 8 * 1024
+
+class Page(object):
+    """
+    The body of an upstream page along with its validators.
+
+    Pages from hosts listed in UPSTREAM_ENCODINGS keep the raw bytes of
+    the response in "content", along with their encoding, and are only
+    decoded into "text" when somebody asks for it. Other pages only have
+    "text", decoded however requests saw fit.
+
+    A page which was streamed and cut short is not "complete". It only
+    holds the beginning of the page.
+
+    The attribute "parsed" is a scratch space for callers to store
+    whatever they parsed out of the page. It is thrown away along with
+    the page when the page changes.
+    """
+    def __init__(self, text=None, etag=None, last_modified=None, content=None, encoding=None, complete=True):
+        self._text = text
+        self.content = content
+        self.encoding = encoding
+        self.complete = complete
+        self._digest = None
+        self.etag = etag
+        self.last_modified = last_modified
+        self.parsed = {}
+
+    @property
+    def text(self):
+        if self._text is None and self.content is not None:
+            self._text = self.content.decode(self.encoding, "replace")
+
+        return self._text
+
+    @property
+    def body(self):
+        """
+        The raw bytes of the page if we have them, otherwise its text.
+        """
+        return self.text if self.content is None else self.content
+
+    @property
+    def digest(self):
+        """
+        A hash of the body. Two pages with the same digest have the same
+        body, whenever and wherever they were fetched.
+        """
+        if self._digest is None:
+            body = self.body
+            self._digest = sha1(body.encode("utf-8") if isinstance(body, unicode) else body).digest()
+
+        return self._digest
+
+def get_session():
+    """
+    Returns the shared session, creating it on first use.
+
+    requests.Session is safe to share among threads as long as nobody
+    changes its settings after it's been built, so we build it exactly
+    once.
+
+    :returns: The shared session
+    :rtype: requests.Session
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+
+    return _session
+
+def _build_session():
+    session = requests.Session()
+
+    default_adapter = _build_adapter(app.config["UPSTREAM_POOL_MAXSIZE"])
+    session.mount("http://", default_adapter)
+    session.mount("https://", default_adapter)
+
+    # Hosts which need a different connection limit get their own
+    # adapter. requests always picks the longest matching prefix.
+    for host, maxsize in app.config["UPSTREAM_HOST_POOL_MAXSIZE"].items():
+        adapter = _build_adapter(maxsize)
+        session.mount("http://" + host, adapter)
+        session.mount("https://" + host, adapter)
+
+    return session
+
+def _build_adapter(maxsize):
+    return HTTPAdapter(
+        pool_connections=app.config["UPSTREAM_POOL_CONNECTIONS"],
+        pool_maxsize=maxsize,
+        pool_block=app.config["UPSTREAM_POOL_BLOCK"]
+    )
+
+def get_archive():
+    """
+    Returns the shared page archive, creating it on first use.
+
+    :returns: The archive
+    :rtype: app.archive.Archive
+    """
+    global _archive
+
+    if _archive is None:
+        with _session_lock:
+            if _archive is None:
+                _archive = Archive(app.config["ARCHIVE_PATH"])
+
+    return _archive
+
+def fetch(url, params=None, **kwargs):
+    """
+    Sends a GET request through the shared session.
+
+    This is a drop-in replacement for requests.get(). The connect and
+    read timeouts from config.py are applied unless the caller passes
+    its own. The request waits its turn in the throttle first.
+
+    :param url: The URL to fetch
+    :type url: str
+
+    :param params: Query string arguments
+    :type params: dict
+
+    :returns: The response
+    :rtype: requests.Response
+    """
+    kwargs.setdefault(
+        "timeout",
+        (app.config["UPSTREAM_CONNECT_TIMEOUT"], app.config["UPSTREAM_READ_TIMEOUT"])
+    )
+
+    host = urlparse(url).netloc
+
+    acquire(host)
+
+    with _stats_lock:
+        _stats[host] = _stats.get(host, 0) + 1
+
+    return get_session().get(url, params=params, **kwargs)
+
+def fetch_page(url, params=None, until=None):
+    """
+    Fetches a page, revalidating the copy we already have if possible.
+
+    If a previous response carried an ETag or a Last-Modified header,
+    they are sent back as If-None-Match and If-Modified-Since. A 304
+    response returns the stored page untouched.
+
+    When until is given, the page is streamed. Each piece of it is
+    handed to until.feed() as it arrives, and once that returns True the
+    connection is closed without reading the rest of the page. The page
+    is then stored separately from the complete one, under until.key,
+    since it is only good for callers looking for the same thing.
+
+    :param url: The URL to fetch
+    :type url: str
+
+    :param params: Query string arguments
+    :type params: dict
+
+    :param until: Decides when enough of the page has arrived, such as a
+                  slicer.SliceScanner
+    :type until: object
+
+    :returns: The page and whether it changed since the last fetch
+    :rtype: tuple
+    """
+    # Serve the archived copy without going to STATS at all
+    if app.config["ARCHIVE_REPLAY"]:
+        archived = get_archive().load(url, params)
+
+        if archived is not None:
+            content, encoding = archived
+
+            return Page(content=content, encoding=encoding), True
+
+    key = (url, tuple(sorted((params or {}).items())), None if until is None else until.key)
+    headers = {}
+
+    with _pages_lock:
+        page = _pages.get(key)
+
+    if page is not None:
+        if page.etag:
+            headers["If-None-Match"] = page.etag
+
+        if page.last_modified:
+            headers["If-Modified-Since"] = page.last_modified
+
+    r = fetch(url, params=params, headers=headers, stream=until is not None)
+
+    if 304 == r.status_code and page is not None:
+        _count_revalidation("revalidated")
+
+        with _pages_lock:
+            if _pages.pop(key, None) is not None:
+                _pages[key] = page
+
+        # Hands the connection back to the pool
+        r.content
+
+        return page, False
+
+    _count_revalidation("refetched")
+
+    etag = r.headers.get("ETag")
+    last_modified = r.headers.get("Last-Modified")
+    encoding = app.config["UPSTREAM_ENCODINGS"].get(urlparse(url).netloc)
+
+    if until is not None:
+        content, complete = _read_until(r, until)
+
+        # requests can't guess the encoding of part of a page
+        encoding = encoding or r.encoding or "utf-8"
+        page = Page(content=content, encoding=encoding, etag=etag, last_modified=last_modified, complete=complete)
+
+    # Don't let requests guess the encoding of a host we already know
+    elif encoding is None:
+        page = Page(text=r.text, etag=etag, last_modified=last_modified)
+    else:
+        page = Page(content=r.content, encoding=encoding, etag=etag, last_modified=last_modified)
+
+    # Only whole pages are archived
+    if app.config["ARCHIVE_ENABLED"] and 200 == r.status_code and page.complete:
+        try:
+            get_archive().store(url, params, page.body, page.encoding)
+
+        # A full disk shouldn't take the API down with it
+        except (IOError, OSError) as e:
+            logcat("Unable to archive %s: %s" % (url, e))
+
+    # Error pages aren't worth revalidating. Keep whatever we had.
+    if 200 != r.status_code:
+        return page, True
+
+    with _pages_lock:
+        _pages.pop(key, None)
+
+        # Pages without validators can't be revalidated, so don't keep
+        # them
+        if page.etag or page.last_modified:
+            _pages[key] = page
+
+            while len(_pages) > app.config["UPSTREAM_PAGES_SIZE"]:
+                _pages.popitem(last=False)
+
+    return page, True
+
+def _read_until(r, until):
+    # Reads a streamed response until until.feed() is satisfied. Returns
+    # what was read and whether that is the whole page.
+    chunks = []
+    complete = True
+
+    for chunk in r.iter_content(STREAM_CHUNK_SIZE):
+        chunks.append(chunk)
+
+        if until.feed(chunk):
+            complete = False
+            break
+
+    bytes_read = r.raw.tell()
+
+    if not complete:
+        _hang_up(r)
+
+    try:
+        bytes_skipped = max(0, int(r.headers.get("Content-Length")) - bytes_read)
+    except (TypeError, ValueError):
+        bytes_skipped = 0
+
+    with _stats_lock:
+        _stream_stats["streamed"] += 1
+        _stream_stats["cut_short"] += 0 if complete else 1
+        _stream_stats["bytes_read"] += bytes_read
+        _stream_stats["bytes_skipped"] += bytes_skipped
+
+    return ''.join(chunks), complete
+
+def _hang_up(r):
+    # The rest of the page is still on its way, so the connection can't
+    # be reused. Response.close() would hand it back to the pool as is,
+    # so close the socket first. The pool opens a new one in its place.
+    connection = getattr(r.raw, "_connection", None)
+
+    if connection is not None:
+        connection.close()
+
+    r.raw.close()
+    r.raw.release_conn()
+
+def _count_revalidation(stat):
+    with _stats_lock:
+        _revalidation_stats[stat] += 1
+
+def revalidation_stats():
+    """
+    Reports how many fetches were answered with 304 Not Modified and
+    how many downloaded the full page.
+
+    :returns: A dictionary of statistics
+    :rtype: dict
+    """
+    with _stats_lock:
+        rv = dict(_revalidation_stats)
+
+    with _pages_lock:
+        rv["pages"] = len(_pages)
+
+    return rv
+
+def stream_stats():
+    """
+    Reports how many pages were streamed, how many of them were cut
+    short once their tables had arrived, and how many bytes were read
+    and left unread. Bytes left unread are only known for responses
+    which carry a Content-Length.
+
+    :returns: A dictionary of statistics
+    :rtype: dict
+    """
+    with _stats_lock:
+        return dict(_stream_stats)
+
+def pool_stats():
+    """
+    Reports how well the connection pools are being reused.
+
+    For each host, "requests" is the number of requests sent over the
+    pool, "connections" is the number of TCP connections it had to
+    open and "reused" is the difference. A healthy pool has far more
+    reused connections than opened ones.
+
+    :returns: A dictionary of statistics keyed by host
+    :rtype: dict
+    """
+    with _stats_lock:
+        rv = dict((host, {"fetched": count}) for host, count in _stats.items())
+
+    if _session is None:
+        return rv
+
+    # The same adapter is mounted under several prefixes
+    adapters = dict((id(adapter), adapter) for adapter in _session.adapters.values())
+
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+
+        for key in pools.keys():
+            pool = pools.get(key)
+
+            if pool is None:
+                continue
+
+            stats = rv.setdefault(pool.host, {})
+            stats["requests"] = stats.get("requests", 0) + pool.num_requests
+            stats["connections"] = stats.get("connections", 0) + pool.num_connections
+            stats["reused"] = stats["requests"] - stats["connections"]
+            stats["idle"] = stats.get("idle", 0) + (pool.pool.qsize() if pool.pool else 0)
+
+    return rv
@@ -18,13 +18,23 @@
 """
 # from HTMLParser import HTMLParser
 import re
+import zlib
 import logging
+from sys import exc_info
+from struct import pack
 from hashlib import sha224
 from datetime import date, datetime
-from dateutil.parser import parse
+from time import time
+from threading import Event, Lock, Thread
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 from unicodedata import normalize
-from flask import request
-from app import app, cache
+from flask import request, g, jsonify
+from flask.json import dumps
+from app import app, cache, redis
+from app.cachestore import count
+from app.throttle import LANE_PREWARM, current_lane, lane
+from app.dates import timestamp_from_string
 # try:
 #     import html.entities as compat_html_entities
 # except ImportError: # Python 2
@@ -37,6 +47,24 @@ except NameError:
 
 _punct_re = re.compile(r'[\t !"#$%&\'()*\-/<=>?@\[\\\]^_`{|},.]+')
 
+# Cache misses currently being scraped, keyed by cache key. See
+# fetch_cached_data().
+_flights = {}
+_flights_lock = Lock()
+_flight_stats = {"leaders": 0, "coalesced": 0, "timed_out": 0}
+
+# Cache keys being refreshed in the background. See fetch_cached_data().
+_refreshing = set()
+_stale_stats = {"served_stale": 0, "served_stale_on_error": 0, "refreshes": 0, "failed_refreshes": 0}
+
+# Stand in for the meta of a cached payload which changes from one hit to
+# the next. See _encode_cached_json().
+_AGE = u"\x00age\x00"
+_STALE = u"\x00stale\x00"
+
+# What every gzip member starts with, less the name and the time
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
 def logcat(message):
     """
     Helper function which logs messages to the terminal.
@@ -102,13 +130,94 @@ def prepare_json_output(data):
     """
     return {"data" : data, "meta" : {"created_at": int(current_time()), "loaded_from_cache": False}}
 
-def fetch_cached_data(args=None):
+def json_response(payload):
     """
-    Retrieves a cache object when given an optional cache key.
+    Returns a JSON response for a payload, like jsonify() does.
+
+    A payload which came out of the cache is answered with the JSON it
+    was stored with, gzipped if the client accepts that, rather than
+    encoding it all over again. Only its age and whether it's stale are
+    filled in, in meta. The X-Cache header says whether the response
+    came from the cache ("HIT", or "STALE" if it's past its expiry) or
+    not ("MISS"), and the Age header how old it is.
+
+    A payload built out of one that came from the cache, see
+    rebuild_cached_payload(), is encoded again but still reported as a
+    hit.
+
+    :param payload: What prepare_json_output() or fetch_cached_data()
+                    returned
+    :type payload: dict
+
+    :returns: A JSON response
+    :rtype: flask.Response
+    """
+    entry = getattr(payload, "entry", None)
+
+    if entry is None:
+        rv = jsonify(payload)
+        rv.headers["X-Cache"] = "MISS"
+
+        return rv
 
-    Because most cache keys within this app are URL dependent, the
-    code which retrieves the cache has been refactored here to maximize
-    consistency.
+    stale = _is_stale(entry)
+    age = int(time() - entry["stored_at"])
+
+    # Entries stored before their JSON was, or payloads which were
+    # changed since
+    if "json" not in entry or not payload.as_stored:
+        rv = jsonify(payload)
+    else:
+        rv = _cached_json_response(entry, stale, age)
+
+    rv.headers["X-Cache"] = "STALE" if stale else "HIT"
+    rv.headers["Age"] = str(age)
+
+    return rv
+
+def _cached_json_response(entry, stale, age):
+    # The JSON is stored in pieces, and the meta which changes goes in
+    # between them. Gzipped, the first and largest piece is compressed
+    # ahead of time and the rest is compressed onto the end of it.
+    pieces = entry["json"]
+    rest = ''
+
+    if len(pieces) > 1:
+        rest = "%d%s%s%s" % (age, pieces[1], "true" if stale else "false", pieces[2])
+
+    gzipped = "gzip" in request.accept_encodings
+
+    if gzipped:
+        body = entry["gzip_head"] + _gzip_rest(rest, entry["gzip_crc"], len(pieces[0]))
+    else:
+        body = pieces[0] + rest
+
+    rv = app.response_class(body, mimetype="application/json")
+    rv.headers["Vary"] = "Accept-Encoding"
+
+    if gzipped:
+        rv.headers["Content-Encoding"] = "gzip"
+
+    return rv
+
+def fetch_cached_data(cache_key):
+    """
+    Retrieves a cache object when given a cache key, see
+    build_cache_key().
+
+    Every cache object has a soft and a hard expiry (see cache_data()).
+    Past the soft expiry the object is stale. With
+    CACHE_STALE_WHILE_REVALIDATE on, stale objects are returned straight
+    away while the request is replayed in the background to refresh the
+    cache. With it off, the caller scrapes as though it missed, but if
+    the scrape raises an exception the stale object is served instead.
+    Either way, meta reports whether the data is stale and its age.
+
+    On a miss, only the first caller is told to go and scrape. Anyone
+    who misses on the same key while that scrape is under way waits for
+    it to call cache_data() and gets the same result, rather than
+    scraping STATS all over again. If the wait takes longer than
+    SINGLE_FLIGHT_TIMEOUT seconds, the caller gives up and scrapes too.
 
     :param cache_key: The identifier for the cache object. This must be unique
     :type cache_key: str
@@ -116,36 +225,53 @@ def fetch_cached_data(args=None):
     :returns: A dictionary of JSON data
     :rtype: dict
     """
-    cache_key = request.base_url
+    entry = cache.get(cache_key)
 
-    if args:
-        cache_key += args
+    # Refreshes and pre-warms must scrape, unless another worker already
+    # refreshed the data. See replay_request().
+    if getattr(g, "refreshing", False):
+        if entry is not None and entry["expires_at"] >= g.keep_until:
+            _note_cached(entry)
 
-    cache_key = sha224(cache_key).hexdigest()
+            return _unwrap_cache_entry(entry)
 
-    rv = cache.get(cache_key)
+        entry = None
 
-    # logcat(str(rv))
+    # logcat(str(entry))
 
-    if rv is not None:
-        rv["meta"]["loaded_from_cache"] = True
-    return rv
+    if entry is not None:
+        if not _is_stale(entry):
+            count("hits", redis)
+            return _unwrap_cache_entry(entry)
 
-def cache_data(data, args=None, timeout=None):
-    """
-    Stores data in the application cache using the base URL as the main
-    cache key.
+        count("stale_hits", redis)
+
+        if app.config["CACHE_STALE_WHILE_REVALIDATE"]:
+            _refresh_in_background(cache_key)
+            _count_stale("served_stale")
 
-    To prevent all URLs from being cached, such as
-    /teams/nba?this_is_not_a_real_param=2
+            return _unwrap_cache_entry(entry)
 
-    The base URL along with optional arguments are used. This ensures
-    that URLS passed with arbitrary query string arguments will not
-    break the cache.
+        # Kept in case the scrape fails. See serve_stale_on_error().
+        g.stale_entry = entry
 
-    Because most cache keys within this app are URL dependent, the
-    code which stores the cache has been refactored here to maximize
-    consistency.
+    elif not getattr(g, "refreshing", False):
+        count("misses", redis)
+
+    entry = _join_flight(cache_key)
+
+    if entry is None:
+        return None
+
+    # A refresh which waited on another scrape is done all the same
+    _note_cached(entry)
+
+    return _unwrap_cache_entry(entry)
+
+def cache_data(data, cache_key, timeout=None, stale_timeout=None):
+    """
+    Stores data in the application cache under a key made by
+    build_cache_key().
 
     :param data: The data object to cache
     :type data: dict
@@ -153,22 +279,452 @@ def cache_data(data, args=None, timeout=None):
     :param cache_key: The identifier for the cache object. This must be unique
     :type cache_key: str
 
-    :param timeout: The expiry for the cache
+    :param timeout: The soft expiry, after which the data is stale
     :type timeout: int
 
+    :param stale_timeout: How long stale data may still be served
+    :type stale_timeout: int
+
     :returns: None
     :rtype: None
     """
-    cache_key = request.base_url
+    timeout = app.config["CACHE_TIMEOUT"] if timeout is None else timeout
+    stale_timeout = app.config["CACHE_STALE_TIMEOUT"] if stale_timeout is None else stale_timeout
 
-    if args:
-        cache_key += args
+    entry = {
+        "value" : data,
+        "stored_at" : time(),
+        "expires_at" : time() + timeout
+    }
 
-    cache_key = sha224(cache_key).hexdigest()
+    # Hits are answered with these bytes, see json_response()
+    entry["json"] = _encode_cached_json(data)
+    entry["gzip_head"] = _gzip_head(entry["json"][0])
+    entry["gzip_crc"] = zlib.crc32(entry["json"][0])
 
-    timeout = app.config["CACHE_TIMEOUT"] if timeout is None else timeout
+    # The cache itself evicts the object at the hard expiry
+    cache.set(cache_key, entry, timeout + stale_timeout)
+
+    _note_cached(entry)
+
+    # Wake up everyone waiting on this scrape
+    _land_flight(cache_key)
+
+def build_cache_key(sport=None, team_id=None, date=None, params=None, resource=None):
+    """
+    Builds a cache key out of what a response is made of, rather than
+    the URL it was requested with. Requests through another host, with
+    another spelling of the same date, with a team slug the view ignores
+    or with query string arguments which change nothing all share a
+    single cache object.
+
+    To keep /teams/nba?this_is_not_a_real_param=2 from being cached on
+    its own, only the query string arguments a view actually reads may
+    be passed in params.
+
+    :param sport: The sport, as STATS names it, e.g. "fb"
+    :type sport: str
+
+    :param team_id: The ID of the team at STATS
+    :type team_id: int
+
+    :param date: The date, as stats_date_string() formats it
+    :type date: str
+
+    :param params: Arguments which change the response. Those which are
+                   None are left out.
+    :type params: dict
+
+    :param resource: What the response is. Defaults to the blueprint of
+                     the current request, e.g. "roster"
+    :type resource: str
+
+    :returns: A hashed cache key
+    :rtype: str
+    """
+    parts = [resource or request.blueprint, sport, team_id, date]
+    parts += ["%s=%s" % (name, value) for (name, value) in sorted((params or {}).items()) if value is not None]
+
+    return sha224('|'.join(_key_part(part) for part in parts)).hexdigest()
+
+def _key_part(part):
+    if part is None:
+        return ''
+
+    if isinstance(part, unicode):
+        return part.encode("utf-8")
+
+    return str(part)
+
+def _join_flight(cache_key):
+    with _flights_lock:
+        flight = _flights.get(cache_key)
+
+        # Nobody is scraping this yet, so it's up to us
+        if flight is None:
+            _flights[cache_key] = Event()
+            _flight_stats["leaders"] += 1
+
+            # Remembered so the flight is landed even if the scrape
+            # fails. See land_request_flights().
+            if not hasattr(g, "flights"):
+                g.flights = []
+
+            g.flights.append(cache_key)
+
+            return None
+
+    if not flight.wait(app.config["SINGLE_FLIGHT_TIMEOUT"]):
+        with _flights_lock:
+            _flight_stats["timed_out"] += 1
+
+        return None
+
+    with _flights_lock:
+        _flight_stats["coalesced"] += 1
+
+    # None if the scrape failed, in which case the caller scrapes
+    return cache.get(cache_key)
+
+def _is_stale(entry):
+    return time() >= entry["expires_at"]
+
+def _note_cached(entry):
+    # Lets replay_request() know when this needs refreshing again, and
+    # how long it's cached for. A view which caches more than one object
+    # is due whenever the first of them is.
+    if entry["expires_at"] < getattr(g, "cached_until", float("inf")):
+        g.cached_until = entry["expires_at"]
+        g.cached_for = entry["expires_at"] - entry["stored_at"]
+
+class CachedPayload(dict):
+    """
+    A payload which came out of the cache, along with the entry it was
+    stored in, and whether it is still what was stored. See
+    json_response().
+    """
+    def __init__(self, value, entry, as_stored=True):
+        dict.__init__(self, value)
+        self.entry = entry
+        self.as_stored = as_stored
+
+def rebuild_cached_payload(payload, value):
+    """
+    Returns value in place of a payload which came out of the cache, for
+    views which answer a hit with something other than what they
+    stored. It's reported as a hit all the same. See json_response().
+
+    :param payload: What fetch_cached_data() returned
+    :type payload: dict
+
+    :param value: What to answer with instead
+    :type value: dict
+
+    :returns: The new payload
+    :rtype: dict
+    """
+    entry = getattr(payload, "entry", None)
+
+    return value if entry is None else CachedPayload(value, entry, as_stored=False)
+
+def _unwrap_cache_entry(entry):
+    # The entry may be shared with other requests, see TieredCache, so
+    # meta is copied rather than changed
+    rv = CachedPayload(entry["value"], entry)
+
+    if "meta" in rv:
+        rv["meta"] = dict(
+            rv["meta"],
+            loaded_from_cache=True,
+            stale=_is_stale(entry),
+            age=int(time() - entry["stored_at"])
+        )
+
+    return rv
+
+def _encode_cached_json(data):
+    # The JSON of a payload as it comes out of the cache. With meta, its
+    # age and whether it's stale change from hit to hit, so the JSON is
+    # cut into three pieces where those go. The pieces are in that
+    # order, since keys are sorted, and the last two are only as long as
+    # the rest of meta.
+    if "meta" not in data:
+        return (_encode_json(data),)
+
+    body = _encode_json(dict(data, meta=dict(data["meta"], loaded_from_cache=True, age=_AGE, stale=_STALE)))
+    head, rest = body.rsplit(_encode_json(_AGE), 1)
+    middle, tail = rest.rsplit(_encode_json(_STALE), 1)
+
+    return (head, middle, tail)
+
+def _encode_json(data):
+    # The same JSON jsonify() sends, minus the indentation it leaves out
+    # for XMLHttpRequests
+    indent = 2 if app.config["JSONIFY_PRETTYPRINT_REGULAR"] else None
+
+    return dumps(data, indent=indent)
+
+def _gzip_head(data):
+    # The start of a gzip member holding data and whatever
+    # _gzip_rest() adds to it. The deflate stream is flushed to a byte
+    # boundary, so another one can carry on where it stops.
+    compressor = zlib.compressobj(app.config["CACHE_GZIP_LEVEL"], zlib.DEFLATED, -zlib.MAX_WBITS)
 
-    cache.set(cache_key, data, timeout)
+    return GZIP_HEADER + compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+def _gzip_rest(data, head_crc, head_size):
+    # The end of a gzip member started by _gzip_head(), with data added
+    compressor = zlib.compressobj(app.config["CACHE_GZIP_LEVEL"], zlib.DEFLATED, -zlib.MAX_WBITS)
+    crc = zlib.crc32(data, head_crc) & 0xffffffff
+
+    return compressor.compress(data) + compressor.flush() + pack("<LL", crc, (head_size + len(data)) & 0xffffffff)
+
+def _count_stale(stat):
+    with _flights_lock:
+        _stale_stats[stat] += 1
+
+def _refresh_in_background(cache_key):
+    with _flights_lock:
+        if cache_key in _refreshing:
+            return
+
+        _refreshing.add(cache_key)
+
+    thread = Thread(
+        target=_refresh,
+        args=(cache_key, request.path, request.query_string, request.url_root)
+    )
+    thread.daemon = True
+    thread.start()
+
+def _refresh(cache_key, path, query_string, base_url):
+    try:
+        replay_request(path, query_string, base_url)
+        _count_stale("refreshes")
+
+    # The stale data stays put until its hard expiry
+    except Exception as e:
+        logcat("Unable to refresh %s: %s" % (path, e))
+        _count_stale("failed_refreshes")
+
+    finally:
+        with _flights_lock:
+            _refreshing.discard(cache_key)
+
+def replay_request(path, query_string=None, base_url=None, keep_until=None):
+    """
+    Dispatches a request to a view without a client on the other end.
+
+    The request runs in a test request context with the cache bypassed,
+    so the view scrapes and calls cache_data() exactly as it would for
+    a real request. Its upstream requests wait in the pre-warm lane of
+    the throttle. The response itself is thrown away.
+
+    Every worker replays the same routes, so whatever another worker
+    cached which stays fresh until keep_until is kept as it is.
+
+    :param path: The path of the request, e.g. /standings/mlb/
+    :type path: str
+
+    :param query_string: The query string, without the '?'
+    :type query_string: str
+
+    :param base_url: The scheme and host
+    :type base_url: str
+
+    :param keep_until: A UNIX timestamp. Defaults to never, which always
+                       scrapes.
+    :type keep_until: float
+
+    :returns: The UNIX timestamp at which the cached data goes stale
+              and how many seconds it was cached for, or None if
+              nothing was cached
+    :rtype: tuple
+    """
+    # Nobody is waiting on this, so let real requests go first
+    with lane(LANE_PREWARM):
+        with app.test_request_context(path, base_url=base_url, query_string=query_string):
+            g.refreshing = True
+            g.keep_until = float("inf") if keep_until is None else keep_until
+            app.preprocess_request()
+            app.dispatch_request()
+
+            if not hasattr(g, "cached_until"):
+                return None
+
+            return g.cached_until, g.cached_for
+
+@app.errorhandler(Exception)
+def serve_stale_on_error(e):
+    """
+    Serves the stale cache object, if there is one, when a scrape
+    raises an exception. Otherwise, the exception carries on as usual.
+    """
+    entry = getattr(g, "stale_entry", None)
+
+    if entry is None:
+        raise exc_info()[0], exc_info()[1], exc_info()[2]
+
+    logcat("Serving stale data for %s: %s" % (request.path, e))
+    _count_stale("served_stale_on_error")
+
+    return json_response(_unwrap_cache_entry(entry))
+
+def _land_flight(cache_key):
+    with _flights_lock:
+        flight = _flights.pop(cache_key, None)
+
+    if flight is not None:
+        flight.set()
+
+@app.teardown_request
+def land_request_flights(exception=None):
+    """
+    Lands every flight this request started but never landed, which
+    happens when a scrape raises an exception or returns without
+    caching anything. The callers waiting on them go and scrape for
+    themselves.
+    """
+    for cache_key in getattr(g, "flights", []):
+        _land_flight(cache_key)
+
+def flight_stats():
+    """
+    Reports how many cache misses led to a scrape ("leaders"), how many
+    waited for someone else's scrape instead ("coalesced") and how many
+    gave up waiting ("timed_out").
+
+    :returns: A dictionary of statistics
+    :rtype: dict
+    """
+    with _flights_lock:
+        rv = dict(_flight_stats)
+        rv["in_flight"] = len(_flights)
+
+    return rv
+
+def stale_stats():
+    """
+    Reports how often stale data was served, either while refreshing in
+    the background or because a scrape failed, and how the background
+    refreshes fared.
+
+    :returns: A dictionary of statistics
+    :rtype: dict
+    """
+    with _flights_lock:
+        rv = dict(_stale_stats)
+        rv["refreshing"] = len(_refreshing)
+
+    return rv
+
+def concurrent_map(func, items, max_workers):
+    """
+    Calls func once for each item using a bounded pool of threads.
+
+    The results are returned in the same order as items, no matter the
+    order in which the calls finish. If any call raises an exception,
+    it is raised here once every call has finished.
+
+    :param func: A callback function. Must accept a single item
+    :type func: function
+
+    :param items: The items to pass to func
+    :type items: iterable
+
+    :param max_workers: The most calls that may run at the same time
+    :type max_workers: int
+
+    :returns: A list of return values from func
+    :rtype: list
+    """
+    items = list(items)
+
+    # Not worth spinning up threads for
+    if max_workers <= 1 or len(items) <= 1:
+        return map(func, items)
+
+    func = _in_current_lane(func)
+    pool = ThreadPool(min(max_workers, len(items)))
+
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+def concurrent_map_until(func, items, max_workers, deadline=None):
+    """
+    Like concurrent_map(), but gives up on the calls which have not
+    finished within deadline seconds.
+
+    Calls which miss the deadline are left to finish in the background
+    and their results are thrown away. Calls which raise an exception
+    are logged and treated as though they missed the deadline.
+
+    :param func: A callback function. Must accept a single item
+    :type func: function
+
+    :param items: The items to pass to func
+    :type items: iterable
+
+    :param max_workers: The most calls that may run at the same time
+    :type max_workers: int
+
+    :param deadline: Seconds to wait for all calls. None waits forever
+    :type deadline: float
+
+    :returns: A list of (item, result) tuples in the same order as
+              items and a list of the items which did not finish
+    :rtype: tuple
+    """
+    items = list(items)
+
+    if not items:
+        return [], []
+
+    func = _in_current_lane(func)
+    pool = ThreadPool(max(1, min(max_workers, len(items))))
+    pending = [(item, pool.apply_async(func, (item,))) for item in items]
+
+    # No more work will be added. Idle threads exit once the queue drains.
+    pool.close()
+
+    end = None if deadline is None else time() + deadline
+    finished = []
+    missed = []
+
+    for item, result in pending:
+        try:
+            if end is None:
+                finished.append((item, result.get()))
+            else:
+                finished.append((item, result.get(max(0, end - time()))))
+
+        except TimeoutError:
+            missed.append(item)
+
+        except Exception as e:
+            logcat("%s failed for %s: %s" % (getattr(func, "__name__", func), item, e))
+            missed.append(item)
+
+    if not missed:
+        pool.join()
+
+    return finished, missed
+
+def _in_current_lane(func):
+    # Pool threads send their upstream requests through the same
+    # throttle lane as the thread which started them.
+    lane_name = current_lane()
+
+    def wrapper(item):
+        with lane(lane_name):
+            return func(item)
+
+    wrapper.__name__ = func.__name__
+
+    return wrapper
 
 # http://flask.pocoo.org/snippets/5/
 def slugify(text, delimiter=u'-'):
@@ -189,19 +745,6 @@ def current_time():
     """
     return datetime.now().strftime("%s")
 
-def timestamp_from_string(date_string):
-    """
-    Returns a UNIX timestamp for a provided date string.
-
-    This function was created with PHP's strtotime in mind. This may be
-    removed if it discovered that Python supports this natively. I'm
-    certain it does.
-
-    :returns: The current timestamp as a string
-    :rtype: str
-    """
-    return parse(date_string).strftime("%s")
-
 # def format_datetime(dt):
 #     return dt.strftime("%Y-%m-%d @ %H:%M")
 
@@ -11,31 +11,56 @@
     :copyright: (c) 2013 by NESN.
     :license: BSD, see LICENSE for more details.
 """
-from flask import Blueprint, jsonify
-import re
-
-import requests
-from bs4 import BeautifulSoup, SoupStrainer
-from app.utils import prepare_json_output, fetch_cached_data, cache_data, timestamp_from_string
+from flask import Blueprint
+from app.helpers import help_fetch_parsed
+from app.cells import cell_text
+from app.utils import prepare_json_output, fetch_cached_data, cache_data, build_cache_key, timestamp_from_string, json_response
 
 mod = Blueprint("injuries", __name__, url_prefix="/injuries")
 
+INJURIES_URL = "http://stats.nesn.com/mlb/stats.asp"
+
+#-- Query String Parameters
+PARAM_FILE = "file"
+
+#-- Query String Arguments
+ARG_FILE = "recentinj"
+
 @mod.route("/mlb/", methods=["GET"])
 def mlb():
     # Because this object does not take any arguments, always cache
-
-    rv = fetch_cached_data(cache_key="mlb_injuries")
+    cache_key = build_cache_key(sport="mlb")
+    rv = fetch_cached_data(cache_key)
 
     if rv is not None:
-        return jsonify(rv)
-
-    r = requests.get("http://stats.nesn.com/mlb/stats.asp?file=recentinj")
-    raw_string = re.sub(r"\s+", ' ', r.text)
+        return json_response(rv)
 
     # http://stackoverflow.com/questions/15871769/using-beautiful-soup-grabbing-stuff-between-li-and-li
-    soup = BeautifulSoup(raw_string, from_encoding="UTF-8", parse_only=SoupStrainer(name="div", attrs={"id": "shsMLBrecentinj"}))
-    del r, raw_string
+    stack = help_fetch_parsed(
+        INJURIES_URL,
+        parser_func=parse_injuries_soup,
+        request_params={PARAM_FILE : ARG_FILE},
+        element="div",
+        attrs={"id" : "shsMLBrecentinj"}
+    )
+
+    out = prepare_json_output(stack)
 
+    # Cache for 12 hours
+    cache_data(data=out, cache_key=cache_key, timeout=60 * 60 * 12)
+
+    return json_response(out)
+
+def parse_injuries_soup(soup):
+    """
+    Groups the injuries listed on the page by team.
+
+    :param soup: The recent injuries <div>
+    :type soup: bs4.BeautifulSoup or rows.Node
+
+    :returns: A list of dictionaries, one per team
+    :rtype: list
+    """
     # for e in soup.findAll('br'):
     #     e.extract()
 
@@ -58,7 +83,7 @@ def mlb():
 
         # The team name
         elif "shsTableTitle" in item.get("class"):
-            team = item.extract().text.encode("utf-8").lower().replace(' ', '_')
+            team = cell_text(item, strip=False).lower().replace(' ', '_')
 
         # The important data
         else:
@@ -69,9 +94,9 @@ def mlb():
                     continue
 
                 cells = row("td")
-                vals["ts"] = int(timestamp_from_string(cells[0].extract().text.encode("utf-8")))
-                vals["player"] = cells[1].extract().text.encode("utf-8")
-                vals["status"] = cells[2].extract().text.encode("utf-8")
+                vals["ts"] = int(timestamp_from_string(cell_text(cells[0], strip=False)))
+                vals["player"] = cell_text(cells[1], strip=False)
+                vals["status"] = cell_text(cells[2], strip=False)
 
                 team_stack.append(vals.copy())
 
@@ -79,9 +104,4 @@ def mlb():
                 stack.append({ team : team_stack })
                 team_stack = []
 
-    out = prepare_json_output(stack)
-
-    # Cache for 12 hours
-    cache_data(data=out, timeout=60 * 60 * 12)
-
-    return jsonify(out)
+    return stack
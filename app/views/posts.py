@@ -29,8 +29,9 @@
     :license: BSD, see LICENSE for more details.
 """
 from flask import Blueprint, jsonify, request
-import requests
-from app.utils import timestamp_from_string, prepare_json_output, cache_data, fetch_cached_data
+from app import app
+from app.upstream import fetch
+from app.utils import timestamp_from_string, prepare_json_output, cache_data, fetch_cached_data, build_cache_key, concurrent_map_until, json_response
 
 mod = Blueprint("posts", __name__, url_prefix="/posts")
 
@@ -43,6 +44,10 @@ TWITTER_URLS_URL = "http://urls.api.twitter.com/1/urls/count.json"
 #-- Tokens
 FQL_TOKEN = "{{urls_str}}"
 
+#-- Social Networks
+NETWORK_FACEBOOK = "facebook"
+NETWORK_TWITTER = "twitter"
+
 #-- Query String Parameters
 PARAM_NESN_POST_CATEGORY = "category"
 PARAM_NESN_POST_COUNT = "count"
@@ -67,17 +72,18 @@ def posts():
     :returns: JSON
     :rtype: flask.Response
     """
-    rv = fetch_cached_data()
-
-    if rv is not None:
-        return jsonify(rv)
-
     args = {
         PARAM_WORDPRESS_POST_CATEGORY : request.args.get(PARAM_NESN_POST_CATEGORY),
         PARAM_WORDPRESS_POST_COUNT : request.args.get(PARAM_NESN_POST_COUNT)
     }
 
-    r = requests.get(url=POSTS_URL, params=args)
+    cache_key = build_cache_key(params=args)
+    rv = fetch_cached_data(cache_key)
+
+    if rv is not None:
+        return json_response(rv)
+
+    r = fetch(url=POSTS_URL, params=args)
     posts = r.json()
 
     # Were any posts found?
@@ -91,15 +97,7 @@ def posts():
 
         urls.append(post["URL"])
 
-    #-- Facebook Request
-    urls_str = (','.join('\'' + url + '\'' for url in urls))
-
-    url = ARG_FQL.replace(FQL_TOKEN, urls_str)
-    args = {PARAM_FACEBOOK_QUERY : url}
-
-    r = requests.get(url=FACEBOOK_GRAPH_URL, params=args)
-
-    fb_response = r.json()
+    facebook, tweets, missing = fetch_social_counts(urls)
 
     vals = {}
     stack = []
@@ -120,16 +118,9 @@ def posts():
         vals["content"] = post["content"]
         vals["url"] = post["URL"]
 
-        #-- Twitter Request
-        args = {PARAM_TWITTER_URL : vals["url"]}
-        r = requests.get(url=TWITTER_URLS_URL, params=args)
-
-        vals["tweets"] = int(r.json()["count"])
-
-        # Match up Facebook data with URL
-        for link_stat in fb_response["data"]:
-            if link_stat["url"] == vals["url"]:
-                vals["facebook"] = {"likes" : link_stat["like_count"], "comments" : link_stat["comment_count"]}
+        # Counts which could not be fetched are null
+        vals["tweets"] = tweets.get(vals["url"])
+        vals["facebook"] = facebook.get(vals["url"])
 
         for category in post["categories"]:
             categories.append(category)
@@ -138,11 +129,88 @@ def posts():
         stack.append(vals.copy())
         vals = {}
 
-    del args, categories, fb_response, r, vals
+    del args, categories, facebook, tweets, r, vals
     out = prepare_json_output(stack)
+    out["meta"]["missing"] = missing
     del stack
 
-    # Automatically cached for 15 minutes
-    cache_data(out)
+    # Automatically cached for 15 minutes. If any counts are missing,
+    # cache for 1 minute so they are filled in soon.
+    cache_data(out, cache_key, timeout=60 if missing else None)
+
+    return json_response(out)
+
+def fetch_social_counts(urls):
+    """
+    Looks up the Facebook and Twitter counts for a list of URLs.
+
+    Facebook answers for every URL in a single FQL query, while Twitter
+    must be asked once per URL. All of the lookups run at the same time
+    on a bounded pool of threads. A lookup which fails or misses the
+    deadline is skipped and its URL is reported as missing.
+
+    :param urls: The URLs of the posts
+    :type urls: list
+
+    :returns: The Facebook counts and the Tweet counts, both indexed
+              by URL, and a dictionary of URLs missing for each network
+    :rtype: tuple
+    """
+    tasks = [(NETWORK_FACEBOOK, urls)] + [(NETWORK_TWITTER, url) for url in urls]
+
+    finished, missed = concurrent_map_until(
+        fetch_social_count,
+        tasks,
+        max_workers=app.config["SOCIAL_MAX_WORKERS"],
+        deadline=app.config["SOCIAL_DEADLINE"]
+    )
+
+    facebook = {}
+    tweets = {}
+
+    for (network, url), count in finished:
+        if NETWORK_FACEBOOK == network:
+            facebook = count
+        else:
+            tweets[url] = count
+
+    missing = {}
+
+    for network, counts in ((NETWORK_FACEBOOK, facebook), (NETWORK_TWITTER, tweets)):
+        urls_missing = [url for url in urls if url not in counts]
+
+        if urls_missing:
+            missing[network] = urls_missing
+
+    return facebook, tweets, missing
+
+def fetch_social_count(task):
+    """
+    Performs a single social network lookup.
+
+    :param task: A tuple of the network and either a URL or, for
+                 Facebook, a list of URLs
+    :type task: tuple
+
+    :returns: The Tweet count or a dictionary of Facebook counts indexed by URL
+    :rtype: int or dict
+    """
+    network, target = task
+
+    #-- Twitter Request
+    if NETWORK_TWITTER == network:
+        r = fetch(url=TWITTER_URLS_URL, params={PARAM_TWITTER_URL : target})
+
+        return int(r.json()["count"])
+
+    #-- Facebook Request
+    urls_str = (','.join('\'' + url + '\'' for url in target))
+
+    args = {PARAM_FACEBOOK_QUERY : ARG_FQL.replace(FQL_TOKEN, urls_str)}
+
+    r = fetch(url=FACEBOOK_GRAPH_URL, params=args)
 
-    return jsonify(out)
+    return dict(
+        (link_stat["url"], {"likes" : link_stat["like_count"], "comments" : link_stat["comment_count"]})
+        for link_stat in r.json()["data"]
+    )
@@ -12,10 +12,13 @@
     :copyright: (c) 2013 by NESN.
     :license: BSD, see LICENSE for more details.
 """
-from flask import Blueprint, jsonify
-import re
-from app.utils import prepare_json_output, cache_data, fetch_cached_data, logcat
-from app.helpers import help_fetch_soup, help_parse_soup, help_get_list_from_dropdown
+from flask import Blueprint
+from app import app
+from app.throttle import LANE_BULK, lane
+from app.utils import prepare_json_output, cache_data, fetch_cached_data, build_cache_key, concurrent_map_until, logcat, json_response
+from app.helpers import help_fetch_rows, help_get_list_from_dropdown
+from app.cells import cell_text, cell_int, cell_digits
+from app.schema import compile_schema
 
 mod = Blueprint("rankings", __name__, url_prefix="/rankings")
 
@@ -35,10 +38,11 @@ def golf():
     """
     out = rankings_helper(
         url=RANKINGS_URL + "golf/final.asp",
-        parser_func=parse_golf_soup
+        parser_func=parse_golf_soup,
+        sport="golf"
     )
 
-    return jsonify(out)
+    return json_response(out)
 
 @mod.route("/tennis/", methods=["GET"])
 def tennis():
@@ -50,13 +54,14 @@ def tennis():
     """
     out = rankings_helper(
         url=RANKINGS_URL + "tennis/rankings.asp",
-        parser_func=parse_tennis_soup
+        parser_func=parse_tennis_soup,
+        sport="tennis"
     )
 
-    return jsonify(out)
+    return json_response(out)
 
 #-- Helpers
-def rankings_helper(url, parser_func):
+def rankings_helper(url, parser_func, sport):
     """
     Returns all rankings for all matches
 
@@ -64,109 +69,89 @@ def rankings_helper(url, parser_func):
     :type url: str
     :param parser_func: The parsing function to be applied to the scraped
     :type parser_func: str
+    :param sport: "golf" or "tennis"
+    :type sport: str
     :returns: A formatted dictionary ready for display
     :rtype: dict
     """
 
-    rv = fetch_cached_data()
+    cache_key = build_cache_key(sport=sport)
+    rv = fetch_cached_data(cache_key)
 
     if rv is not None:
         return rv
 
     tour = help_get_list_from_dropdown(url, attr_name="tour")
 
-    stack = {}
-
-    for the_round in tour:
-        soup = help_fetch_soup(
+    def fetch_round(the_round):
+        return help_fetch_rows(
             url=url,
+            parser_func=parser_func,
             request_params={PARAM_TOUR : the_round}
         )
 
-        stack[the_round] = help_parse_soup(soup, parser_func)
+    # Fetch every tour in parallel. The ones that don't make it before
+    # the deadline are reported in meta instead of holding up the rest.
+    # This is a crawl, so it yields to interactive requests.
+    with lane(LANE_BULK):
+        finished, missed = concurrent_map_until(
+            fetch_round,
+            tour,
+            max_workers=app.config["RANKINGS_MAX_WORKERS"],
+            deadline=app.config["RANKINGS_DEADLINE"]
+        )
 
-    return stack
+    stack = dict(finished)
 
     out = prepare_json_output(stack)
+    out["meta"]["missed"] = missed
     del stack
 
-    # Cache for 12 hours
-    cache_data(data=out, timeout=60 * 60 * 12)
+    # Cache for 12 hours. If any tours are missing, cache for 1 minute
+    # so the next request has a chance to fill them in.
+    cache_data(data=out, cache_key=cache_key, timeout=60 if missed else 60 * 60 * 12)
 
     return out
 
-def parse_tennis_soup(cells):
-    """Returns all rankings for all matches
-
-    :param cells: A list of HTML <td>
-    :type url: list
-    :returns: A formatted dictionary representing 1 record
-    :rtype: dict
-    """
-    value_dict = {}
-    value_dict["player"] = cells[1].extract().text.strip().encode("utf-8")
-    value_dict["country"] = cells[2].extract().text.strip().encode("utf-8")
-    value_dict["points"] = re.sub(r"\D", '', cells[3].extract().text.encode("utf-8") )
-    value_dict["earnings_usd"] = re.sub(r"\D", '', cells[4].extract().text.encode("utf-8") )
-
-    value_dict["earnings_usd"] = 0 if not value_dict["earnings_usd"] else value_dict["earnings_usd"]
-    value_dict["points"] = 0 if not value_dict["points"] else value_dict["points"]
-
-    try:
-        value_dict["points"] = int(value_dict["points"])
-        value_dict["earnings_usd"] = int(value_dict["earnings_usd"])
-    except Exception:
-        pass
-
-    return value_dict
-
-def parse_golf_soup(cells):
+def nest_golf_score(row, cells):
     """
-    Converts the cells into a structured dictionary object which is
-    Converts the cells into a structured dictionary object which is
-    to be converted into JSON
+    Gathers the round scores and the total of a decoded golf row under
+    "score".
 
-    :param cells: A list of HTML <td>
-    :type url: list
-    :returns: A formatted dictionary representing 1 record
+    :param row: The decoded row
+    :type row: dict
+    :returns: The row
     :rtype: dict
     """
-    value_dict = {}
-
-    score_total_index = (len(cells) - 1) - 1
-    logcat(score_total_index)
-
-    #
-    # position = re.sub(r"\D", '', cells[0].extract().text.encode("utf-8") )
-
-    value_dict["player"] = cells[1].extract().text.strip().encode("utf-8")
-    value_dict["to_par"] = cells[2].extract().text.strip().encode("utf-8")
-    value_dict["score"] = { "total" : 0, "round" : [] }
-
-    # The range is pre-defined.
-    for i in xrange(3,7):
-        # Replace '-' so only integers are left
-        round_score = re.sub(r"\D", '', cells[i].extract().text.encode("utf-8") )
-        round_score = 0 if not round_score else round_score
-        value_dict["score"]["round"].append(int(round_score))
-
-    # if 10 == len(cells):
-    #     # If we have a row of 10 cells, then the row structure is...
-    #     # Pos | Name | To Par | 1 | 2 | 3 | 4 | P | Total  Earnings
-    #     score_total_index = 8
-
-    # elif 9 == len(cells):
-    #     # Else, if we have a row of 9 cells, then the row structure is...
-    #     # Pos | Name | To Par | 1 | 2 | 3 | 4 | Total  Earnings
-    #     score_total_index = 7
-
-    value_dict["score"]["total"] = int(cells[score_total_index].extract().text)
-
-    # Earnings for both golf and tennis is the last row
-    value_dict["earnings_usd"] = re.sub(r"\D", '', cells[-1].extract().text.encode("utf-8") )
-
-    value_dict["earnings_usd"] = 0 if not value_dict["earnings_usd"] else value_dict["earnings_usd"]
-    value_dict["earnings_usd"] = int(value_dict["earnings_usd"])
-
-    return value_dict
+    row["score"] = {
+        "total" : row.pop("total"),
+        "round" : [row.pop("round_%d" % i) for i in xrange(1, 5)]
+    }
+
+    return row
+
+#-- Table layouts
+# Rank | Player | Country | Points | Earnings
+parse_tennis_soup = compile_schema([
+    ("player", 1, cell_text),
+    ("country", 2, cell_text),
+    ("points", 3, cell_digits),
+    ("earnings_usd", 4, cell_digits)
+])
+
+# Pos | Name | To Par | 1 | 2 | 3 | 4 | Total | Earnings
+#
+# Some leaderboards have a playoff column before the total, so the total
+# is found by counting from the end. Earnings for both golf and tennis
+# is the last column.
+parse_golf_soup = compile_schema([
+    ("player", 1, cell_text),
+    ("to_par", 2, cell_text),
+    ("round_1", 3, cell_digits),
+    ("round_2", 4, cell_digits),
+    ("round_3", 5, cell_digits),
+    ("round_4", 6, cell_digits),
+    ("total", -2, cell_int),
+    ("earnings_usd", -1, cell_digits)
+], finish=nest_golf_score)
 
@@ -13,9 +13,11 @@
     :license: BSD, see LICENSE for more details.
 """
 from re import sub
-from flask import Blueprint, jsonify, abort
-from app.utils import prepare_json_output, cache_data, fetch_cached_data
-from app.helpers import help_fetch_soup, help_parse_soup, format_height, get_team_id
+from flask import Blueprint, abort
+from app.utils import prepare_json_output, cache_data, fetch_cached_data, build_cache_key, json_response
+from app.helpers import help_fetch_rows, get_team_id, cell_height, cell_experience, cell_bats_throws
+from app.cells import cell_int, cell_raw_text, cell_text_or_none
+from app.schema import compile_schema
 
 mod = Blueprint("roster", __name__, url_prefix="/roster")
 
@@ -44,7 +46,7 @@ def mlb(team):
     :rtype: flask.Response
     """
 
-    return jsonify(roster_helper(sport="mlb", team=team, parser_func=parse_mlb_soup))
+    return json_response(roster_helper(sport="mlb", team=team, parser_func=parse_mlb_soup))
 
 @mod.route("/nhl/<team>", methods=["GET"])
 def nhl(team):
@@ -57,7 +59,7 @@ def nhl(team):
     :returns: A JSON response
     :rtype: flask.Response
     """
-    return jsonify(roster_helper(sport="nhl", team=team, parser_func=parse_nhl_soup))
+    return json_response(roster_helper(sport="nhl", team=team, parser_func=parse_nhl_soup))
 
 @mod.route("/nfl/<team>", methods=["GET"])
 def nfl(team):
@@ -70,7 +72,7 @@ def nfl(team):
     :returns: A JSON response
     :rtype: flask.Response
     """
-    return jsonify(roster_helper(sport="fb", team=team, parser_func=parse_nfl_soup))
+    return json_response(roster_helper(sport="fb", team=team, parser_func=parse_nfl_soup))
 
 @mod.route("/nba/<team>", methods=["GET"])
 def nba(team):
@@ -83,7 +85,7 @@ def nba(team):
     :returns: A JSON response
     :rtype: flask.Response
     """
-    return jsonify(roster_helper(sport="nba", team=team, parser_func=parse_nba_soup))
+    return json_response(roster_helper(sport="nba", team=team, parser_func=parse_nba_soup))
 
 def roster_helper(sport, team, parser_func):
     """
@@ -108,92 +110,75 @@ def roster_helper(sport, team, parser_func):
     if team_id is None:
         abort(404)
 
-    rv = fetch_cached_data(args=sport + str(team_id))
+    cache_key = build_cache_key(sport=sport, team_id=team_id)
+    rv = fetch_cached_data(cache_key)
 
     if rv is not None:
         return rv
 
-    soup = help_fetch_soup(
+    rows = help_fetch_rows(
         url=ROSTER_URL.replace(SPORT_TOKEN, sport),
+        parser_func=parser_func,
         request_params={
             PARAM_TEAM : team_id,
             PARAM_RESOURCE_TYPE: ARG_RESOURCE_TYPE
         }
     )
-    out = prepare_json_output(help_parse_soup(soup, parser_func))
+    out = prepare_json_output(rows)
 
-    del soup
+    del rows
 
     # Cache for 24 hours
-    cache_data(data=out, args=sport + str(team_id), timeout=60 * 60 * 24)
+    cache_data(data=out, cache_key=cache_key, timeout=60 * 60 * 24)
 
     return out
 
-def parse_mlb_soup(cells):
-    vals = {}
-    vals["number"] = int(cells[0].extract().text.strip().encode("utf-8"))
-    vals["name"] = cells[1].extract().text.encode("utf-8")
-    vals["position"] = cells[2].extract().text.encode("utf-8")
-
-    # Split the string "R/R" and assign each value to a different
-    # dict key. This is called unpacking. So slick
-    vals["bats"], vals["throws"] = cells[3].extract().text.strip().encode("utf-8").split('/')
-
-    vals["status"] = cells[4].extract().text.encode("utf-8")
-    vals["height"] = format_height(cells[5].extract().text.encode("utf-8"))
-
-    vals["weight"] = int(cells[6].extract().text.encode("utf-8"))
-    vals["born"] = cells[7].extract().text.encode("utf-8")
-    vals["birthplace"] = cells[8].extract().text.encode("utf-8")
-
-    return vals
-
-def parse_nhl_soup(cells):
-    vals = {}
-    vals["number"] = int(cells[0].extract().text.strip().encode("utf-8"))
-    vals["name"] = cells[1].extract().text.encode("utf-8")
-    vals["position"] = cells[2].extract().text.encode("utf-8")
-    vals["height"] = format_height(cells[3].extract().text.encode("utf-8"))
-    vals["weight"] = int(cells[4].extract().text.encode("utf-8"))
-    vals["born"] = cells[5].extract().text.encode("utf-8")
-    vals["birthplace"] = cells[6].extract().text.encode("utf-8")
-
-    return vals
-
-def parse_nfl_soup(cells):
-    # Num   Name    Pos Exp Ht  Wt  Born    Birthplace  College
-    vals = {}
-    vals["number"] = int(cells[0].extract().text.strip().encode("utf-8"))
-    vals["name"] = cells[1].extract().text.encode("utf-8")
-    vals["position"] = cells[2].extract().text.encode("utf-8")
-    vals["experience"] = cells[3].extract().text.encode("utf-8")
-
-    vals["experience"] = 0 if 'R' == vals["experience"] else int(vals["experience"])
-
-    vals["height"] = format_height(cells[4].extract().text.encode("utf-8"))
-    vals["weight"] = int(cells[5].extract().text.encode("utf-8"))
-    vals["born"] = cells[6].extract().text.encode("utf-8")
-    vals["birthplace"] = cells[7].extract().text.encode("utf-8")
-    vals["college"] = cells[8].extract().text.encode("utf-8")
-
-    return vals
-def parse_nba_soup(cells):
-    # No.   Name    Pos Exp College Ht  Wt  Inj
-
-    vals = {}
-    vals["number"] = int(cells[0].extract().text.strip().encode("utf-8"))
-    vals["name"] = cells[1].extract().text.encode("utf-8")
-    vals["position"] = cells[2].extract().text.encode("utf-8")
-    vals["experience"] = cells[3].extract().text.encode("utf-8")
-
-    vals["experience"] = 0 if 'R' == vals["experience"] else int(vals["experience"])
-
-    vals["college"] = cells[4].extract().text.encode("utf-8")
-
-    vals["height"] = format_height(cells[5].extract().text.encode("utf-8"))
-    vals["weight"] = int(cells[6].extract().text.encode("utf-8"))
-    vals["injuries"] = cells[7].extract().text.strip().encode("utf-8")
-
-    vals["injuries"] = None if not vals["injuries"] else vals["injuries"]
-
-    return vals
+#-- Table layouts
+# No. | Name | Pos | B/T | Status | Ht | Wt | Born | Birthplace
+parse_mlb_soup = compile_schema([
+    ("number", 0, cell_int),
+    ("name", 1, cell_raw_text),
+    ("position", 2, cell_raw_text),
+    (("bats", "throws"), 3, cell_bats_throws),
+    ("status", 4, cell_raw_text),
+    ("height", 5, cell_height),
+    ("weight", 6, cell_int),
+    ("born", 7, cell_raw_text),
+    ("birthplace", 8, cell_raw_text)
+])
+
+# No. | Name | Pos | Ht | Wt | Born | Birthplace
+parse_nhl_soup = compile_schema([
+    ("number", 0, cell_int),
+    ("name", 1, cell_raw_text),
+    ("position", 2, cell_raw_text),
+    ("height", 3, cell_height),
+    ("weight", 4, cell_int),
+    ("born", 5, cell_raw_text),
+    ("birthplace", 6, cell_raw_text)
+])
+
+# Num | Name | Pos | Exp | Ht | Wt | Born | Birthplace | College
+parse_nfl_soup = compile_schema([
+    ("number", 0, cell_int),
+    ("name", 1, cell_raw_text),
+    ("position", 2, cell_raw_text),
+    ("experience", 3, cell_experience),
+    ("height", 4, cell_height),
+    ("weight", 5, cell_int),
+    ("born", 6, cell_raw_text),
+    ("birthplace", 7, cell_raw_text),
+    ("college", 8, cell_raw_text)
+])
+
+# No. | Name | Pos | Exp | College | Ht | Wt | Inj
+parse_nba_soup = compile_schema([
+    ("number", 0, cell_int),
+    ("name", 1, cell_raw_text),
+    ("position", 2, cell_raw_text),
+    ("experience", 3, cell_experience),
+    ("college", 4, cell_raw_text),
+    ("height", 5, cell_height),
+    ("weight", 6, cell_int),
+    ("injuries", 7, cell_text_or_none)
+])
@@ -13,13 +13,15 @@
     :copyright: (c) 2013 by NESN.
     :license: BSD, see LICENSE for more details.
 """
-from flask import Blueprint, jsonify, abort
-from re import match, sub, split
+from flask import Blueprint, abort
+import re
 from datetime import date
 from calendar import month_abbr
 from app import app
-from app.utils import timestamp_from_string, prepare_json_output, fetch_cached_data, cache_data, logcat
-from app.helpers import help_fetch_soup, help_parse_soup, format_int_for_stats, format_month_number_for_stats, get_team_id
+from app.utils import timestamp_from_string, prepare_json_output, fetch_cached_data, cache_data, build_cache_key, concurrent_map, logcat, json_response
+from app.helpers import help_fetch_parsed, help_fetch_rows, help_parse_soup, format_int_for_stats, format_month_number_for_stats, get_team_id
+from app.cells import cell_text, cell_text_or_none, link_text, gmt_time
+from app.schema import compile_schema, compile_layouts
 
 mod = Blueprint("schedule", __name__, url_prefix="/schedule")
 
@@ -31,6 +33,11 @@ SCHEDULE_URL = "http://stats.nesn.com/" + SPORT_TOKEN + "/teamstats.asp"
 CACHE_TIMEOUT = 60 * 60 * 24    # 24 hours
 MONTH_ABBREVIATION_LIST = [v for k,v in enumerate(month_abbr)]
 
+#-- Regular Expressions
+_result_delimiter_re = re.compile(r"\s|-")
+_away_game_re = re.compile(r"^(@|at)\s+")
+_opponent_prefix_re = re.compile(r"^(vs.?|@|at)\s+")
+
 #-- Query String Parameters
 PARAM_TEAM = "teamno"
 PARAM_MONTH = "month"
@@ -58,7 +65,7 @@ def mlb(team):
         parser_func=parse_mlb_soup
     )
 
-    return jsonify(out)
+    return json_response(out)
 
 @mod.route("/nhl/<team>", methods=["GET"])
 def nhl(team):
@@ -79,7 +86,7 @@ def nhl(team):
         parser_func=parse_nhl_soup
     )
 
-    return jsonify(out)
+    return json_response(out)
 
 @mod.route("/nfl/<team>", methods=["GET"])
 def nfl(team):
@@ -105,7 +112,7 @@ def nfl(team):
         parser_func=parse_nfl_soup
     )
 
-    return jsonify(out)
+    return json_response(out)
 
 
 #-- Helpers
@@ -139,7 +146,8 @@ def schedule_helper(sport, team, from_month=None, to_month=None, parser_func=Non
     if team_id is None:
         abort(404)
 
-    rv = fetch_cached_data(args=sport + str(team_id))
+    cache_key = build_cache_key(sport=sport, team_id=team_id)
+    rv = fetch_cached_data(cache_key)
 
     if rv is not None:
         return rv
@@ -154,10 +162,12 @@ def schedule_helper(sport, team, from_month=None, to_month=None, parser_func=Non
             PARAM_TEAM : format_int_for_stats(team_id),
             PARAM_RESOURCE_TYPE: ARG_RESOURCE_TYPE
         }
-        soup = help_fetch_soup(url, request_params=args)
-
-        # Only use the first table
-        stack = help_parse_soup(soup("table")[0], parser_func)
+        stack = help_fetch_parsed(
+            url,
+            parser_func=parse_first_table,
+            parser_args=(parser_func,),
+            request_params=args
+        )
 
     # Iterate through schedules which have a separate URL for each month
     else:
@@ -171,7 +181,7 @@ def schedule_helper(sport, team, from_month=None, to_month=None, parser_func=Non
 
         to_month = to_month + 12 if to_month < from_month else to_month
 
-        for month in xrange(from_month, to_month):
+        def fetch_month(month):
             # Build the argument list for STATS.
             args = {
                 PARAM_TEAM : format_int_for_stats(team_id),
@@ -179,145 +189,65 @@ def schedule_helper(sport, team, from_month=None, to_month=None, parser_func=Non
                 PARAM_MONTH : format_month_number_for_stats(month, pad_with_zero=True)
             }
 
-            # http://stackoverflow.com/questions/15871769/using-beautiful-soup-grabbing-stuff-between-li-and-li
-            soup = help_fetch_soup(url, request_params=args)
-
+            # Each month is parsed as soon as it arrives
+            return help_fetch_rows(
+                url,
+                parser_func=parser_func,
+                parser_args=(format_month_number_for_stats(month),),
+                request_params=args
+            )
+
+        # The months are fetched in parallel, but concurrent_map() hands
+        # them back in calendar order.
+        month_list = concurrent_map(
+            fetch_month,
+            xrange(from_month, to_month),
+            max_workers=app.config["SCHEDULE_MAX_WORKERS"]
+        )
+
+        for rows in month_list:
             # Must use += to make this a flat list
-            stack += help_parse_soup(soup, parser_func, format_month_number_for_stats(month))
-            # stack[month] = help_parse_soup(soup, parser_func, month)
+            stack += rows
 
 
     out = prepare_json_output(stack)
-    cache_data(data=out, args=sport + str(team_id), timeout=CACHE_TIMEOUT)
+    cache_data(data=out, cache_key=cache_key, timeout=CACHE_TIMEOUT)
     return out
 
-def parse_nhl_soup(cells, month):
-    """
-    Returns all rankings for all matches. This is called once per row
-    in the table. If there are 10 rows in the table, this function will
-    be called 10 times.
-
-    :param cells: A list of <td> elements
-    :type cells: list
-    :param month: The month of the schedule
-    :type cells: int
-    :returns: A formatted dictionary representing 1 record
-    :rtype: dict
+def parse_first_table(soup, parser_func):
     """
-    # Date | Opponent | Time | TV | Result
-
-    vals = {}
-    game_time = None
-
-    opponent = cells[1].extract().text.strip().encode("utf-8")
+    Parses each row of the first table only, for schedules which list
+    more than the team's games below it.
 
-    vals["is_home_game"] = is_home_game(opponent)
-    vals["opponent"] = strip_opponent_string(opponent)
+    :param soup: The tables of the page
+    :type soup: bs4.BeautifulSoup or rows.Node
 
-    # 5 columns for future games. At the time of writing this, this is
-    # all there is.
-    if 5 == len(cells):
-        game_time = help_build_date_string(cells=cells, indices=[0, 2], month=month)
-        vals["networks"] = help_build_tv_network_list(cells, col_idx=3)
-        vals["ts"] = int(timestamp_from_string(game_time))
+    :param parser_func: A callback function. Must accept a list of cells
+    :type parser_func: function
 
-    return vals
-
-def parse_mlb_soup(cells, month):
-    # All Spring Training Games, Past and Future (5 columns)
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # Date | Opp | Time | TV | Result
-    #
-    #
-    # Regular and Post Season Past Game (8 columns)
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # Date | Opp | Result | Rec | Win | Loss | Save | Att
-    #
-    #
-    # Regular and Post Season Future Game (5 or 6 columns)
-    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    # Date | Opp | Time | TV | My Team : Pitcher | Opp: Pitcher
-    #
-    # The columns "My Team: Pitcher" and "Opp: Pitcher" may be combined
-    # together if both are unknowns, making the column count 5
-
-
-    vals = {}
-
-    game_time = help_build_date_string(cells=cells, indices=[0, 2], month=month)
-    opponent = cells[1].extract().text.strip().encode("utf-8")
-
-    vals["is_home_game"] = is_home_game(opponent)
-    vals["opponent"] = strip_opponent_string(opponent)
-
-    if len(cells) >= 5 and len(cells) < 8:
-
-        #-- Spring Training
-        if month < 4:
-            vals["result"] = help_parse_result(cells, col_idx=4, find="result")
-            vals["score"] = help_parse_result(cells, col_idx=4, find="score")
-
-        #-- Regular and Post Season: Future Games
-        else:
-            # Do we know who is pitching? If so, there will be 6 columns
-            if 6 == len(cells):
-                vals["home_pitcher"] = cells[4].extract().text.strip().encode("utf-8")
-                vals["opp_pitcher"] = cells[5].extract().text.strip().encode("utf-8")
-
-        game_time = help_build_date_string(cells=cells, indices=[0, 2], month=month)
-        vals["networks"] = help_build_tv_network_list(cells, col_idx=3)
-        vals["ts"] = int(timestamp_from_string(game_time))
-
-    #-- Regular and Post Season: Past Games
-    elif 8 == len(cells):
-        vals["result"] = help_parse_result(cells, col_idx=2, find="result")
-        vals["score"] = help_parse_result(cells, col_idx=2, find="score")
-        vals["winning_pitcher"] = cells[4].extract().text.strip().encode("utf-8")
-        vals["losing_pitcher"] = cells[5].extract().text.strip().encode("utf-8")
-        vals["save"] = cells[6].extract().text.strip().encode("utf-8")
-        vals["save"] = None if not vals["save"] else vals["save"]
-
-    return vals
+    :returns: A list of parsed rows
+    :rtype: list
+    """
+    return help_parse_soup(soup("table")[0], parser_func)
 
-def parse_nfl_soup(cells):
+def add_game_time(row, cells, month):
     """
-    Returns all rankings for all matches. This is called once per row
-    in the table. If there are 10 rows in the table, this function will
-    be called 10 times.
+    Adds the timestamp of a game, which is spread across the date and
+    time cells, to a decoded row.
 
+    :param row: The decoded row
+    :type row: dict
     :param cells: A list of <td> elements
     :type cells: list
     :param month: The month of the schedule
-    :type cells: int
-    :returns: A formatted dictionary representing 1 record
+    :type month: int
+    :returns: The row
     :rtype: dict
     """
-    # Week | Day | Date | Opponent | Time | TV | Result
-    vals = {}
-
-    # Bye week
-    if 2 == len(cells):
-        vals["is_bye_week"] = True
-
-    else:
-        game_time = None
-        game_time = help_build_date_string(cells=cells, indices=[1, 4])
-
-        opponent = cells[3].extract().text.strip().encode("utf-8")
-
-        vals["is_home_game"] = is_home_game(opponent)
-        vals["opponent"] = strip_opponent_string(opponent)
-        vals["networks"] = help_build_tv_network_list(cells, col_idx=5)
-        vals["result"] = help_parse_result(cells, col_idx=6, find="result")
-
-        vals["score"] = help_parse_result(cells, col_idx=6, find="score")
-
-        # vals["score"] = {
-        #     "new_england" : vals["score"][0],
-        #     "opponent" : vals["score"][1]
-        # }
+    game_time = help_build_date_string(cells=cells, indices=[0, 2], month=month)
+    row["ts"] = int(timestamp_from_string(game_time))
 
-    return vals
+    return row
 
 def help_build_date_string(cells, indices, month=None):
     """
@@ -339,7 +269,7 @@ def help_build_date_string(cells, indices, month=None):
     """
 
     # Past and future games will always have the date
-    date_str = cells[indices[0]].extract().text.strip().encode("utf-8")
+    date_str = cell_text(cells[indices[0]])
 
     if month is not None:
         date_str += ' ' + MONTH_ABBREVIATION_LIST[month]
@@ -347,24 +277,24 @@ def help_build_date_string(cells, indices, month=None):
     date_str += ' ' + str(date.today().year)
 
     # Only future games will have the time
-    if len(indices) > 1:
-        try:
-            # STATS always provides multiple timezones, find the GMT one
-            date_str += ' ' + cells[indices[1]].find(name="span", attrs={"class" : "shsGMTZone"}).extract().text.encode("utf-8")
-        except Exception:
-            pass
+    if len(indices) > 1 and indices[1] < len(cells):
+        # STATS always provides multiple timezones, find the GMT one
+        time_str = gmt_time(cells[indices[1]])
+
+        if time_str is not None:
+            date_str += ' ' + time_str
 
     return date_str
 
-def help_parse_result(cells, col_idx, find=None):
+def help_parse_result(cell, find=None):
     if "score" == find:
-        vals = cells[col_idx].find('a').text.strip().encode("utf-8")
+        vals = link_text(cell)
     else:
-        vals = cells[col_idx].text.strip().encode("utf-8")
+        vals = cell_text(cell)
 
     # Split on whitespace and hyphens while ignoring delimiters
     # Example result: ['W', '23', '17']
-    vals = split(r"\s|-", vals)
+    vals = _result_delimiter_re.split(vals)
 
     if "result" == find:
         # This will be either a W or L
@@ -388,11 +318,11 @@ def help_parse_result(cells, col_idx, find=None):
         except Exception:
             pass
 
-def help_build_tv_network_list(cells, col_idx):
+def help_build_tv_network_list(cell):
     """
     Returns a list of Networks, or None if none is listed
     """
-    rv = cells[col_idx].extract().text.strip().encode("utf-8")
+    rv = cell_text(cell)
 
     return None if not rv else rv.split('/')
 
@@ -401,7 +331,7 @@ def is_home_game(opponent):
 
     # An exception will be thrown if match() returns None
     try:
-        rv = False if bool(match(r"^(@|at)\s+", opponent)) else True
+        rv = False if bool(_away_game_re.match(opponent)) else True
         pass
     except Exception:
         rv = False
@@ -409,4 +339,117 @@ def is_home_game(opponent):
     return rv
 
 def strip_opponent_string(opponent):
-    return sub(r"^(vs.?|@|at)\s+", '', opponent)
+    return _opponent_prefix_re.sub('', opponent)
+
+#-- Converters
+def cell_opponent(cell):
+    """
+    Returns whether the game is at home, and the opponent without the
+    "vs." or "@" in front of it.
+
+    :rtype: tuple
+    """
+    opponent = cell_text(cell)
+
+    return is_home_game(opponent), strip_opponent_string(opponent)
+
+def cell_result(cell):
+    return help_parse_result(cell, find="result")
+
+def cell_score(cell):
+    return help_parse_result(cell, find="score")
+
+#-- Table layouts
+OPPONENT_COLUMN = (("is_home_game", "opponent"), 1, cell_opponent)
+
+# Date | Opponent | Time | TV | Result
+#
+# 5 columns for future games. At the time of writing this, this is all
+# there is.
+parse_nhl_soup = compile_layouts({
+    5 : compile_schema([
+        OPPONENT_COLUMN,
+        ("networks", 3, help_build_tv_network_list)
+    ], finish=add_game_time)
+}, default=compile_schema([OPPONENT_COLUMN]))
+
+# All Spring Training Games, Past and Future (5 columns)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Date | Opp | Time | TV | Result
+MLB_SPRING_TRAINING_SCHEMA = compile_schema([
+    OPPONENT_COLUMN,
+    ("result", 4, cell_result),
+    ("score", 4, cell_score),
+    ("networks", 3, help_build_tv_network_list)
+], finish=add_game_time)
+
+# Regular and Post Season Past Game (8 columns)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Date | Opp | Result | Rec | Win | Loss | Save | Att
+MLB_PAST_GAME_SCHEMA = compile_schema([
+    OPPONENT_COLUMN,
+    ("result", 2, cell_result),
+    ("score", 2, cell_score),
+    ("winning_pitcher", 4, cell_text),
+    ("losing_pitcher", 5, cell_text),
+    ("save", 6, cell_text_or_none)
+])
+
+# Regular and Post Season Future Game (5 or 6 columns)
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Date | Opp | Time | TV | My Team : Pitcher | Opp: Pitcher
+#
+# The columns "My Team: Pitcher" and "Opp: Pitcher" may be combined
+# together if both are unknowns, making the column count 5
+MLB_FUTURE_GAME_SCHEMA = compile_schema([
+    OPPONENT_COLUMN,
+    ("networks", 3, help_build_tv_network_list)
+], finish=add_game_time)
+
+MLB_FUTURE_GAME_WITH_PITCHERS_SCHEMA = compile_schema([
+    OPPONENT_COLUMN,
+    ("home_pitcher", 4, cell_text),
+    ("opp_pitcher", 5, cell_text),
+    ("networks", 3, help_build_tv_network_list)
+], finish=add_game_time)
+
+MLB_SPRING_TRAINING_LAYOUTS = compile_layouts({
+    5 : MLB_SPRING_TRAINING_SCHEMA,
+    6 : MLB_SPRING_TRAINING_SCHEMA,
+    7 : MLB_SPRING_TRAINING_SCHEMA,
+    8 : MLB_PAST_GAME_SCHEMA
+}, default=compile_schema([OPPONENT_COLUMN]))
+
+MLB_SEASON_LAYOUTS = compile_layouts({
+    5 : MLB_FUTURE_GAME_SCHEMA,
+    6 : MLB_FUTURE_GAME_WITH_PITCHERS_SCHEMA,
+    7 : MLB_FUTURE_GAME_SCHEMA,
+    8 : MLB_PAST_GAME_SCHEMA
+}, default=compile_schema([OPPONENT_COLUMN]))
+
+def parse_mlb_soup(cells, month):
+    """
+    Returns all rankings for all matches. This is called once per row
+    in the table.
+
+    :param cells: A list of <td> elements
+    :type cells: list
+    :param month: The month of the schedule
+    :type month: int
+    :returns: A formatted dictionary representing 1 record
+    :rtype: dict
+    """
+    layouts = MLB_SPRING_TRAINING_LAYOUTS if month < 4 else MLB_SEASON_LAYOUTS
+
+    return layouts(cells, month)
+
+# Week | Day | Date | Opponent | Time | TV | Result
+parse_nfl_soup = compile_layouts({
+    # Bye week
+    2 : lambda cells: {"is_bye_week" : True}
+}, default=compile_schema([
+    (("is_home_game", "opponent"), 3, cell_opponent),
+    ("networks", 5, help_build_tv_network_list),
+    ("result", 6, cell_result),
+    ("score", 6, cell_score)
+]))
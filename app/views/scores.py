@@ -12,16 +12,24 @@
     before the HTML can be passed to BeautifulSoup, the document must be
     stripped of the call to document.write().
 
+    How long a scoreboard is cached depends on its day and on the state
+    of its games. A day with a game in progress is cached for seconds,
+    while a day in the past is cached for weeks. See
+    choose_scoreboard_ttl().
+
     :author: Jeff Kereakoglow
     :date: 2013-09-09
     :copyright: (c) 2013 by NESN.
     :license: BSD, see LICENSE for more details.
 """
-from flask import Blueprint, jsonify
-from app.utils import prepare_json_output, cache_data, fetch_cached_data
+import re
+from flask import Blueprint
+from bs4.element import Tag
+from app.utils import prepare_json_output, cache_data, fetch_cached_data, build_cache_key, json_response, rebuild_cached_payload
 from datetime import date
 from app.utils import slugify, logcat
-from app.helpers import stats_date_string, help_fetch_soup
+from app.helpers import stats_date_string, help_fetch_soup, scoreboard_ttl_rules
+from app.cells import GMT_ZONE_CLASS, cell_text, link_text
 
 mod = Blueprint("scores", __name__, url_prefix="/scores")
 SCORES_URL = "http://stats.nesn.com/multisport/today.js.asp"
@@ -31,6 +39,51 @@ PARAM_SPORT = "sport"
 PARAM_DATE = "day"
 PARAM_LEAGUE = "lg"
 
+# How STATS names the leagues it doesn't name after themselves
+LEAGUES_BY_SPORT = {"fb" : "nfl"}
+
+# Seconds a scoreboard is cached for when its league has no TTL rules
+DEFAULT_TTL = 60
+
+#-- Game states
+STATE_UPCOMING = "upcoming"
+STATE_LIVE = "live"
+STATE_FINAL = "final"
+STATE_UNKNOWN = "unknown"
+
+# Statuses of games which haven't started, besides their start time
+UPCOMING_STATUSES = ("preview", "pregame", "tba", "tbd")
+
+# Statuses of games in progress, besides the inning or period they're in
+LIVE_STATUSES = ("half", "ot", "so", "shootout", "in progress", "delay", "rain delay")
+
+# Statuses of games which are over, or won't be played at all
+FINAL_STATUSES = ("final", "postponed", "ppd", "cancelled", "canceled", "forfeit")
+
+# A start time, e.g. "7:05 et" or "7:05 pm et", as opposed to the time
+# left in a period, e.g. "12:34 2nd"
+_start_time_re = re.compile(r"^\d{1,2}:\d{2}\s*(?:[ap]\.?m\.?\s*)?(?:[pmce][sd]?t|gmt|utc)")
+
+# An inning or a period, with the time left in it, e.g. "top 5th",
+# "end 9th" or "12:34 2nd", or the minute of a soccer match, e.g. "67'"
+_in_progress_re = re.compile(r"^(?:(?:top|bot|bottom|mid|middle|end)\s+|\d{1,2}:\d{2}\s+)?\d{1,2}(?:st|nd|rd|th)\b|^\d{1,3}(?:\+\d{1,2})?'")
+
+#-- Row types
+ROW_TEAM = "team"
+ROW_TITLE = "title"
+ROW_SECTION = "section"
+
+# Classes of the rows which start a section, and of the status cell.
+# A row or a cell has one of these if any of its class names is part of
+# the string.
+SECTION_CLASSES = "shsTableSubttlRow shsSubSectionRow shsMiniRowSpacer"
+STATUS_CLASSES = "shsMiniStatus"
+
+# The handful of class attributes a scoreboard uses are classified once
+# each, rather than once per row
+_row_types = {}
+_status_classes = {}
+
 # We cannot support the URL scores/ because STATS does a terrible job
 # at distinguishing between sports. As of writing this, NHL preseason
 # games were mixed in with MLB regular season games. This error only
@@ -40,39 +93,39 @@ PARAM_LEAGUE = "lg"
 # @mod.route("/", methods=["GET"])
 # def index():
 #     """Fetches all today's scores for all active sports"""
-#     return jsonify(scores_helper())
+#     return json_response(scores_helper())
 
 @mod.route("/mlb/", methods=["GET"])
 @mod.route("/mlb/<int:year>/<int:month>/<int:day>/", methods=["GET"])
 def mlb(year=None, month=None, day=None):
     """Fetches scoring information for the Major League Baseball"""
-    return jsonify(scores_helper(year, month, day, "mlb"))
+    return json_response(scores_helper(year, month, day, "mlb"))
 
 @mod.route("/nhl/", methods=["GET"])
 @mod.route("/nhl/<int:year>/<int:month>/<int:day>/", methods=["GET"])
 def nhl(year=None, month=None, day=None):
     """Fetches scoring information for the National Hockey League"""
-    return jsonify(scores_helper(year, month, day, "nhl"))
+    return json_response(scores_helper(year, month, day, "nhl"))
 
 @mod.route("/nfl/", methods=["GET"])
 @mod.route("/nfl/<int:year>/<int:month>/<int:day>/", methods=["GET"])
 def nfl(year=None, month=None, day=None):
     """Fetches scoring information for the National Football League"""
     # For some dumb-ass reason, STATS denotes the NFL as FB.
-    return jsonify(scores_helper(year, month, day, "fb"))
+    return json_response(scores_helper(year, month, day, "fb"))
 
 @mod.route("/nba/", methods=["GET"])
 @mod.route("/nba/<int:year>/<int:month>/<int:day>/", methods=["GET"])
 def nba(year=None, month=None, day=None):
     """Fetches scoring information for the National Basketball League"""
     # For some dumb-ass reason, STATS denotes the NFL as FB.
-    return jsonify(scores_helper(year, month, day, "nba"))
+    return json_response(scores_helper(year, month, day, "nba"))
 
 @mod.route("/epl/", methods=["GET"])
 @mod.route("/epl/<int:year>/<int:month>/<int:day>/", methods=["GET"])
 def epl(year=None, month=None, day=None):
     """Fetches scoring information for the English Premier League"""
-    return jsonify(scores_helper(year, month, day, sport="ifb", league="epl"))
+    return json_response(scores_helper(year, month, day, sport="ifb", league="epl"))
 
 def scores_helper(year=None, month=None, day=None, sport=None, league=None):
     """
@@ -98,12 +151,24 @@ def scores_helper(year=None, month=None, day=None, sport=None, league=None):
     :rtype: dict
     """
     try:
-        date_string = stats_date_string(date(year, month, day))
+        the_date = date(year, month, day)
     except (ValueError, TypeError):
-        date_string = stats_date_string()
+        the_date = date.today()
+
+    date_string = stats_date_string(the_date)
+    league_name = league or LEAGUES_BY_SPORT.get(sport, sport)
 
-    rv = fetch_cached_data()
+    cache_key = build_cache_key(sport=sport, date=date_string, params={PARAM_LEAGUE : league})
+    rv = fetch_cached_data(cache_key)
     if rv is not None:
+        # The message names the day the way it was asked for, which
+        # isn't part of the cache key
+        if "message" in rv:
+            message = no_games_message(year, month, day)
+
+            if message != rv["message"]:
+                return rebuild_cached_payload(rv, dict(rv, message=message))
+
         return rv
 
     args = {
@@ -118,112 +183,197 @@ def scores_helper(year=None, month=None, day=None, sport=None, league=None):
         source_file_type="JavaScript",
         class_attrs="shsTable"
     )
+    rows = soup("tr")
 
     # If there is 1 or 0 rows in the document, then, there are probably
     # no scores listed.
-    if len(soup("tr")) <= 2:
-        # del soup
+    if len(rows) <= 2:
+        del soup, rows
 
-        # Cache for a day to be safe
-        out = {"message" : "No games scheduled for "}
+        games = []
+        out = {"message" : no_games_message(year, month, day), "meta" : prepare_json_output(None)["meta"]}
+    else:
+        stack = parse_scores_rows(rows)
+        del soup, rows
 
-        if not month and not day and not year:
-            out["message"] += "today"
-        else:
-            out["message"] += "{month}/{day}/{year}".format(month=month, day=day, year=year)
+        games = scoreboard_games(stack)
+        out = prepare_json_output(stack)
 
-        cache_data(data=out, timeout=60 * 60 * 24)
+    # Every scoreboard reports how long it's cached for
+    ttl, rule = choose_scoreboard_ttl(league_name, the_date, games)
+    out["meta"]["ttl"] = ttl
+    out["meta"]["ttl_rule"] = rule
 
-        return out
+    cache_data(data=out, cache_key=cache_key, timeout=ttl)
 
-    stack = {}
-    vals = []
-    section = ''
-    team = None
-    has_the_status_cell = False
+    return out
+
+def choose_scoreboard_ttl(league, the_date, games):
+    """
+    Picks how many seconds to cache a scoreboard for, following the
+    league's rules in scoreboard_ttl_rules().
+
+    Any game in progress makes it "live". Otherwise, a day after today
+    is "future". A day with a game whose status isn't recognised is
+    "unsettled", and so is a day before today with a game which still
+    shows its start time; either may still change. Any other day before
+    today is "past". Today is "upcoming" while any game has yet to
+    start, "final" once all of them are over, and "no_games" when
+    nothing is scheduled.
+
+    :param league: The league, e.g. "nfl"
+    :type league: str
+
+    :param the_date: The day of the scoreboard
+    :type the_date: datetime.date
 
-    # logcat(str(soup))
+    :param games: The games of the scoreboard
+    :type games: list
 
-    for row in soup("tr"):
+    :returns: The TTL and the name of the rule it came from
+    :rtype: tuple
+    """
+    rules = scoreboard_ttl_rules().get(league)
+
+    if rules is None:
+        return DEFAULT_TTL, "default"
+
+    states = set(game_state(game) for game in games)
+    today = date.today()
+
+    if STATE_LIVE in states:
+        rule = "live"
+    elif the_date > today:
+        rule = "future"
+    elif STATE_UNKNOWN in states:
+        rule = "unsettled"
+    elif the_date < today:
+        rule = "unsettled" if STATE_UPCOMING in states else "past"
+    elif STATE_UPCOMING in states:
+        rule = "upcoming"
+    elif states:
+        rule = "final"
+    else:
+        rule = "no_games"
 
-        # Rows which have team names do not have .
-        # This test must be first.
-        if row.get("class") is None:
-            cells = row("td")
-            has_the_status_cell = False
+    return rules[rule], rule
 
-            # Does this row have a status row?
-            if any(css_class in "shsMiniStatus" for cell in cells for css_class in cell.get("class") ):
-                has_the_status_cell = True
+def game_state(game):
+    """
+    Returns whether a game is yet to start, in progress or over, or
+    that its status isn't one we recognise.
 
-            if len(cells) >= 2:
+    :param game: A game, as parse_scores_rows() returns it
+    :type game: dict
 
-                team = "home" if team is "away" or None else "away"
+    :returns: STATE_UPCOMING, STATE_LIVE, STATE_FINAL or STATE_UNKNOWN
+    :rtype: str
+    """
+    status = game.get("status")
 
-                # If the list of values is empty, then initialize it
-                if not vals:
-                    vals.append({"away": None, "home":None})
+    if status is None or status.startswith(UPCOMING_STATUSES) or _start_time_re.match(status):
+        return STATE_UPCOMING
 
-                # If the list is complete, then append a new item
-                # indicating a new game.
-                elif vals[-1]["away"] and vals[-1]["home"]:
-                    vals.append({"away": None, "home":None})
+    if status.startswith(FINAL_STATUSES):
+        return STATE_FINAL
 
-                # Add scoring information for the game.
-                vals[-1][team] = {
-                    "team": cells[0].find('a').extract().text.strip().encode("utf-8"),
-                    "score": cells[1].extract().text.strip().encode("utf-8")
-                }
+    if status.startswith(LIVE_STATUSES) or _in_progress_re.match(status):
+        return STATE_LIVE
 
-                try:
-                    # Try to convert the string to an int.
-                    vals[-1][team]["score"] = int(vals[-1][team]["score"])
-                except (ValueError, TypeError):
-                    # If it fails, assign null
-                    vals[-1][team]["score"] = None
+    return STATE_UNKNOWN
 
-                if has_the_status_cell:
-                    status = cells[2].find('a')
+def scoreboard_games(stack):
+    """
+    Returns every game of a scoreboard, whether or not it is split into
+    sections.
 
-                    # Arbitrary game information, such as "OT" for
-                    # overtime
-                    extra = cells[2].find('br')
+    :param stack: What parse_scores_rows() returns
+    :type stack: list or dict
 
-                    time = cells[2].find(name="span", attrs={"class" : "shsTimezone shsGMTZone"})
+    :rtype: list
+    """
+    if isinstance(stack, list):
+        return stack
 
-                    # Set the status only if not null
-                    if status:
-                        vals[-1]["status"] = status.extract().text.strip().encode("utf-8")
-                        if 2 == len(vals[-1]["status"].split('-')):
-                            # Save the string to the right of '-' in
-                            # extra
-                            if not extra:
-                                extra = vals[-1]["status"].split('-')[1].strip()
-                            vals[-1]["status"] = vals[-1]["status"].split('-')[0].strip()
+    return [game for games in stack.values() if games for game in games]
 
-                        vals[-1]["status"] = vals[-1]["status"].lower()
+def no_games_message(year=None, month=None, day=None):
+    """
+    Returns the message for a day without any games.
 
-                    if time:
-                        vals[-1]["time"] = time.extract().text.strip().encode("utf-8")
+    :rtype: str
+    """
+    if not month and not day and not year:
+        return "No games scheduled for today"
 
-                    if extra:
-                        # Sometimes, extra contains a NavigableString
-                        try:
-                            vals[-1]["extra"] = extra.extract().text.strip().encode("utf-8")
+    return "No games scheduled for {month}/{day}/{year}".format(month=month, day=day, year=year)
 
-                        # While other times, it's just a str
-                        except:
-                            vals[-1]["extra"] = extra
+def parse_scores_soup(soup):
+    """
+    Pairs up the away and home rows of every game on a scoreboard.
 
-                        vals[-1]["extra"] = vals[-1]["extra"].lower()
+    :param soup: The scoreboard tables
+    :type soup: bs4.BeautifulSoup
 
-        # Skip over the first line, it's the title
-        elif "shsTableTtlRow" in row.get("class"):
-            continue
+    :returns: A list of games or, if the scoreboard is split into
+              sections, a dictionary of lists keyed by section
+    :rtype: list or dict
+    """
+    return parse_scores_rows(soup("tr"))
+
+def parse_scores_rows(rows):
+    """
+    Pairs up the away and home rows of every game on a scoreboard, in a
+    single pass over its rows. See parse_scores_soup().
+
+    :param rows: Every <tr> of the scoreboard, in order
+    :type rows: list
+
+    :rtype: list or dict
+    """
+    stack = {}
+    vals = []
+    section = ''
+    team = None
+    game = None
+
+    for row in rows:
+        kind = row_type(row)
+
+        if ROW_TEAM == kind:
+            cells = row_cells(row)
+
+            if len(cells) < 2:
+                continue
+
+            team = "home" if "away" == team else "away"
+
+            # Start a new game when the list is empty or the last game
+            # is complete
+            if not vals or (game["away"] and game["home"]):
+                game = {"away": None, "home": None}
+                vals.append(game)
 
-        elif any(css_class in "shsTableSubttlRow shsSubSectionRow shsMiniRowSpacer" for css_class in row.get("class")):
-            cell = row("td")
-            section = cell[0].extract().text.strip().encode("utf-8")
+            score = cell_text(cells[1])
+
+            try:
+                # Try to convert the string to an int.
+                score = int(score)
+            except (ValueError, TypeError):
+                # If it fails, assign null
+                score = None
+
+            # Add scoring information for the game.
+            game[team] = {
+                "team": link_text(cells[0]),
+                "score": score
+            }
+
+            if has_status_cell(cells):
+                read_status_cell(cells[2], game)
+
+        elif ROW_SECTION == kind:
+            section = cell_text(row("td")[0])
 
             # Are the scores separated into sections? If so, find the
             # separator
@@ -232,24 +382,156 @@ def scores_helper(year=None, month=None, day=None, sport=None, league=None):
                 if vals:
                     stack[section] = vals
                     vals = []
-                # return section
                 stack[section] = None
 
     # Save the last value
+    if section:
+        stack[section] = vals
     else:
-        if section:
-            stack[section] = vals
-        else:
-            stack = vals
+        stack = vals
 
-    del vals
+    return stack
 
-    out = prepare_json_output(stack)
+def read_status_cell(cell, game):
+    """
+    Reads the status, the time and any extra information, such as "OT"
+    for overtime, of a game out of its status cell.
 
-    # Cache for 1 minute
-    cache_data(data=out, timeout=60)
+    The first link, <br> and GMT time of the cell are found in a single
+    walk over its descendants.
 
-    return out
+    :param cell: The status cell
+    :type cell: bs4.element.Tag
+
+    :param game: The game to add the information to
+    :type game: dict
+    """
+    status = extra = time = None
+
+    for tag in cell.descendants:
+        if not isinstance(tag, Tag):
+            continue
+
+        if status is None and "a" == tag.name:
+            status = tag
+        elif extra is None and "br" == tag.name:
+            extra = tag
+        elif time is None and "span" == tag.name and GMT_ZONE_CLASS in (tag.get("class") or ()):
+            time = tag
+
+        if status is not None and extra is not None and time is not None:
+            break
+
+    # Set the status only if not null
+    if status:
+        text = status.extract().text.strip().encode("utf-8")
+        parts = text.split('-')
+
+        if 2 == len(parts):
+            # Save the string to the right of '-' in extra
+            if not extra:
+                extra = parts[1].strip()
+            text = parts[0].strip()
+
+        game["status"] = text.lower()
+
+    if time:
+        game["time"] = time.extract().text.strip().encode("utf-8")
+
+    if extra:
+        # Sometimes, extra is a <br>
+        if isinstance(extra, Tag):
+            extra = text_after_break(extra).strip().encode("utf-8")
+
+        # While other times, it's just a str
+        game["extra"] = extra.lower()
+
+def row_type(row):
+    """
+    Returns what kind of row a <tr> of the scoreboard is.
+
+    :param row: The row
+    :type row: bs4.element.Tag
+
+    :returns: ROW_TEAM for the rows of a team, which have no class,
+              ROW_TITLE for the title, ROW_SECTION for section headers
+              and spacers, or None for anything else
+    :rtype: str
+    """
+    classes = row.get("class")
+
+    if classes is None:
+        return ROW_TEAM
+
+    key = tuple(classes)
+
+    try:
+        return _row_types[key]
+    except KeyError:
+        pass
+
+    if "shsTableTtlRow" in classes:
+        kind = ROW_TITLE
+    elif any(css_class in SECTION_CLASSES for css_class in classes):
+        kind = ROW_SECTION
+    else:
+        kind = None
+
+    _row_types[key] = kind
+
+    return kind
+
+def row_cells(row):
+    """
+    Returns the cells of a row. This is what row("td") returns, without
+    building a SoupStrainer for every row.
+
+    :rtype: list
+    """
+    return [tag for tag in row.descendants if isinstance(tag, Tag) and "td" == tag.name]
+
+def has_status_cell(cells):
+    """
+    Returns whether a row of a team has the status cell of its game.
+
+    :param cells: The cells of the row
+    :type cells: list
+
+    :rtype: bool
+    """
+    for cell in cells:
+        key = tuple(cell.get("class") or ())
+        has_status = _status_classes.get(key)
+
+        if has_status is None:
+            has_status = _status_classes[key] = any(css_class in STATUS_CLASSES for css_class in key)
+
+        if has_status:
+            return True
+
+    return False
+
+def text_after_break(br):
+    """
+    Returns the text which follows a <br> in its cell.
+
+    html.parser nests everything after an unclosed <br> inside of it,
+    while lxml leaves the <br> empty and puts the rest alongside it.
+    Reading both keeps the result the same for either parser backend.
+
+    :param br: The <br> tag
+    :type br: bs4.element.Tag
+
+    :returns: The text
+    :rtype: unicode
+    """
+    siblings = list(br.next_siblings)
+    text = br.extract().text
+
+    for sibling in siblings:
+        text += sibling.text if isinstance(sibling, Tag) else unicode(sibling)
+
+    return text
 
 def help_parse_nhl_soup(cells):
     pass
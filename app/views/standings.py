@@ -25,9 +25,11 @@
     :copyright: (c) 2013 by NESN.
     :license: BSD, see LICENSE for more details.
 """
-from flask import Blueprint, jsonify
-from app.utils import prepare_json_output, cache_data, fetch_cached_data, slugify, logcat
-from app.helpers import help_fetch_soup
+from flask import Blueprint
+from app.utils import prepare_json_output, cache_data, fetch_cached_data, build_cache_key, slugify, logcat, json_response
+from app.helpers import help_fetch_parsed
+from app.cells import cell_int, cell_float, cell_float_or_zero, link_text
+from app.schema import compile_schema
 
 mod = Blueprint("standings", __name__, url_prefix="/standings")
 
@@ -43,7 +45,7 @@ def mlb():
     :rtype: flask.Response
     """
     url = STANDINGS_URL + "mlb/standings.asp"
-    return jsonify(standings_helper(url, league="mlb"))
+    return json_response(standings_helper(url, league="mlb"))
 
 @mod.route("/nhl/", methods=["GET"])
 def nhl():
@@ -54,7 +56,7 @@ def nhl():
     :rtype: flask.Response
     """
     url = STANDINGS_URL + "nhl/standings.asp"
-    return jsonify(standings_helper(url, league="nhl"))
+    return json_response(standings_helper(url, league="nhl"))
 
 @mod.route("/nfl/", methods=["GET"])
 def nfl():
@@ -66,7 +68,7 @@ def nfl():
     """
     # Remeber! STATS calls the NFL FB. 'Cause why the fuck not?!
     url = STANDINGS_URL + "fb/totalstandings.asp"
-    return jsonify(standings_helper(url, league="nfl"))
+    return json_response(standings_helper(url, league="nfl"))
 
 
 @mod.route("/nba/", methods=["GET"])
@@ -78,7 +80,7 @@ def nba():
     :rtype: flask.Response
     """
     url = STANDINGS_URL + "nba/standings.asp"
-    return jsonify(standings_helper(url, league="nba"))
+    return json_response(standings_helper(url, league="nba"))
 
 @mod.route("/epl/", methods=["GET"])
 def epl():
@@ -89,7 +91,7 @@ def epl():
     :rtype: flask.Response
     """
     url = STANDINGS_URL + "epl/standings.asp"
-    return jsonify(
+    return json_response(
         standings_helper(
             url,
             league="epl",
@@ -106,7 +108,7 @@ def mls():
     :rtype: flask.Response
     """
     url = STANDINGS_URL + "mls/standings.asp"
-    return jsonify(
+    return json_response(
         standings_helper(
             url,
             league="mls",
@@ -129,15 +131,44 @@ def standings_helper(url, league, skip_conference_row=False):
     :rtype: dict
     """
 
-    rv = fetch_cached_data()
+    cache_key = build_cache_key(sport=league)
+    rv = fetch_cached_data(cache_key)
     if rv is not None:
         return rv
 
-    soup = help_fetch_soup(url)
+    stack = help_fetch_parsed(
+        url,
+        parser_func=parse_standings_soup,
+        parser_args=(league, skip_conference_row)
+    )
+
+    out = prepare_json_output(stack)
+    del stack
+
+    # Cache for 2 hours
+    cache_data(data=out, cache_key=cache_key, timeout=60 * 60 * 2)
+
+    return out
+
+def parse_standings_soup(soup, league, skip_conference_row=False):
+    """
+    Walks every table of a standings page and groups the teams by
+    conference and division.
 
+    :param soup: The standings tables
+    :type soup: bs4.BeautifulSoup or rows.Node
+
+    :param league: The league of the standings
+    :type league: str
+
+    :returns: The standings, as a dictionary keyed by conference or, for
+              leagues without conferences, a list
+    :rtype: dict or list
+    """
     column_list = []
     row_list = []
     stack = {}
+    decode_row = STANDINGS_SCHEMAS.get(league)
 
     # Iterate over each conference/league
     for table in soup("table"):
@@ -174,7 +205,7 @@ def standings_helper(url, league, skip_conference_row=False):
                     stack[conference] = row_list
                     row_list = []
 
-                conference = row.extract().text.strip().lower().encode("utf-8")
+                conference = row.text.strip().lower().encode("utf-8")
                 conference = slugify(text=unicode(conference, "utf-8"), delimiter=u'_')
 
             elif "shsTableSubttlRow" in row.get("class"):
@@ -192,34 +223,13 @@ def standings_helper(url, league, skip_conference_row=False):
 
                         column_list = []
 
-                division = row.extract().text.strip().lower().encode("utf-8")
+                division = row.text.strip().lower().encode("utf-8")
                 division = division.replace("division", '')
                 division = slugify(text=unicode(division, "utf-8"), delimiter=u'_')
 
             elif any(css_class.startswith("shsRow") for css_class in row.get("class")):
-                cells = row("td")
-                value_dict = None
-
-                if "mlb" == league:
-                    value_dict = help_parse_mlb_soup(cells)
-
-                elif "nhl" == league:
-                    value_dict = help_parse_nhl_soup(cells)
-
-                elif "nfl" == league:
-                    value_dict = help_parse_nfl_soup(cells)
-
-                elif "nba" == league:
-                    value_dict = help_parse_nba_soup(cells)
-
-                elif "mls" == league:
-                    value_dict = help_parse_mls_soup(cells)
-
-                elif "epl" == league:
-                    value_dict = help_parse_epl_soup(cells)
-
-                if value_dict is not None:
-                    column_list.append(value_dict)
+                if decode_row is not None:
+                    column_list.append(decode_row(row("td")))
 
         #end for row in table("tr")
 
@@ -259,93 +269,65 @@ def standings_helper(url, league, skip_conference_row=False):
         row_list = []
 
     #end for table in soup("table")
-    out = prepare_json_output(stack)
-    del row_list, stack
-
-    # Cache for 2 hours
-    cache_data(data=out, timeout=60 * 60 * 2)
-
-    return out
-
-def help_parse_mlb_soup(cells):
-    """
-    Helps parse data for MLB.
-
-    :param cells: A collection of table cells from a single row.
-    :type cells: dict
-
-    :returns: A formatted dictionary
-    :rtype: dict
-    """
-
-    value_dict = {}
-    # Convert all NavigableStrings to Python str
-    # http://bugs.python.org/issue1757057
-    value_dict["team"] = str(cells[0].find('a').extract().text.strip().encode("utf-8"))   # team
-    value_dict["wins"] = int(cells[1].extract().text.encode("utf-8"))   # Wins
-    value_dict["losses"] = int(cells[2].extract().text.encode("utf-8"))   # Losses
-    value_dict["percentage"] = float(cells[3].extract().text.encode("utf-8"))   # Win Percentage
-
-    try:
-        value_dict["games_behind"] = float(cells[4].extract().text.encode("utf-8"))   # Games behind
-    except Exception:
-        value_dict["games_behind"] = 0
-
-    return value_dict
-
-def help_parse_nhl_soup(cells):
-    value_dict = {}
-    #GP W   L   OTL Pts GF  GA  Home    Road    L10
-
-    # Convert all NavigableStrings to Python str
-    # http://bugs.python.org/issue1757057
-    value_dict["team"] = str(cells[0].find('a').extract().text.strip().encode("utf-8"))   # team
-
-    value_dict["games_played"] = int(cells[1].extract().text.encode("utf-8"))
-    value_dict["wins"] = int(cells[2].extract().text.encode("utf-8"))
-    value_dict["losses"] = int(cells[3].extract().text.encode("utf-8"))
-    value_dict["overtime_losses"] = int(cells[4].extract().text.encode("utf-8"))
-    value_dict["points"] = int(cells[5].extract().text.encode("utf-8"))
-    value_dict["goals_for"] = int(cells[6].extract().text.encode("utf-8"))
-    value_dict["goals_against"] = int(cells[7].extract().text.encode("utf-8"))
-
-    return value_dict
-
-def help_parse_nfl_soup(cells):
-    value_dict = {}
-    # Convert all NavigableStrings to Python str
-    # http://bugs.python.org/issue1757057
-    value_dict["team"] = str(cells[0].find('a').extract().text.strip().encode("utf-8"))
-    value_dict["wins"] = int(cells[1].extract().text.encode("utf-8"))
-    value_dict["losses"] = int(cells[2].extract().text.encode("utf-8"))
-    value_dict["ties"] = int(cells[3].extract().text.encode("utf-8"))
-    value_dict["percentage"] = float(cells[4].extract().text.encode("utf-8"))
-
-    try:
-        value_dict["games_behind"] = float(cells[5].extract().text.encode("utf-8"))
-    except Exception:
-        value_dict["games_behind"] = 0
-
-    return value_dict
-
-def help_parse_mls_soup(cells):
-    value_dict = {}
-    # Convert all NavigableStrings to Python str
-    # http://bugs.python.org/issue1757057
-
-    value_dict["team"] = str(cells[0].find('a').extract().text.strip().encode("utf-8"))
-    value_dict["games_played"] = int(cells[1].extract().text.encode("utf-8"))
-    value_dict["wins"] = int(cells[2].extract().text.encode("utf-8"))
-    value_dict["draws"] = int(cells[3].extract().text.encode("utf-8"))
-    value_dict["losses"] = int(cells[4].extract().text.encode("utf-8"))
-    value_dict["goals_for"] = int(cells[5].extract().text.encode("utf-8"))
-    value_dict["goals_against"] = int(cells[6].extract().text.encode("utf-8"))
-    value_dict["points"] = int(cells[10].extract().text.encode("utf-8"))
-
-    return value_dict
+    del row_list
+
+    return stack
+
+#-- Table layouts
+# Team | W | L | Pct | GB | ...
+help_parse_mlb_soup = compile_schema([
+    ("team", 0, link_text),
+    ("wins", 1, cell_int),
+    ("losses", 2, cell_int),
+    ("percentage", 3, cell_float),
+    ("games_behind", 4, cell_float_or_zero)
+])
+
+# Team | GP | W | L | OTL | Pts | GF | GA | Home | Road | L10
+help_parse_nhl_soup = compile_schema([
+    ("team", 0, link_text),
+    ("games_played", 1, cell_int),
+    ("wins", 2, cell_int),
+    ("losses", 3, cell_int),
+    ("overtime_losses", 4, cell_int),
+    ("points", 5, cell_int),
+    ("goals_for", 6, cell_int),
+    ("goals_against", 7, cell_int)
+])
+
+# Team | W | L | T | Pct | GB | ...
+help_parse_nfl_soup = compile_schema([
+    ("team", 0, link_text),
+    ("wins", 1, cell_int),
+    ("losses", 2, cell_int),
+    ("ties", 3, cell_int),
+    ("percentage", 4, cell_float),
+    ("games_behind", 5, cell_float_or_zero)
+])
+
+# Team | GP | W | D | L | GF | GA | ... | Pts
+help_parse_mls_soup = compile_schema([
+    ("team", 0, link_text),
+    ("games_played", 1, cell_int),
+    ("wins", 2, cell_int),
+    ("draws", 3, cell_int),
+    ("losses", 4, cell_int),
+    ("goals_for", 5, cell_int),
+    ("goals_against", 6, cell_int),
+    ("points", 10, cell_int)
+])
 
 #-- Function Aliases
 # Assign the aliases where functions are identical. Added here for
 # completeness
 help_parse_nba_soup = help_parse_mlb_soup
 help_parse_epl_soup = help_parse_mls_soup
+
+STANDINGS_SCHEMAS = {
+    "mlb" : help_parse_mlb_soup,
+    "nhl" : help_parse_nhl_soup,
+    "nfl" : help_parse_nfl_soup,
+    "nba" : help_parse_nba_soup,
+    "mls" : help_parse_mls_soup,
+    "epl" : help_parse_epl_soup
+}
@@ -12,9 +12,11 @@
     :copyright: (c) 2013 by NESN.
     :license: BSD, see LICENSE for more details.
 """
-from flask import Blueprint, jsonify
-from app.utils import prepare_json_output, cache_data, fetch_cached_data, logcat
-from app.helpers import help_fetch_soup, help_parse_soup, format_height
+from flask import Blueprint
+from app.utils import prepare_json_output, cache_data, fetch_cached_data, build_cache_key, logcat, json_response
+from app.helpers import help_fetch_rows, cell_height, cell_experience, cell_bats_throws
+from app.cells import cell_text, cell_int, cell_raw_text
+from app.schema import compile_schema
 
 mod = Blueprint("stats", __name__, url_prefix="/stats")
 
@@ -33,29 +35,32 @@ STATS_URL = "http://stats.nesn.com/" + SPORT_TOKEN + "/teamstats.asp"
 
 @mod.route("/mlb/<team>", methods=["GET"])
 def mlb(team):
-    return jsonify(stats_helper(sport="mlb", team=2, parser_func=parse_mlb_soup))
+    return json_response(stats_helper(sport="mlb", team=2, parser_func=parse_mlb_soup))
 
 @mod.route("/nhl/<team>", methods=["GET"])
 def nhl(team):
-    return jsonify(stats_helper(sport="nhl", team=1, parser_func=parse_nhl_soup))
+    return json_response(stats_helper(sport="nhl", team=1, parser_func=parse_nhl_soup))
 
 @mod.route("/nfl/<team>", methods=["GET"])
 def nfl(team):
-    return jsonify(stats_helper(sport="fb", team=2, parser_func=parse_nfl_soup))
+    return json_response(stats_helper(sport="fb", team=2, parser_func=parse_nfl_soup))
 
 @mod.route("/nba/<team>", methods=["GET"])
 def nba(team):
-    return jsonify(stats_helper(sport="nba", team=2, parser_func=parse_nba_soup))
+    return json_response(stats_helper(sport="nba", team=2, parser_func=parse_nba_soup))
 
 def stats_helper(sport, team, parser_func):
 
-    rv = fetch_cached_data()
+    # The team in the URL is ignored for now, so it isn't part of the key
+    cache_key = build_cache_key(sport=sport, team_id=team)
+    rv = fetch_cached_data(cache_key)
 
     if rv is not None:
         return rv
 
-    soup = help_fetch_soup(
+    rows = help_fetch_rows(
         url=STATS_URL.replace(SPORT_TOKEN, sport),
+        parser_func=parser_func,
         request_params={
             PARAM_TEAM : team, # debugging for now
             PARAM_RESOURCE_TYPE: ARG_RESOURCE_TYPE
@@ -63,71 +68,59 @@ def stats_helper(sport, team, parser_func):
         class_attrs="sortable shsTable shsBorderTable"
     )
 
-    out = prepare_json_output(help_parse_soup(soup, parser_func))
+    out = prepare_json_output(rows)
 
-    del soup
+    del rows
 
     # Cache for 24 hours
-    cache_data(data=out, timeout=60 * 60 * 24)
+    cache_data(data=out, cache_key=cache_key, timeout=60 * 60 * 24)
 
     return out
 
-def parse_mlb_soup(cells):
-    vals = {}
-    vals["number"] = int(cells[0].extract().text.strip().encode("utf-8"))
-    vals["name"] = cells[1].extract().text.encode("utf-8")
-    vals["position"] = cells[2].extract().text.encode("utf-8")
-
-    # Split the string "R/R" and assign each value to a different
-    # dict key. This is called unpacking. So slick
-    vals["bats"], vals["throws"] = cells[3].extract().text.strip().encode("utf-8").split('/')
-
-    vals["status"] = cells[4].extract().text.encode("utf-8")
-    vals["height"] = format_height(cells[5].extract().text.encode("utf-8"))
-
-    vals["weight"] = int(cells[6].extract().text.encode("utf-8"))
-    vals["born"] = cells[7].extract().text.encode("utf-8")
-    vals["birthplace"] = cells[8].extract().text.encode("utf-8")
-
-    return vals
-
-def parse_nhl_soup(cells):
-    vals = {}
-    vals["number"] = int(cells[0].extract().text.strip().encode("utf-8"))
-    vals["name"] = cells[1].extract().text.encode("utf-8")
-    vals["position"] = cells[2].extract().text.encode("utf-8")
-    vals["height"] = format_height(cells[3].extract().text.encode("utf-8"))
-    vals["weight"] = int(cells[4].extract().text.encode("utf-8"))
-    vals["born"] = cells[5].extract().text.encode("utf-8")
-    vals["birthplace"] = cells[6].extract().text.encode("utf-8")
-
-    return vals
-
-def parse_nfl_soup(cells):
-    # Num   Name    Pos Exp Ht  Wt  Born    Birthplace  College
-    vals = {}
-    vals["number"] = int(cells[0].extract().text.strip().encode("utf-8"))
-    vals["name"] = cells[1].extract().text.encode("utf-8")
-    vals["position"] = cells[2].extract().text.encode("utf-8")
-    vals["experience"] = cells[3].extract().text.encode("utf-8")
-
-    vals["experience"] = 0 if 'R' == vals["experience"] else int(vals["experience"])
-
-    vals["height"] = format_height(cells[4].extract().text.encode("utf-8"))
-    vals["weight"] = int(cells[5].extract().text.encode("utf-8"))
-    vals["born"] = cells[6].extract().text.encode("utf-8")
-    vals["birthplace"] = cells[7].extract().text.encode("utf-8")
-    vals["college"] = cells[8].extract().text.encode("utf-8")
-
-    return vals
-def parse_nba_soup(cells):
-    # Player | G | Min | FGM | FGA | FTM | FTA | 3PM | 3PA | TR | A | Stl | Blk | TO | +/-
-    vals = {}
-    vals["player"] = cells[0].extract().text.strip().encode("utf-8")
-    vals["games"] = int(cells[1].extract().text.strip().encode("utf-8"))
-    vals["minutes"] = int(cells[2].extract().text.strip().encode("utf-8"))
-    vals["steals"] = int(cells[11].extract().text.strip().encode("utf-8"))
-    vals["blocks"] = int(cells[12].extract().text.strip().encode("utf-8"))
-    vals["plus_minus"] = int(cells[14].extract().text.strip().encode("utf-8"))
-
-    return vals
+#-- Table layouts
+# No. | Name | Pos | B/T | Status | Ht | Wt | Born | Birthplace
+parse_mlb_soup = compile_schema([
+    ("number", 0, cell_int),
+    ("name", 1, cell_raw_text),
+    ("position", 2, cell_raw_text),
+    (("bats", "throws"), 3, cell_bats_throws),
+    ("status", 4, cell_raw_text),
+    ("height", 5, cell_height),
+    ("weight", 6, cell_int),
+    ("born", 7, cell_raw_text),
+    ("birthplace", 8, cell_raw_text)
+])
+
+# No. | Name | Pos | Ht | Wt | Born | Birthplace
+parse_nhl_soup = compile_schema([
+    ("number", 0, cell_int),
+    ("name", 1, cell_raw_text),
+    ("position", 2, cell_raw_text),
+    ("height", 3, cell_height),
+    ("weight", 4, cell_int),
+    ("born", 5, cell_raw_text),
+    ("birthplace", 6, cell_raw_text)
+])
+
+# Num | Name | Pos | Exp | Ht | Wt | Born | Birthplace | College
+parse_nfl_soup = compile_schema([
+    ("number", 0, cell_int),
+    ("name", 1, cell_raw_text),
+    ("position", 2, cell_raw_text),
+    ("experience", 3, cell_experience),
+    ("height", 4, cell_height),
+    ("weight", 5, cell_int),
+    ("born", 6, cell_raw_text),
+    ("birthplace", 7, cell_raw_text),
+    ("college", 8, cell_raw_text)
+])
+
+# Player | G | Min | FGM | FGA | FTM | FTA | 3PM | 3PA | TR | A | Stl | Blk | TO | +/-
+parse_nba_soup = compile_schema([
+    ("player", 0, cell_text),
+    ("games", 1, cell_int),
+    ("minutes", 2, cell_int),
+    ("steals", 11, cell_int),
+    ("blocks", 12, cell_int),
+    ("plus_minus", 14, cell_int)
+])
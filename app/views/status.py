@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Status
+    ~~~~~~
+
+    Reports on the health of the application's plumbing rather than on
+    sports data. Nothing here is cached; each request reads the current
+    counters.
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+from flask import Blueprint, jsonify
+from app.upstream import pool_stats, revalidation_stats, stream_stats
+from app.prewarm import prewarm_status
+from app.offload import offload_stats
+from app.throttle import lane_stats
+from app import redis
+from app.cachestore import cache_stats
+from app.helpers import parse_stats
+from app.utils import prepare_json_output, flight_stats, stale_stats
+
+mod = Blueprint("status", __name__, url_prefix="/status")
+
+@mod.route("/upstream/", methods=["GET"])
+def upstream():
+    """
+    Returns connection pool statistics for each upstream host.
+
+    :returns: A JSON response
+    :rtype: flask.Response
+    """
+    return jsonify(prepare_json_output(pool_stats()))
+
+@mod.route("/revalidation/", methods=["GET"])
+def revalidation():
+    """
+    Returns how many upstream fetches were answered with 304 Not
+    Modified versus how many downloaded the full page.
+
+    :returns: A JSON response
+    :rtype: flask.Response
+    """
+    return jsonify(prepare_json_output(revalidation_stats()))
+
+@mod.route("/streaming/", methods=["GET"])
+def streaming():
+    """
+    Returns how many upstream pages were streamed, how many were cut
+    short and how many bytes that saved.
+
+    :returns: A JSON response
+    :rtype: flask.Response
+    """
+    return jsonify(prepare_json_output(stream_stats()))
+
+@mod.route("/cache/", methods=["GET"])
+def cache():
+    """
+    Returns the hit rate of the cache, for this worker and every worker
+    together, how many cache misses were coalesced into a single scrape,
+    how often stale data was served and how often parsing an unchanged
+    page was avoided.
+
+    :returns: A JSON response
+    :rtype: flask.Response
+    """
+    out = {
+        "store" : cache_stats(redis),
+        "single_flight" : flight_stats(),
+        "stale" : stale_stats(),
+        "parse" : parse_stats()
+    }
+
+    return jsonify(prepare_json_output(out))
+
+@mod.route("/prewarm/", methods=["GET"])
+def prewarm():
+    """
+    Returns the last refresh time and duration of each pre-warmed route.
+
+    :returns: A JSON response
+    :rtype: flask.Response
+    """
+    return jsonify(prepare_json_output(prewarm_status()))
+
+@mod.route("/parsing/", methods=["GET"])
+def parsing():
+    """
+    Returns how long fetching, slicing and parsing take on average, and
+    how much parsing was offloaded to worker processes.
+
+    :returns: A JSON response
+    :rtype: flask.Response
+    """
+    return jsonify(prepare_json_output(offload_stats()))
+
+@mod.route("/throttle/", methods=["GET"])
+def throttle():
+    """
+    Returns the queue depth and wait times of each upstream lane.
+
+    :returns: A JSON response
+    :rtype: flask.Response
+    """
+    return jsonify(prepare_json_output(lane_stats()))
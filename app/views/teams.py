@@ -29,7 +29,8 @@
     :copyright: (c) 2013 by NESN.
     :license: BSD, see LICENSE for more details.
 """
-from flask import Blueprint, jsonify
+from flask import Blueprint
+from app.utils import json_response
 from app.helpers import teams_helper
 
 mod = Blueprint("teams", __name__, url_prefix="/teams")
@@ -40,7 +41,7 @@ def mlb():
     Generic helper function to scrape scoring data from STATS's
     JavaScript file.
     """
-    return jsonify(teams_helper(sport="mlb"))
+    return json_response(teams_helper(sport="mlb"))
 
 @mod.route("/nhl/", methods=["GET"])
 def nhl():
@@ -48,7 +49,7 @@ def nhl():
     Generic helper function to scrape scoring data from STATS's
     JavaScript file.
     """
-    return jsonify(teams_helper(sport="nhl"))
+    return json_response(teams_helper(sport="nhl"))
 
 @mod.route("/nfl/", methods=["GET"])
 def nfl():
@@ -57,7 +58,7 @@ def nfl():
     JavaScript file.
     """
 
-    return jsonify(teams_helper(sport="fb"))
+    return json_response(teams_helper(sport="fb"))
 
 @mod.route("/nba/", methods=["GET"])
 def nba():
@@ -65,7 +66,7 @@ def nba():
     Generic helper function to scrape scoring data from STATS's
     JavaScript file.
     """
-    return jsonify(teams_helper(sport="nba"))
+    return json_response(teams_helper(sport="nba"))
 
 @mod.route("/epl/", methods=["GET"])
 def epl():
@@ -73,4 +74,4 @@ def epl():
     Generic helper function to scrape scoring data from STATS's
     JavaScript file.
     """
-    return jsonify(teams_helper(sport="epl"))
+    return json_response(teams_helper(sport="epl"))
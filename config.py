@@ -23,6 +23,157 @@ DEBUG = True
 SECRET_KEY = "development_key"
 CACHE_TIMEOUT = 60 * 60 * 15         # Default is 15 minutes
 
+# Seconds past its expiry that stale data may still be served
+CACHE_STALE_TIMEOUT = 60 * 60        # 1 hour
+
+# Serve stale data immediately and refresh it in the background. When off,
+# stale data is only served if a fresh scrape fails.
+CACHE_STALE_WHILE_REVALIDATE = True
+
+# Seconds a request waits for another request's scrape of the same data
+SINGLE_FLIGHT_TIMEOUT = 30
+
+# "simple" keeps a cache in each worker process, while "redis" shares one
+# cache between every worker through the Redis server below. "tiered"
+# keeps the most recently used entries of the shared cache in each
+# worker as well, which takes a thread in each worker listening on Redis
+# pub/sub. See app/cachestore.py.
+CACHE_BACKEND = "tiered"
+CACHE_KEY_PREFIX = "cache:"
+CACHE_L1_SIZE = 256                  # Entries kept in each worker
+CACHE_L1_TIMEOUT = 10                # Most seconds an entry is kept in a worker
+CACHE_COMPRESS_MIN_BYTES = 1024      # Smaller entries aren't compressed
+CACHE_COMPRESS_LEVEL = 1             # zlib level, from 1 (fastest) to 9 (smallest)
+
+# Cached responses are stored as JSON and gzipped JSON too, which are sent
+# as they are on a hit. See json_response().
+CACHE_GZIP_LEVEL = 6
+
+# Seconds between adding this worker's hit and miss counts to every
+# other worker's in Redis
+CACHE_STATS_FLUSH_INTERVAL = 5
+
+#-- HTML parsing
+# The parser BeautifulSoup uses: "lxml", "html5lib" or "html.parser". lxml
+# is by far the fastest. If it isn't installed, html.parser is used.
+PARSER_BACKEND = "lxml"
+
+# Overrides PARSER_BACKEND for particular pages, keyed by path at STATS,
+# e.g. {"/tennis/rankings.asp" : "html.parser"}
+PARSER_BACKENDS = {}
+
+# Read table rows straight out of the page with rows.iter_rows() instead
+# of building a soup. Pages which need a real soup, like the scoreboard,
+# always get one. None streams rows only when the page's parser backend
+# isn't installed: rows.py is about as fast as lxml, but far quicker
+# than html.parser, which is used in its place.
+STREAM_ROWS = None
+
+# Cut the tables each parser reads out of the raw bytes of a page before
+# parsing it, rather than parsing the whole page. See app/slicer.py.
+SLICE_PAGES = True
+
+# Pages at STATS which are only read until their tables have arrived,
+# keyed by file name. The value is markup which always follows the last
+# table, the timestamp at the bottom of the page. Once it arrives, the
+# connection is closed and the rest of the page is never downloaded.
+STREAM_FETCH_PAGES = {
+    "standings.asp" : 'id="shsTimestamp"',
+    "teamstats.asp" : 'id="shsTimestamp"'
+}
+
+# The most parsed pages to remember. A page which comes back byte for
+# byte the same isn't parsed again. See help_parse_page().
+PARSE_MEMO_SIZE = 256
+
+# Parse large pages in a pool of worker processes, so parsing them
+# doesn't hold up every other request. See app/offload.py.
+PARSE_OFFLOAD = False
+PARSE_OFFLOAD_PROCESSES = 2
+PARSE_OFFLOAD_MIN_BYTES = 64 * 1024  # Smaller pages are parsed in place
+PARSE_OFFLOAD_TIMEOUT = 10           # Seconds, before giving up on the page
+
+#-- Upstream HTTP settings
+UPSTREAM_POOL_CONNECTIONS = 4        # Number of hosts to keep pools for
+UPSTREAM_POOL_MAXSIZE = 10           # Keep-alive connections per host
+UPSTREAM_POOL_BLOCK = True           # Wait for a free connection instead of opening more
+UPSTREAM_CONNECT_TIMEOUT = 3.05      # Seconds
+UPSTREAM_READ_TIMEOUT = 15           # Seconds
+
+# The encoding of every page from a host, so requests doesn't have to
+# guess. Pages from hosts not listed here are decoded by requests.
+UPSTREAM_ENCODINGS = {
+    "stats.nesn.com" : "utf-8"
+}
+
+# The most pages to remember for revalidation. See fetch_page().
+UPSTREAM_PAGES_SIZE = 256
+
+# Overrides UPSTREAM_POOL_MAXSIZE for particular hosts
+UPSTREAM_HOST_POOL_MAXSIZE = {
+    "stats.nesn.com" : 8
+}
+
+#-- Upstream rate limits
+# Each is a tuple of requests per second and the largest burst allowed
+UPSTREAM_RATE_LIMIT_ENABLED = True
+UPSTREAM_RATE_LIMIT = (20, 40)       # All hosts combined
+UPSTREAM_HOST_RATE_LIMIT = (10, 20)  # Any single host
+
+# Overrides UPSTREAM_HOST_RATE_LIMIT for particular hosts
+UPSTREAM_HOST_RATE_LIMITS = {
+    "stats.nesn.com" : (8, 16)
+}
+
+#-- Concurrency
+# The most pages a single request may fetch from STATS at the same time
+SCHEDULE_MAX_WORKERS = 4
+RANKINGS_MAX_WORKERS = 4
+
+# Seconds to wait for every golf tour or tennis series. Whatever hasn't
+# arrived by then is left out and listed in meta. None waits forever.
+RANKINGS_DEADLINE = 20
+
+# Facebook and Twitter lookups for /posts/
+SOCIAL_MAX_WORKERS = 8
+SOCIAL_DEADLINE = 5
+
+#-- Cache pre-warming
+# Routes which are refreshed in the background before their cache goes
+# stale. Query strings are allowed, e.g. "/teams/mlb/?flat_list=1".
+PREWARM_ENABLED = False
+PREWARM_ROUTES = [
+    "/standings/mlb/",
+    "/standings/nhl/",
+    "/standings/nfl/",
+    "/standings/nba/",
+    "/scores/mlb/",
+    "/scores/nhl/",
+    "/scores/nfl/",
+    "/scores/nba/",
+    "/teams/mlb/",
+    "/teams/nhl/",
+    "/teams/nfl/",
+    "/teams/nba/"
+]
+
+# The scheme and host pre-warmed requests are made to
+PREWARM_BASE_URL = "http://localhost:5000/"
+PREWARM_MAX_WORKERS = 2
+PREWARM_LEAD = 30                    # Seconds before the cache goes stale, less for short TTLs
+PREWARM_JITTER = 15                  # Up to this many seconds earlier still
+PREWARM_MIN_INTERVAL = 10            # Never refresh a route more often than this
+PREWARM_RETRY = 60                   # Seconds to wait after a failed refresh
+
+#-- Page archive
+# Keeps a gzipped copy of every page fetched from STATS on disk. Prune it
+# with prune_archive.py.
+ARCHIVE_ENABLED = False
+ARCHIVE_PATH = os.path.join(_basedir, "archive")
+
+# Read pages from the archive instead of STATS, when they're available
+ARCHIVE_REPLAY = False
+
 #-- Redis settings
 # REDIS_CLASS = 'redis.Redis' if IS_24 else 'redis.StrictRedis'
 REDIS_HOST = "localhost"
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Prune Archive
+    ~~~~~~~~~~~~~
+
+    Trims the on-disk page archive by age, by size or both.
+
+    Like run.py, this must be run from inside the virtual environment.
+
+    $ (venv) python prune_archive.py --max-age 30 --max-size 500
+    Removed 1204 fetches and 311 files, freed 48.2 MB
+
+    --max-age is in days and --max-size is in megabytes. The archive
+    directory defaults to ARCHIVE_PATH in config.py.
+
+    :author: Jeff Kereakoglow
+    :date: 2013-09-09
+    :copyright: (c) 2013 by NESN.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import imp
+from argparse import ArgumentParser
+import config
+
+# Importing anything from the app package starts the whole application,
+# which needs a Redis server. The archive doesn't, so load it on its own.
+archive = imp.load_source("archive", os.path.join(config._basedir, "app", "archive.py"))
+
+parser = ArgumentParser(description="Prunes the on-disk page archive.")
+parser.add_argument("--max-age", type=float, help="Remove fetches older than this many days")
+parser.add_argument("--max-size", type=float, help="Shrink the archive to this many megabytes")
+parser.add_argument("--path", default=config.ARCHIVE_PATH, help="The archive directory")
+args = parser.parse_args()
+
+if args.max_age is None and args.max_size is None:
+    parser.error("Pass --max-age, --max-size or both.")
+
+fetches, files, freed = archive.Archive(args.path).prune(
+    max_age=None if args.max_age is None else args.max_age * 60 * 60 * 24,
+    max_size=None if args.max_size is None else args.max_size * 1024 * 1024
+)
+
+print "Removed %d fetches and %d files, freed %.1f MB" % (fetches, files, freed / 1024.0 / 1024.0)